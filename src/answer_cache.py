@@ -0,0 +1,136 @@
+# built-in libs
+from collections import OrderedDict
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+
+# project libs
+from env_handler import env_int, env_float
+
+
+def normalize_question(question: str) -> str:
+    """Case-, whitespace- and trailing-punctuation-insensitive cache key."""
+    text = re.sub(r"\s+", " ", question).strip().lower()
+    return text.rstrip(" ?!.")
+
+
+def kb_version(files_map: dict[str, str], snapshot: str | None = None) -> str:
+    """Version stamp of the knowledge base: hash of the {filename: hash} metadata and the index snapshot."""
+    payload = json.dumps([files_map, snapshot], sort_keys=True).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _cosine(a: list[float], b: list[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class AnswerCache:
+    """
+    In-memory LRU/TTL cache of answers, shared by all sessions of the process.
+    Exact hits use the normalised question; with similarity_threshold > 0 and an
+    embed function, near-duplicate questions are matched by cosine similarity.
+    All entries are dropped as soon as the KB version changes.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 24 * 3600, similarity_threshold: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.version = None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        # key -> (created_at, result, question vector or None)
+        self._entries: OrderedDict[str, tuple[float, object, list[float] | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sync_version(self, version: str) -> None:
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def _expire(self, now: float) -> None:
+        # entries are in LRU order, not creation order, so scan them all (max_entries is small)
+        for key in [k for k, (created, _, _) in self._entries.items() if now - created > self.ttl]:
+            del self._entries[key]
+
+    def get(self, question: str, version: str, embed=None, scope: str = "", count: bool = True):
+        """
+        Return the cached result for question, or None. embed(text) -> vector.
+        Answers are only shared within the same scope (e.g. the same search filter).
+        count=False leaves the hit/miss statistics alone (a repeated lookup of the same question).
+        """
+        text = normalize_question(question)
+        key = f"{scope}\n{text}"
+        now = time.time()
+        with self._lock:
+            self._sync_version(version)
+            self._expire(now)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += count
+                return self._entries[key][1]
+            use_similarity = self.similarity_threshold > 0 and embed is not None and self._entries
+
+        if use_similarity:
+            vector = embed(text)
+            with self._lock:
+                best_key, best_score = None, self.similarity_threshold
+                for other, (_, _, other_vec) in self._entries.items():
+                    if other_vec is None or not other.startswith(f"{scope}\n"):
+                        continue
+                    score = _cosine(vector, other_vec)
+                    if score >= best_score:
+                        best_key, best_score = other, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.hits += count
+                    self.semantic_hits += count
+                    return self._entries[best_key][1]
+
+        with self._lock:
+            self.misses += count
+        return None
+
+    def put(self, question: str, version: str, result, embed=None, scope: str = "") -> None:
+        text = normalize_question(question)
+        key = f"{scope}\n{text}"
+        vector = embed(text) if self.similarity_threshold > 0 and embed is not None else None
+        with self._lock:
+            self._sync_version(version)
+            self._entries[key] = (time.time(), result, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+_cache: AnswerCache | None = None
+_cache_lock = threading.Lock()
+
+def get_answer_cache() -> AnswerCache:
+    """Process-wide cache configured from ANSWER_CACHE_* settings."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache(
+                max_entries=env_int("ANSWER_CACHE_SIZE", 256),
+                ttl=env_float("ANSWER_CACHE_TTL", 24 * 3600),
+                similarity_threshold=env_float("ANSWER_CACHE_SIMILARITY", 0.0),
+            )
+        return _cache
@@ -0,0 +1,180 @@
+"""
+Headless bulk question answering for benchmark runs.
+
+    python src/batch_qa.py questions.jsonl answers.jsonl --concurrency 16
+
+Each input line is {"id": ..., "question": "..."} (id is optional). Each output
+line holds the answer, its sources, per-stage latencies, and the error if the
+question failed after all retries.
+"""
+
+# built-in libs
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+# extra libs
+import openai
+
+# project libs
+from generate_answer import AnswerEngine, build_llm
+from preprocess import restore_from_cache
+from router import build_router
+from state_machine import built_collections
+
+
+# errors worth retrying; everything else fails the question right away
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def _retry_after(exc: Exception) -> float | None:
+    """Seconds the API asked us to wait (Retry-After header), if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimitGate:
+    """Shared cool-down: once any request is rate limited, all workers pause."""
+
+    def __init__(self):
+        self.resume_at = 0.0
+
+    async def wait(self) -> None:
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+
+async def answer_with_retry(engine, question: str, gate: RateLimitGate, max_retries: int, base_delay: float):
+    """Answer one question, backing off with jitter on retryable API errors."""
+    for attempt in range(max_retries + 1):
+        await gate.wait()
+        try:
+            return await engine.aanswer(question), attempt
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = _retry_after(e) or base_delay * 2 ** attempt
+            delay *= 1 + random.random() * 0.25
+            if isinstance(e, openai.RateLimitError):
+                gate.pause(delay)
+            await asyncio.sleep(delay)
+
+
+def _source_entry(doc) -> dict:
+    return {"source": doc.metadata.get("source"), "page": doc.metadata.get("page")}
+
+
+async def run_batch(
+    engine,
+    questions: list[dict],
+    out_path: Path,
+    concurrency: int = 8,
+    max_retries: int = 5,
+    base_delay: float = 1.0,
+) -> list[dict]:
+    """Answer all questions with at most `concurrency` in flight; stream results to out_path."""
+    semaphore = asyncio.Semaphore(concurrency)
+    gate = RateLimitGate()
+    records = []
+
+    with out_path.open("w", encoding="utf-8") as out:
+
+        async def one(index: int, item: dict):
+            record = {"id": item.get("id", index), "question": item["question"]}
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result, retries = await answer_with_retry(
+                        engine, item["question"], gate, max_retries, base_delay
+                    )
+                    record.update(
+                        answer=result.answer,
+                        sources=[_source_entry(d) for d in result.docs],
+                        timings=result.timings,
+                        context_tokens=result.context_tokens,
+                        retries=retries,
+                    )
+                except Exception as e:
+                    record["error"] = f"{type(e).__name__}: {e}"
+                record["latency"] = time.perf_counter() - start
+            # written as soon as it is done, so an interrupted run keeps its results
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            records.append(record)
+
+        await asyncio.gather(*(one(i, item) for i, item in enumerate(questions)))
+
+    return records
+
+
+def load_questions(path: Path) -> list[dict]:
+    questions = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            questions.append(item if isinstance(item, dict) else {"question": item})
+    return questions
+
+
+def _summary(records: list[dict], wall: float) -> str:
+    ok = [r for r in records if "error" not in r]
+    lines = [f"{len(ok)}/{len(records)} answered in {wall:.1f}s"]
+    if len(ok) >= 2:
+        latencies = sorted(r["latency"] for r in ok)
+        q = statistics.quantiles(latencies, n=100)
+        lines.append(f"latency p50 {q[49]:.2f}s  p95 {q[94]:.2f}s  max {latencies[-1]:.2f}s")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions against the knowledge base.")
+    parser.add_argument("questions", type=Path, help="input JSONL, one {\"question\": ...} per line")
+    parser.add_argument("output", type=Path, help="output JSONL with answers, sources and latencies")
+    parser.add_argument("--concurrency", type=int, default=8, help="questions in flight at once")
+    parser.add_argument("--max-retries", type=int, default=5, help="retries per question on rate limits/API errors")
+    parser.add_argument("--base-delay", type=float, default=1.0, help="first back-off delay in seconds")
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.questions)
+    collections = built_collections()
+    if not collections:
+        raise SystemExit("[ERROR] No knowledge base has been built yet.")
+    retrievers = {c.name: restore_from_cache(c.chroma_dir, c.metadata_path) for c in collections}
+    # answer_with_retry owns retries and back-off; client retries would multiply them and hide 429s from the gate
+    llm = build_llm(max_retries=0)
+    if len(collections) == 1:
+        engine = AnswerEngine(retrievers[collections[0].name], llm=llm, topic=collections[0].topic)
+    else:
+        # each question is routed to the relevant collections
+        engine = AnswerEngine(build_router(collections, retrievers), llm=llm, topic="; ".join(c.topic for c in collections))
+
+    start = time.perf_counter()
+    records = asyncio.run(
+        run_batch(engine, questions, args.output, args.concurrency, args.max_retries, args.base_delay)
+    )
+    print(_summary(records, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,732 @@
+"""
+Offline performance benchmark: synthetic PDF corpora + local stand-in models.
+
+    python src/benchmark.py --sizes 100 1000 10000 --out bench_results.json
+    python src/benchmark.py --sizes 100 --compare bench_results.json
+
+OpenAIEmbeddings is replaced by a deterministic hashing embedder and ChatOpenAI
+by a canned fake chat model, so nothing goes over the network. All state lives
+in a temporary folder; the real datasets/index are never touched.
+
+The embedding scheduler is measured against FakeEmbeddingServer, a local
+stand-in for the OpenAI embeddings endpoint that adds latency under load and
+answers 429s when its token budget runs out (or at random).
+
+Import cost is profiled with `python -X importtime` in fresh interpreters: what
+the app imports before its first paint, before the first answer and before an
+ingest can start.
+"""
+
+# built-in libs
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+# extra libs
+import numpy as np
+
+# langchain libs
+from langchain_core.embeddings import Embeddings
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_openai import OpenAIEmbeddings
+
+# project libs
+from chunker import SectionChunker
+from compact_index import CompactIndex
+from embedding_scheduler import ScheduledEmbeddings
+from env_handler import load_paths
+from router import compute_centroid
+from snapshots import begin_snapshot, discard_snapshot
+from state_machine import detect_kb_state
+import chroma_store
+import generate_answer
+import preprocess
+
+
+# --------- local stand-in models ---------
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings (feature hashing), no network."""
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        self.model = f"hashing-{size}"
+
+    def _embed(self, text: str) -> list[float]:
+        vec = [0.0] * self.size
+        for token in re.findall(r"\w+", text.lower()):
+            h = zlib.crc32(token.encode("utf-8"))
+            vec[h % self.size] += 1.0 if h & 0x80000000 else -1.0
+        norm = sum(x * x for x in vec) ** 0.5 or 1.0
+        return [x / norm for x in vec]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+FAKE_ANSWER = (
+    "**Short Answer:**\n- AGO2\n- FXR1\n\n"
+    "**Overview:** Synthetic answer used for benchmarking.\n\n"
+    "**References:**\n- *Vasudevan et al. 2007, Science, 318:1931–1934*\n"
+)
+
+def _fake_chat_model(**kwargs):
+    return FakeListChatModel(responses=[FAKE_ANSWER])
+
+
+def use_local_models() -> None:
+    """Swap the OpenAI clients of the app modules for the local fakes."""
+    # patch the client class, not _build_embeddings, so the local caching
+    # layers around it are measured as in production
+    preprocess.OpenAIEmbeddings = lambda **kwargs: HashingEmbeddings()
+    generate_answer.ChatOpenAI = _fake_chat_model
+    # stay offline: no cross-encoder download unless asked for explicitly
+    os.environ.setdefault("RERANK_MODEL", "lexical")
+
+
+class FakeEmbeddingServer:
+    """
+    Local HTTP stand-in for POST /v1/embeddings, returning a pseudo-random unit
+    vector per text (seeded by its CRC, so answers can be checked for order).
+    Each request takes latency_s + latency_per_1k_tokens per 1000 tokens, stretched
+    proportionally once more than `capacity` requests are in flight. Tokens come
+    from a per-minute budget (with OpenAI's x-ratelimit-* headers); a request it
+    cannot cover, and a random `error_rate` share of all requests, get a 429.
+
+        with FakeEmbeddingServer(error_rate=0.05) as server:
+            emb = OpenAIEmbeddings(base_url=server.url, api_key="fake", check_embedding_ctx_length=False)
+    """
+
+    def __init__(
+        self,
+        latency_s: float = 0.05,
+        latency_per_1k_tokens: float = 0.01,
+        capacity: int = 8,
+        tokens_per_minute: int = 20_000_000,
+        error_rate: float = 0.01,
+        seed: int = 0,
+    ):
+        self.latency_s = latency_s
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.capacity = capacity
+        self.tokens_per_minute = tokens_per_minute
+        self.error_rate = error_rate
+        self.requests = self.rate_limited = self.in_flight = self.peak_in_flight = 0
+        self._budget = float(tokens_per_minute)
+        self._refilled = time.monotonic()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @staticmethod
+    def vector(text: str, size: int = 256) -> list[float]:
+        v = np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(size)
+        return (v / np.linalg.norm(v)).tolist()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.requests = self.rate_limited = self.peak_in_flight = 0
+            self._budget = float(self.tokens_per_minute)
+
+    def _admit(self, tokens: int) -> tuple[bool, dict]:
+        """Take `tokens` from the budget, or say how long until they are available."""
+        with self._lock:
+            now = time.monotonic()
+            rate = self.tokens_per_minute / 60
+            self._budget = min(self.tokens_per_minute, self._budget + (now - self._refilled) * rate)
+            self._refilled = now
+            self.requests += 1
+            random_429 = self._rng.random() < self.error_rate
+            if random_429 or tokens > self._budget:
+                self.rate_limited += 1
+                wait_s = 0.05 if random_429 else (tokens - self._budget) / rate
+                return False, {"retry-after-ms": f"{wait_s * 1000:.0f}"}
+            self._budget -= tokens
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            headers = {
+                "x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+                "x-ratelimit-remaining-tokens": str(int(self._budget)),
+                "x-ratelimit-reset-tokens": f"{(self.tokens_per_minute - self._budget) / rate:.3f}s",
+            }
+            return True, headers
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: dict, headers: dict) -> None:
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+                tokens = sum(len(re.findall(r"\w+|[^\w\s]", t)) for t in texts)
+                admitted, headers = server._admit(tokens)
+                if not admitted:
+                    error = {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}
+                    self._reply(429, {"error": error}, headers)
+                    return
+                try:
+                    load = max(1.0, server.in_flight / server.capacity)
+                    time.sleep((server.latency_s + server.latency_per_1k_tokens * tokens / 1000) * load)
+                    vectors = [server.vector(t) for t in texts]
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+                as_base64 = request.get("encoding_format") == "base64"
+                data = [
+                    {
+                        "object": "embedding",
+                        "index": i,
+                        "embedding": base64.b64encode(np.asarray(v, dtype="<f4").tobytes()).decode("ascii") if as_base64 else v,
+                    }
+                    for i, v in enumerate(vectors)
+                ]
+                body = {
+                    "object": "list",
+                    "data": data,
+                    "model": request.get("model"),
+                    "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+                }
+                self._reply(200, body, headers)
+
+        return Handler
+
+
+# --------- synthetic corpus ---------
+
+_WORDS = (
+    "microRNA expression activation translation repression binding protein complex "
+    "mRNA untranslated region quiescent cells argonaute ribonucleoprotein cell cycle "
+    "transcript stability upregulation target site seed sequence luciferase reporter "
+    "assay knockdown overexpression western blot polysome fraction nucleus cytoplasm"
+).split()
+
+def _gene(rng: random.Random) -> str:
+    if rng.random() < 0.5:
+        return f"miR-{rng.randint(1, 999)}-{rng.choice(['3p', '5p'])}"
+    return rng.choice(["AGO", "FXR", "TNF", "HUR", "GW", "DICER", "LIN"]) + str(rng.randint(1, 40))
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) if rng.random() > 0.12 else _gene(rng) for _ in range(rng.randint(8, 20))]
+    return " ".join(words).capitalize() + "."
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def pdf_bytes(pages: list[str]) -> bytes:
+    """Minimal valid PDF with one Helvetica text stream per page."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for text in pages:
+        lines = []
+        for paragraph in text.split("\n"):
+            while paragraph:
+                lines.append(paragraph[:95])
+                paragraph = paragraph[95:]
+        body = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({_pdf_escape(l)}) '" for l in lines[:70]) + " ET"
+        stream = body.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_num = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_num
+        )
+        page_refs.append(len(objects))
+    kids = " ".join(f"{n} 0 R" for n in page_refs).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_refs))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (num, obj)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def make_corpus(folder: Path, n_docs: int, pages_per_doc: int = 2, seed: int = 0) -> list[str]:
+    """Write n_docs synthetic PDFs; return a few sentences usable as queries."""
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+    queries = []
+    for i in range(n_docs):
+        pages = []
+        for _ in range(pages_per_doc):
+            sentences = [_sentence(rng) for _ in range(30)]
+            if len(queries) < 200 and rng.random() < 0.3:
+                queries.append(rng.choice(sentences))
+            pages.append(" ".join(sentences))
+        (folder / f"paper_{i:05d}.pdf").write_bytes(pdf_bytes(pages))
+    return queries or ["microRNA activation in quiescent cells"]
+
+
+# --------- measurement ---------
+
+def summarize(name: str, n_docs: int, samples: list[float], items: int | None = None) -> dict:
+    """Latency percentiles (seconds) and throughput (items/s) of one scenario."""
+    ordered = sorted(samples)
+    if len(ordered) >= 2:
+        q = statistics.quantiles(ordered, n=100, method="inclusive")
+        p50, p95, p99 = q[49], q[94], q[98]
+    else:
+        p50 = p95 = p99 = ordered[0]
+    total = sum(ordered)
+    count = items if items is not None else len(ordered)
+    return {
+        "scenario": name,
+        "n_docs": n_docs,
+        "runs": len(ordered),
+        "mean": total / len(ordered),
+        "p50": p50,
+        "p95": p95,
+        "p99": p99,
+        "throughput": count / total if total else None,
+    }
+
+def timed(fn, repeat: int = 1) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+# modules a fresh process imports before each milestone
+IMPORT_STAGES = {
+    "import_first_paint": ["main"],
+    "import_first_query": ["main", "preprocess", "generate_answer", "router"],
+    "import_ingest": ["main", "preprocess", "pikepdf", "pypdf", "langchain_text_splitters", "langchain_community.document_loaders"],
+}
+
+
+def _parse_importtime(stderr: str, targets: list[str]) -> tuple[float, dict[str, float]]:
+    """Seconds spent importing `targets` and their self time per top-level package."""
+    total, by_package, subtree = 0.0, defaultdict(float), []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # children are listed before their parent, indented two spaces per level
+        top_level = len(name) - len(name.lstrip()) <= 1
+        name = name.strip()
+        subtree.append((name, int(self_us)))
+        if top_level:
+            if name in targets:
+                total += int(cumulative_us) / 1e6
+                for module, us in subtree:
+                    by_package[module.split(".")[0]] += us / 1e6
+            subtree = []
+    return total, dict(by_package)
+
+
+def profile_imports(repeat: int) -> tuple[list[dict], dict[str, dict[str, float]]]:
+    """Import time of each IMPORT_STAGES entry over `repeat` fresh interpreters, and its costliest packages."""
+    results, packages = [], {}
+    for stage, modules in IMPORT_STAGES.items():
+        samples, per_package = [], defaultdict(list)
+        for _ in range(repeat):
+            proc = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+                capture_output=True, text=True, cwd=Path(__file__).parent,
+            )
+            if proc.returncode != 0:
+                raise RuntimeError(f"importing {modules} failed:\n{proc.stderr[-2000:]}")
+            total, by_package = _parse_importtime(proc.stderr, [m.split(".")[0] for m in modules])
+            samples.append(total)
+            for name, seconds in by_package.items():
+                per_package[name].append(seconds)
+        results.append(summarize(stage, 0, samples))
+        packages[stage] = {name: statistics.median(v) for name, v in per_package.items()}
+    return results, packages
+
+
+def run_size(n_docs: int, workdir: Path, repeat: int, n_queries: int) -> list[dict]:
+    root = workdir / f"docs_{n_docs}"
+    os.environ.update(
+        DATASETS_DIR=str(root / "datasets"),
+        CHROMA_DB_DIR=str(root / "chroma"),
+        KB_METADATA_PATH=str(root / "kb_metadata.json"),
+        KB_CACHE_DIR=str(root / "cache"),
+    )
+    print(f"[bench] generating {n_docs} PDFs ...")
+    queries = make_corpus(root / "datasets", n_docs)
+    datasets_dir, chroma_dir, metadata_path = load_paths()
+    results = []
+
+    # state detection: first call hashes everything, later calls hit the fingerprint cache
+    results.append(summarize("detect_kb_state_cold", n_docs, timed(lambda: detect_kb_state(datasets_dir, metadata_path))))
+    results.append(summarize("detect_kb_state", n_docs, timed(lambda: detect_kb_state(datasets_dir, metadata_path), repeat)))
+
+    print(f"[bench] init_ingest over {n_docs} PDFs ...")
+    results.append(summarize("init_ingest", n_docs, timed(preprocess.init_ingest), items=n_docs))
+
+    # touch 1% of the corpus (at least one file) and add as many new files
+    n_changed = max(1, n_docs // 100)
+    rng = random.Random(1)
+    for path in rng.sample(sorted(datasets_dir.glob("*.pdf")), n_changed):
+        path.write_bytes(pdf_bytes([_sentence(rng) * 5, _sentence(rng) * 5]))
+    make_corpus(datasets_dir / "_new", n_changed, seed=2)
+    for path in (datasets_dir / "_new").glob("*.pdf"):
+        path.rename(datasets_dir / f"new_{path.name}")
+    (datasets_dir / "_new").rmdir()
+    results.append(summarize("ingest_new_data", n_docs, timed(preprocess.ingest_new_data), items=2 * n_changed))
+    results.extend(evaluate_snapshot_cost(chroma_dir, metadata_path, n_docs, repeat))
+
+    # full rebuild into a fresh index (e.g. after a splitter change): pages and
+    # embeddings come from the caches filled above, no PDF is parsed again
+    os.environ.update(CHROMA_DB_DIR=str(root / "chroma_rebuild"), KB_METADATA_PATH=str(root / "kb_rebuild.json"))
+    results.append(summarize("rebuild_cached", n_docs, timed(preprocess.init_ingest), items=n_docs + n_changed))
+    os.environ.update(CHROMA_DB_DIR=str(root / "chroma"), KB_METADATA_PATH=str(root / "kb_metadata.json"))
+
+    results.append(summarize("restore_from_cache", n_docs, timed(preprocess.restore_from_cache, repeat)))
+
+    retriever = preprocess.restore_from_cache()
+    sample = [queries[i % len(queries)] for i in range(n_queries)]
+    retrieve_samples = [timed(lambda q=q: retriever.invoke(q))[0] for q in sample]
+    results.append(summarize("retrieval", n_docs, retrieve_samples))
+
+    engine = generate_answer.AnswerEngine(retriever)
+    answers = [engine.answer(q) for q in sample]
+    results.append(summarize("answer_overhead", n_docs, [a.timings["overhead"] for a in answers]))
+    results.append(summarize("answer_total", n_docs, [a.timings["total"] for a in answers]))
+
+    results.extend(evaluate_compact(root / "compact", retriever.vectorstore, n_docs, sample))
+    texts = retriever.vectorstore.get(include=["documents"])["documents"]
+    results.extend(evaluate_embedding_scheduler(texts, n_docs))
+    results.extend(evaluate_chunking(n_docs))
+    return results
+
+
+def evaluate_snapshot_cost(chroma_dir: Path, metadata_path: Path, n_docs: int, repeat: int) -> list[dict]:
+    """
+    What every incremental update pays however few files changed: starting its
+    snapshot as a copy of the live index, and the full centroid pass that
+    updates without a centroid delta (builds, resumed runs) need.
+    """
+    sizes = []
+
+    def start_update():
+        snapshot, _ = begin_snapshot(chroma_dir, metadata_path, "update")
+        files = [p.stat() for p in snapshot.rglob("*") if p.is_file()]
+        sizes.append((sum(st.st_size for st in files), sum(st.st_size for st in files if st.st_nlink > 1)))
+        discard_snapshot(snapshot)
+
+    row = summarize("snapshot_copy", n_docs, timed(start_update, max(1, repeat // 4)))
+    index_bytes, shared_bytes = sizes[-1]
+    # copied includes clones on filesystems that support them (no extra space until written)
+    row.update(index_bytes=index_bytes, shared_bytes=shared_bytes, copied_bytes=index_bytes - shared_bytes)
+
+    vectordb = preprocess.restore_from_cache().vectorstore
+    centroid = summarize("centroid_full", n_docs, timed(lambda: compute_centroid(vectordb), max(1, repeat // 4)))
+    return [row, centroid]
+
+
+def evaluate_compact(folder: Path, vectordb, n_docs: int, queries: list[str], k: int = 10) -> list[dict]:
+    """
+    Latency, recall@k against Chroma's own top-k and footprint of the compact
+    backend, for a few dims/quantization settings, on the same corpus. Its
+    resident and disk bytes include Chroma's, which stays open (and loaded) as
+    the store of record; the bytes scanned per query are its own.
+    """
+    full_dims = len(vectordb.embeddings.embed_query(queries[0]))
+    truth = [{d.id for d in vectordb.similarity_search(q, k=k)} for q in queries]
+    chroma = chroma_store.footprint(vectordb)
+    row = summarize("chroma_search", n_docs, [timed(lambda q=q: vectordb.similarity_search(q, k=k))[0] for q in queries])
+    row.update(resident_bytes=chroma["resident"], disk_bytes=chroma["disk"])
+    results = [row]
+
+    dims = min(int(os.getenv("COMPACT_DIMS", 256)), full_dims)
+    for d, quantization in ((dims, "int8"), (dims // 2, "int8"), (dims, "binary")):
+        index = CompactIndex(folder / f"{quantization}_{d}", vectordb, d, quantization)
+        index.sync()
+        samples, hits = [], 0
+        for q, expected in zip(queries, truth):
+            t0 = time.perf_counter()
+            found = index.similarity_search(q, k=k)
+            samples.append(time.perf_counter() - t0)
+            hits += len({doc.id for doc in found} & expected)
+        size = index.nbytes()
+        row = summarize(f"compact_{quantization}_d{d}", n_docs, samples)
+        row.update(
+            recall_at_k=hits / (k * len(queries)),
+            scanned_bytes=size["scanned"],
+            # every mapped page counted, as if all rescoring rows had been read
+            resident_bytes=chroma["resident"] + size["mapped"],
+            disk_bytes=chroma["disk"] + size["disk"],
+        )
+        results.append(row)
+    return results
+
+
+def _paper_pages(rng: random.Random, source: str, n_pages: int = 8) -> list[Document]:
+    """Page texts shaped like PyPDFLoader output: wrapped lines, headings, captions, a reference list."""
+    def paragraph(n: int) -> str:
+        text = " ".join(_sentence(rng) for _ in range(n))
+        return "\n".join(text[i:i + 95] for i in range(0, len(text), 95))
+
+    refs = "\n".join(
+        f"{_gene(rng)} A, et al. ({rng.randint(1990, 2024)}). {_sentence(rng)} Cell {rng.randint(1, 200)}:{rng.randint(1, 999)}."
+        for _ in range(40)
+    )
+    body = [
+        "Abstract\n" + paragraph(8), "1. Introduction\n" + paragraph(25), "2. Results\n" + paragraph(40),
+        "Figure 1. " + paragraph(3), paragraph(30), "3. Discussion\n" + paragraph(25),
+        "4. Materials and Methods\n" + paragraph(30), "References\n" + refs,
+    ]
+    text = "\n".join(body)
+    size = -(-len(text) // n_pages)
+    return [
+        Document(page_content=text[i * size:(i + 1) * size], metadata={"source": source, "page": i})
+        for i in range(n_pages)
+    ]
+
+
+def evaluate_chunking(n_docs: int) -> list[dict]:
+    """Pages/s and chunk counts of the section chunker versus the recursive splitter it replaced."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    rng = random.Random(3)
+    papers = [_paper_pages(rng, f"paper_{i:05d}.pdf") for i in range(n_docs)]
+    n_pages = sum(len(pages) for pages in papers)
+    splitters = {
+        "chunk_recursive": RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=200, add_start_index=True),
+        "chunk_section": SectionChunker(chunk_size=1200),
+    }
+    results = []
+    for name, splitter in splitters.items():
+        t0 = time.perf_counter()
+        chunks = [chunk for pages in papers for chunk in splitter.split_documents(pages)]
+        row = summarize(name, n_docs, [time.perf_counter() - t0], items=n_pages)
+        row.update(
+            pages=n_pages,
+            chunks=len(chunks),
+            chunk_chars=sum(len(c.page_content) for c in chunks),
+            # reference list entries look like "... A, et al. (2001). ..."
+            reference_chunks=sum(1 for c in chunks if "et al. (" in c.page_content),
+        )
+        results.append(row)
+    return results
+
+
+def evaluate_embedding_scheduler(texts: list[str], n_docs: int) -> list[dict]:
+    """
+    Embed the corpus chunks through FakeEmbeddingServer twice: with OpenAIEmbeddings'
+    own sequential batching and client retries, then with ScheduledEmbeddings.
+    """
+    results = []
+    with FakeEmbeddingServer() as server:
+        def client():
+            return OpenAIEmbeddings(
+                model="text-embedding-3-small", base_url=server.url, api_key="fake",
+                check_embedding_ctx_length=False, max_retries=10,
+            )
+
+        expected = [server.vector(t) for t in texts]
+        for name, emb in (("embed_sequential", client()), ("embed_scheduled", ScheduledEmbeddings(client()))):
+            server.reset_counts()
+            t0 = time.perf_counter()
+            vectors = emb.embed_documents(texts)
+            row = summarize(name, n_docs, [time.perf_counter() - t0], items=len(texts))
+            row.update(
+                requests=server.requests,
+                rate_limited=server.rate_limited,
+                peak_concurrency=server.peak_in_flight,
+                vectors_match=bool(np.allclose(vectors, expected, atol=1e-6)),
+            )
+            results.append(row)
+    return results
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: list[dict], baseline_path: Path, tolerance: float) -> list[str]:
+    """Return a line per scenario whose p50 regressed by more than `tolerance`."""
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))["results"]
+    old = {(r["scenario"], r["n_docs"]): r for r in baseline}
+    regressions = []
+    for r in current:
+        before = old.get((r["scenario"], r["n_docs"]))
+        if before and before["p50"] > 0 and r["p50"] > before["p50"] * (1 + tolerance):
+            regressions.append(
+                f"{r['scenario']} @ {r['n_docs']} docs: p50 {before['p50'] * 1000:.1f} -> {r['p50'] * 1000:.1f} ms"
+            )
+    return regressions
+
+
+def _print_table(results: list[dict]) -> None:
+    print(f"{'scenario':<22}{'docs':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'items/s':>11}")
+    for r in results:
+        tput = f"{r['throughput']:.1f}" if r["throughput"] else "-"
+        print(
+            f"{r['scenario']:<22}{r['n_docs']:>7}{r['p50'] * 1000:>11.2f}"
+            f"{r['p95'] * 1000:>11.2f}{r['p99'] * 1000:>11.2f}{tput:>11}"
+        )
+
+
+def _print_compact_table(results: list[dict]) -> None:
+    rows = [r for r in results if "resident_bytes" in r]
+    if not rows:
+        return
+    print(f"\n{'vector backend':<22}{'docs':>7}{'recall@10':>11}{'MB scanned':>12}{'MB resident':>13}{'MB disk':>9}")
+    for r in rows:
+        recall = f"{r['recall_at_k']:.3f}" if "recall_at_k" in r else "-"
+        scanned = f"{r['scanned_bytes'] / 2**20:.2f}" if "scanned_bytes" in r else "-"
+        print(
+            f"{r['scenario']:<22}{r['n_docs']:>7}{recall:>11}{scanned:>12}"
+            f"{r['resident_bytes'] / 2**20:>13.2f}{r['disk_bytes'] / 2**20:>9.2f}"
+        )
+
+
+def _print_snapshot_table(results: list[dict]) -> None:
+    rows = [r for r in results if "index_bytes" in r]
+    if not rows:
+        return
+    print(f"\n{'snapshot':<22}{'docs':>7}{'index MB':>10}{'copied MB':>11}{'shared MB':>11}")
+    for r in rows:
+        print(
+            f"{r['scenario']:<22}{r['n_docs']:>7}{r['index_bytes'] / 2**20:>10.2f}"
+            f"{r['copied_bytes'] / 2**20:>11.2f}{r['shared_bytes'] / 2**20:>11.2f}"
+        )
+
+
+def _print_import_table(packages: dict[str, dict[str, float]], top: int = 8) -> None:
+    for stage, by_package in packages.items():
+        costly = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+        print(f"\n{stage:<22}{'self ms':>11}")
+        for name, seconds in costly:
+            print(f"  {name:<20}{seconds * 1000:>11.1f}")
+
+
+def _print_chunking_table(results: list[dict]) -> None:
+    rows = [r for r in results if "reference_chunks" in r]
+    if not rows:
+        return
+    print(f"\n{'chunking':<22}{'docs':>7}{'pages/min':>11}{'chunks':>9}{'MB text':>9}{'ref chunks':>12}")
+    for r in rows:
+        print(
+            f"{r['scenario']:<22}{r['n_docs']:>7}{r['throughput'] * 60:>11.0f}{r['chunks']:>9}"
+            f"{r['chunk_chars'] / 2**20:>9.2f}{r['reference_chunks']:>12}"
+        )
+
+
+def _print_embedding_table(results: list[dict]) -> None:
+    rows = [r for r in results if "rate_limited" in r]
+    if not rows:
+        return
+    print(f"\n{'embedding':<22}{'docs':>7}{'chunks/s':>11}{'requests':>10}{'429s':>7}{'peak conc':>11}{'match':>7}")
+    for r in rows:
+        print(
+            f"{r['scenario']:<22}{r['n_docs']:>7}{r['throughput']:>11.1f}{r['requests']:>10}"
+            f"{r['rate_limited']:>7}{r['peak_concurrency']:>11}{'yes' if r['vectors_match'] else 'NO':>7}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline ingestion/query latency benchmark.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="corpus sizes (PDFs)")
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions of the cheap scenarios")
+    parser.add_argument("--queries", type=int, default=100, help="retrieval/answer queries per size")
+    parser.add_argument("--out", type=Path, default=Path("bench_results.json"), help="machine-readable results")
+    parser.add_argument("--compare", type=Path, help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown vs --compare")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary corpora")
+    parser.add_argument("--import-repeat", type=int, default=5, help="fresh interpreters per import profile (0 = skip)")
+    args = parser.parse_args(argv)
+
+    results, packages = profile_imports(args.import_repeat) if args.import_repeat > 0 else ([], {})
+
+    use_local_models()
+    workdir = Path(tempfile.mkdtemp(prefix="bio_rag_bench_"))
+    try:
+        for n_docs in args.sizes:
+            results.extend(run_size(n_docs, workdir, args.repeat, args.queries))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    _print_table(results)
+    _print_import_table(packages)
+    _print_compact_table(results)
+    _print_snapshot_table(results)
+    _print_embedding_table(results)
+    _print_chunking_table(results)
+    report = {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    args.out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"[bench] results written to {args.out}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions:
+            print(f"[REGRESSION] {line}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Chroma internals, in one place.
+
+langchain_chroma.Chroma exposes no chunk count, no metadata-only update and
+not the folder it was opened on, and chromadb can only drop all of its cached
+clients at once, not the one of a single folder. These helpers reach past the
+public APIs for that. They are written against chromadb 1.3 and
+langchain-chroma 1.0 (pinned in requirements.txt); check them first when
+upgrading either.
+"""
+
+# built-in libs
+from pathlib import Path
+
+
+def count(vectordb) -> int:
+    """Number of chunks in the store."""
+    return vectordb._collection.count()
+
+
+def update_metadatas(vectordb, ids: list[str], metadatas: list[dict]) -> None:
+    """Replace the metadata of existing chunks without re-embedding them."""
+    vectordb._collection.update(ids=ids, metadatas=metadatas)
+
+
+def store_dir(vectordb) -> str:
+    """Folder the store was opened on."""
+    return vectordb._client.get_settings().persist_directory
+
+
+def footprint(vectordb) -> dict[str, int]:
+    """
+    Bytes of the store. "resident": its HNSW segments (vectors and graph), which
+    Chroma loads into memory on the first read of the collection, a get() by id
+    included; "disk": those plus its sqlite files.
+    """
+    folder = Path(store_dir(vectordb))
+    segments = {p.parent for p in folder.glob("*/data_level0.bin")}
+    on_disk = sum(f.stat().st_size for d in segments for f in d.iterdir() if f.is_file())
+    sqlite = sum(f.stat().st_size for f in folder.glob("chroma.sqlite3*"))
+    # vectors not flushed to the segments yet are read from the write log in sqlite
+    first = vectordb.get(limit=1, include=["embeddings"])["embeddings"]
+    dims = len(first[0]) if first is not None and len(first) else 0
+    return {"resident": max(on_disk, count(vectordb) * dims * 4), "disk": on_disk + sqlite}
+
+
+def close_chroma(chroma_dir: Path) -> None:
+    """Stop the Chroma client of a folder nobody reads anymore (it keeps its HNSW index in memory)."""
+    from chromadb.api.shared_system_client import SharedSystemClient
+    system = SharedSystemClient._identifier_to_system.pop(str(chroma_dir), None)
+    if system is not None:
+        system.stop()
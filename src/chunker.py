@@ -0,0 +1,204 @@
+"""
+Structure-aware chunking of PDF pages.
+
+Section headings (Abstract, Introduction, Results, Methods, References, ...)
+and figure/table captions are chunk boundaries, so a chunk never runs across
+them. Between boundaries text is packed into chunks of up to chunk_size
+characters, cut at paragraph, then sentence, then line ends. Chunks do not
+overlap: each one is the exact span page_content[start_index:start_index +
+len(chunk)] of its page, so a citation can point back to it. The current
+section carries over page breaks; chunks of the reference list are dropped
+(or kept, tagged section="references"). Since that drops text, the reference
+list only starts at a heading on a line of its own, and only continues on the
+next page if that page starts with citation-like entries.
+"""
+
+# built-in libs
+import re
+
+# langchain libs
+from langchain_core.documents import Document
+
+
+# canonical section -> heading pattern (no capturing groups)
+SECTIONS = {
+    "abstract": r"abstract|summary|significance|highlights",
+    "introduction": r"introduction|background",
+    "results": r"results(?: and discussion)?",
+    "discussion": r"discussion",
+    "methods": r"(?:materials and |star |online )?methods(?: summary| details)?|experimental procedures|experimental section",
+    "conclusion": r"conclusions?|concluding remarks",
+    "back matter": r"acknowledge?ments?|funding|author contributions|competing interests|conflicts? of interests?|declaration of interests|data availability",
+    "references": r"references(?: and notes)?|bibliography|literature cited|works cited",
+    "supplementary": r"supplementary (?:information|materials?|data|figures)|supporting information|appendix",
+    "figure legends": r"figure legends|figure captions",
+}
+REFERENCES = "references"
+# text before the first recognised heading of a paper
+DEFAULT_SECTION = "body"
+
+_SECTION_NAMES = list(SECTIONS)
+_HEADING = (
+    # optional numbering ("2.", "3.1", "IV.") and an optional inline start of the text ("Abstract: We ...")
+    r"^[ \t]*(?:(?:\d{1,2}(?:\.\d{1,2})*|[IVX]{1,4})\.?[ \t]+)?(?:"
+    + "|".join(f"(?P<s{i}>{pattern})" for i, pattern in enumerate(SECTIONS.values()))
+    + r")[ \t]*(?:[:.][ \t]*(?:\S[^\n]*)?)?$"
+)
+_HEADING_RE = re.compile(_HEADING, re.IGNORECASE | re.MULTILINE)
+# letter-spaced headings as some PDFs extract them ("R E F E R E N C E S")
+_SPACED_RE = re.compile(r"^[ \t]*((?:[A-Z][ \t]){3,}[A-Z])[ \t]*$", re.MULTILINE)
+_CAPTION_RE = re.compile(
+    r"^[ \t]*(?:Supplementary[ \t]+)?(?:Fig(?:ure)?\.?|Table)[ \t]*S?\d{1,2}[A-Za-z]?[ \t]*[.:|]",
+    re.IGNORECASE | re.MULTILINE,
+)
+# start of a reference list entry: "[12]", "12. Smith", "Smith JA, ..." or "Smith, J. A."
+_CITATION_RE = re.compile(
+    r"^[ \t]*(?:\[\d{1,3}\]|\d{1,3}\.?[ \t]+[A-Z]|[A-Z][\w'\-]+,?[ \t]+(?:[A-Z]\.?[ \t]?){1,3}[,.])"
+)
+# or anywhere in it: "et al." or a year in parentheses
+_CITED_RE = re.compile(r"\bet al\.|\((?:19|20)\d\d[a-z]?\)")
+_SENTENCE_ENDS = (". ", ".\n", "? ", "?\n", "! ", "!\n")
+# fewer non-space characters than this: page numbers, running heads
+_MIN_CONTENT = 20
+
+
+def _section(match: re.Match) -> str:
+    return _SECTION_NAMES[int(match.lastgroup[1:])]
+
+
+def _inline(match: re.Match) -> bool:
+    """Text follows the heading on its line ("Abstract: We ...")."""
+    return bool(match.string[match.end(match.lastgroup):match.end()].strip(" \t:."))
+
+
+def _starts_with_citations(text: str, lines: int = 6) -> bool:
+    """At least two of the first non-blank lines of the page look like reference list entries."""
+    head = [line for line in text.splitlines() if line.strip()][:lines]
+    return sum(1 for line in head if _CITATION_RE.match(line) or _CITED_RE.search(line)) >= 2
+
+
+def _boundaries(text: str) -> list[tuple[int, str | None]]:
+    """(offset, section) of each heading and (offset, None) of each caption on the page, in order."""
+    # a capital letter tells "Background: ..." from a wrapped line that starts with "background. The ...";
+    # "References: see ..." in the body must not start the (dropped) reference list
+    marks = [
+        (m.start(), _section(m)) for m in _HEADING_RE.finditer(text)
+        if text[m.start(m.lastgroup)].isupper() and not (_section(m) == REFERENCES and _inline(m))
+    ]
+    for m in _SPACED_RE.finditer(text):
+        heading = _HEADING_RE.fullmatch(m.group(1).replace(" ", "").replace("\t", ""))
+        if heading is not None:
+            marks.append((m.start(), _section(heading)))
+    marks += [(m.start(), None) for m in _CAPTION_RE.finditer(text)]
+    marks.sort(key=lambda mark: mark[0])
+    return marks
+
+
+def _cut(text: str, lo: int, hi: int) -> int:
+    """Best place to end a chunk within text[lo:hi]: paragraph, sentence, line, word end, else hi."""
+    cut = text.rfind("\n\n", lo, hi)
+    if cut >= 0:
+        return cut
+    cut = max(text.rfind(end, lo, hi) for end in _SENTENCE_ENDS)
+    if cut >= 0:
+        return cut + 1
+    for sep in ("\n", " "):
+        cut = text.rfind(sep, lo, hi)
+        if cut >= 0:
+            return cut
+    return hi
+
+
+def _pack(text: str, start: int, end: int, size: int) -> list[tuple[int, int]]:
+    """Spans of up to `size` characters covering text[start:end], of even length where possible."""
+    spans = []
+    while end - start > size:
+        n_left = -(-(end - start) // size)
+        target = -(-(end - start) // n_left)
+        hi = start + min(size, target + target // 8)
+        cut = _cut(text, start + target // 2, hi)
+        spans.append((start, cut))
+        start = cut
+    spans.append((start, end))
+    return spans
+
+
+def _trim(text: str, start: int, end: int) -> tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _content(text: str, start: int, end: int) -> int:
+    """Non-space characters in text[start:end] (counted up to _MIN_CONTENT)."""
+    if end - start >= 4 * _MIN_CONTENT:
+        return end - start
+    return sum(1 for ch in text[start:end] if not ch.isspace())
+
+
+class SectionChunker:
+    """
+    Splits PDF pages into section-bounded, non-overlapping chunks.
+    Same interface as the LangChain text splitters: split_documents(pages).
+    Pages of one file must come in page order (the section carries over).
+    """
+
+    def __init__(self, chunk_size: int = 1200, drop_references: bool = True, min_chunk_size: int | None = None):
+        self.chunk_size = chunk_size
+        self.drop_references = drop_references
+        # neighbours of the same section shorter than this are joined
+        self.min_chunk_size = min_chunk_size if min_chunk_size is not None else chunk_size // 4
+
+    def split_page(self, text: str, section: str) -> tuple[list[tuple[int, int, str]], str]:
+        """(start, end, section) spans of one page, and the section it ends in."""
+        blocks, start = [], 0
+        for offset, mark in _boundaries(text):
+            if offset > start:
+                blocks.append((start, offset, section))
+            start = offset
+            if mark is not None:
+                section = mark
+        blocks.append((start, len(text), section))
+
+        spans = []
+        for block_start, block_end, block_section in blocks:
+            for s, e in _pack(text, block_start, block_end, self.chunk_size):
+                s, e = _trim(text, s, e)
+                if e <= s:
+                    continue
+                if spans:
+                    prev_s, prev_e, prev_section = spans[-1]
+                    short = min(e - s, prev_e - prev_s) < self.min_chunk_size
+                    if short and prev_section == block_section and e - prev_s <= self.chunk_size:
+                        spans[-1] = (prev_s, e, block_section)
+                        continue
+                spans.append((s, e, block_section))
+        # drop page numbers and running heads
+        spans = [span for span in spans if _content(text, span[0], span[1]) >= _MIN_CONTENT]
+        return spans, section
+
+    def split_documents(self, pages: list[Document]) -> list[Document]:
+        chunks = []
+        source, section = None, DEFAULT_SECTION
+        # section to go back to when a page after the reference list is not references
+        resume = DEFAULT_SECTION
+        for page in pages:
+            if page.metadata.get("source") != source:
+                source, section, resume = page.metadata.get("source"), DEFAULT_SECTION, DEFAULT_SECTION
+            text = page.page_content
+            if section == REFERENCES and not _starts_with_citations(text):
+                section = resume
+            spans, section = self.split_page(text, section)
+            for start, end, span_section in spans:
+                if span_section != REFERENCES:
+                    resume = span_section
+                if span_section == REFERENCES and self.drop_references:
+                    continue
+                chunks.append(Document(
+                    page_content=text[start:end],
+                    metadata={**page.metadata, "start_index": start, "section": span_section},
+                ))
+        return chunks
+
@@ -0,0 +1,275 @@
+# built-in libs
+from pathlib import Path
+import json
+import shutil
+
+# extra libs
+import numpy as np
+
+# langchain libs
+from langchain_core.documents import Document
+
+# project libs
+from doc_index import source_of
+import chroma_store
+
+
+COMPACT_DIRNAME = "compact_index"
+
+# rows scored per step, bounds the float32 scratch memory of a query
+_BLOCK = 65536
+
+# candidates rescored per result; sign bits need a wider net than int8
+DEFAULT_OVERSAMPLE = {"int8": 4, "binary": 10}
+
+# search filters whose allowed rows are kept
+_FILTER_CACHE_SIZE = 64
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def truncate(vectors, dims: int) -> np.ndarray:
+    """First `dims` components, re-normalised (text-embedding-3 vectors are trained for this)."""
+    v = np.asarray(vectors, dtype=np.float32)[:, :dims]
+    norms = np.linalg.norm(v, axis=1, keepdims=True)
+    return v / np.where(norms == 0, 1.0, norms)
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """int8 codes with a per-vector scale, or packed sign bits (no scale)."""
+    if quantization == "binary":
+        return np.packbits(vectors > 0, axis=1), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class CompactIndex:
+    """
+    Memory-mapped, quantized copy of the Chroma vectors, used for dense search.
+    Vectors are truncated to `dims` and stored as int8 or sign bits; the best
+    `k * oversample` candidates are rescored with the float32 vectors, truncated
+    to `dims` as well (the full vectors stay in Chroma only), of which only those
+    rows are read from disk. Chroma stays the store of record: texts and metadata
+    of the hits are fetched from it by id, which loads Chroma's own index too.
+    What shrinks is the data scanned per query, not the memory or disk in use.
+    """
+
+    def __init__(
+        self,
+        folder: Path,
+        vectorstore,
+        dims: int = 256,
+        quantization: str = "int8",
+        oversample: int | None = None,
+    ):
+        if quantization not in ("int8", "binary"):
+            raise ValueError(f"Unknown quantization '{quantization}' (int8 or binary)")
+        self.folder = folder
+        self.vectorstore = vectorstore
+        self.dims = dims
+        self.quantization = quantization
+        self.oversample = oversample or DEFAULT_OVERSAMPLE[quantization]
+        self.ids: list[str] = []
+        self.rows: dict[str, int] = {}
+        self.codes = self.scales = self.vectors = None
+        # source file code per row, and set of source files -> their rows; reset when the index is reloaded
+        self._sources: tuple[np.ndarray, dict[str, int]] | None = None
+        self._rows_of: dict[frozenset, np.ndarray] = {}
+        self._load()
+
+    @property
+    def config(self) -> dict:
+        model = getattr(self.vectorstore.embeddings, "model", None)
+        return {"dims": self.dims, "quantization": self.quantization, "model": model}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # --------- storage ---------
+
+    def _load(self) -> None:
+        meta_path = self.folder / "meta.json"
+        if not meta_path.exists():
+            return
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if meta.get("config") != self.config:
+            return  # built with other settings -> rebuilt by sync()
+        self.ids = json.loads((self.folder / "ids.json").read_text(encoding="utf-8"))
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self._sources, self._rows_of = None, {}
+        if not self.ids:
+            return
+        self.codes = np.load(self.folder / "codes.npy", mmap_mode="r")
+        self.vectors = np.load(self.folder / "vectors.npy", mmap_mode="r")
+        if self.quantization == "int8":
+            self.scales = np.load(self.folder / "scales.npy", mmap_mode="r")
+
+    def _write(self, ids: list[str], codes, scales, vectors) -> None:
+        tmp = self.folder.with_name(self.folder.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        np.save(tmp / "codes.npy", codes)
+        np.save(tmp / "vectors.npy", vectors)
+        if scales is not None:
+            np.save(tmp / "scales.npy", scales)
+        (tmp / "ids.json").write_text(json.dumps(ids), encoding="utf-8")
+        # meta.json last: a folder without it is never loaded
+        (tmp / "meta.json").write_text(json.dumps({"config": self.config, "count": len(ids)}), encoding="utf-8")
+
+        # open memory maps of the old files stay valid after the swap (POSIX)
+        old = self.folder.with_name(self.folder.name + ".old")
+        shutil.rmtree(old, ignore_errors=True)
+        if self.folder.exists():
+            self.folder.rename(old)
+        tmp.rename(self.folder)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def nbytes(self) -> dict[str, int]:
+        """
+        Bytes scanned on every query (codes + scales), bytes mapped (those plus the
+        rescoring vectors, of which only candidate rows are paged in) and bytes on disk.
+        """
+        scanned = sum(a.nbytes for a in (self.codes, self.scales) if a is not None)
+        mapped = scanned + (self.vectors.nbytes if self.vectors is not None else 0)
+        disk = sum(p.stat().st_size for p in self.folder.glob("*")) if self.folder.exists() else 0
+        return {"scanned": scanned, "mapped": mapped, "disk": disk}
+
+    def sync(self, page: int = 5000) -> None:
+        """Bring the index in line with Chroma: encode new chunk ids, drop removed ones."""
+        current, offset = [], 0
+        while True:
+            batch = self.vectorstore.get(include=[], limit=page, offset=offset)["ids"]
+            current.extend(batch)
+            offset += len(batch)
+            if len(batch) < page:
+                break
+
+        live = set(current)
+        keep_rows = [row for row, chunk_id in enumerate(self.ids) if chunk_id in live]
+        new_ids = [chunk_id for chunk_id in current if chunk_id not in self.rows]
+        if len(keep_rows) == len(self.ids) and not new_ids and (self.folder / "meta.json").exists():
+            return
+
+        ids = [self.ids[row] for row in keep_rows]
+        code_parts, scale_parts, vector_parts = [], [], []
+        if keep_rows:
+            code_parts.append(np.asarray(self.codes[keep_rows]))
+            vector_parts.append(np.asarray(self.vectors[keep_rows]))
+            if self.scales is not None:
+                scale_parts.append(np.asarray(self.scales[keep_rows]))
+        for start in range(0, len(new_ids), page):
+            batch_ids = new_ids[start:start + page]
+            got = self.vectorstore.get(ids=batch_ids, include=["embeddings"])
+            vectors = truncate(got["embeddings"], self.dims)
+            codes, scales = quantize(vectors, self.quantization)
+            ids.extend(got["ids"])
+            code_parts.append(codes)
+            vector_parts.append(vectors)
+            if scales is not None:
+                scale_parts.append(scales)
+
+        if ids:
+            codes = np.concatenate(code_parts)
+            vectors = np.concatenate(vector_parts)
+            scales = np.concatenate(scale_parts) if scale_parts else None
+        else:
+            width = (self.dims + 7) // 8 if self.quantization == "binary" else self.dims
+            dtype = np.uint8 if self.quantization == "binary" else np.int8
+            codes, vectors = np.zeros((0, width), dtype), np.zeros((0, self.dims), np.float32)
+            scales = np.zeros(0, np.float32) if self.quantization == "int8" else None
+        self._write(ids, codes, scales, vectors)
+        self.codes = self.scales = self.vectors = None
+        self._load()
+        print(f"[INFO] Compact index: {len(ids)} vectors ({len(new_ids)} new, {len(keep_rows)} kept)")
+
+    # --------- queries ---------
+
+    def _approx_scores(self, q: np.ndarray, rows: np.ndarray | None) -> np.ndarray:
+        n = len(self.ids) if rows is None else len(rows)
+        scores = np.empty(n, dtype=np.float32)
+        qbits = np.packbits(q > 0) if self.quantization == "binary" else None
+        for start in range(0, n, _BLOCK):
+            sel = slice(start, start + _BLOCK) if rows is None else rows[start:start + _BLOCK]
+            codes = self.codes[sel]
+            if qbits is not None:
+                # fewer differing sign bits = more similar
+                scores[start:start + len(codes)] = -_POPCOUNT[np.bitwise_xor(codes, qbits)].sum(axis=1, dtype=np.int32)
+            else:
+                scores[start:start + len(codes)] = (codes.astype(np.float32) @ q) * self.scales[sel]
+        return scores
+
+    def search(self, query_vector, k: int = 10, rows: np.ndarray | None = None) -> list[tuple[str, float]]:
+        """Top-k (chunk id, cosine score) over all rows, or only over `rows`."""
+        if not self.ids or k <= 0:
+            return []
+        q = truncate([query_vector], self.dims)[0]
+        approx = self._approx_scores(q, rows)
+        n_cand = min(len(approx), k * self.oversample)
+        cand = np.argpartition(-approx, n_cand - 1)[:n_cand]
+        cand_rows = np.sort(cand if rows is None else rows[cand])
+
+        # rescore with float32: only the candidate rows are paged in
+        exact = np.asarray(self.vectors[cand_rows]) @ q
+        best = np.argsort(-exact)[:k]
+        return [(self.ids[cand_rows[i]], float(exact[i])) for i in best]
+
+    def rows_of(self, sources: frozenset) -> np.ndarray:
+        """Rows of the chunks of the given source files, cached per set of sources."""
+        rows = self._rows_of.get(sources)
+        if rows is None:
+            if self._sources is None:
+                names: dict[str, int] = {}
+                codes = np.array([names.setdefault(source_of(c), len(names)) for c in self.ids], dtype=np.int32)
+                self._sources = (codes, names)
+            codes, names = self._sources
+            rows = np.flatnonzero(np.isin(codes, [names[s] for s in sources if s in names]))
+            if len(self._rows_of) >= _FILTER_CACHE_SIZE:
+                self._rows_of.clear()
+            self._rows_of[sources] = rows
+        return rows
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: dict | None = None, sources: frozenset | None = None
+    ) -> list[Document]:
+        """
+        Same call as Chroma.similarity_search, answered from the compact vectors.
+        `sources` (the source files `filter` admits) saves asking Chroma for the matching ids.
+        """
+        return self.similarity_search_by_vector(self.vectorstore.embeddings.embed_query(query), k, filter, sources)
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, filter: dict | None = None, sources: frozenset | None = None
+    ) -> list[Document]:
+        """Same call as Chroma.similarity_search_by_vector, for a query embedded already."""
+        rows = None
+        if sources is not None:
+            rows = self.rows_of(sources)
+            if not len(rows):
+                return []
+        elif filter is not None:
+            allowed = self.vectorstore.get(where=filter, include=[])["ids"]
+            rows = np.array(sorted(self.rows[c] for c in allowed if c in self.rows), dtype=np.int64)
+            if not len(rows):
+                return []
+        hits = self.search(embedding, k, rows)
+        if not hits:
+            return []
+
+        got = self.vectorstore.get(ids=[chunk_id for chunk_id, _ in hits], include=["documents", "metadatas"])
+        found = {
+            chunk_id: Document(id=chunk_id, page_content=text, metadata=meta or {})
+            for chunk_id, text, meta in zip(got["ids"], got["documents"], got["metadatas"])
+        }
+        return [found[chunk_id] for chunk_id, _ in hits if chunk_id in found]
+
+
+def open_compact_index(
+    chroma_dir: Path, vectorstore, dims: int, quantization: str, oversample: int | None = None
+) -> CompactIndex:
+    """Load the compact index stored next to the Chroma files, (re)building it if it lags behind."""
+    index = CompactIndex(chroma_dir / COMPACT_DIRNAME, vectorstore, dims, quantization, oversample)
+    if len(index) != chroma_store.count(vectorstore):
+        index.sync()
+    return index
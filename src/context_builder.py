@@ -0,0 +1,165 @@
+# built-in libs
+from dataclasses import dataclass
+from functools import lru_cache
+import re
+
+# extra libs
+import tiktoken
+
+# langchain libs
+from langchain_core.documents import Document
+
+
+# gpt-5 / gpt-4o family tokenizer
+ENCODING_NAME = "o200k_base"
+
+# chunks whose word shingles overlap at least this much are treated as the same text
+NEAR_DUPLICATE_JACCARD = 0.8
+
+# a truncated last passage shorter than this is not worth sending
+MIN_PASSAGE_TOKENS = 64
+
+# neighbouring chunks this many characters apart (trimmed whitespace) still count as touching
+_MAX_GAP = 4
+
+
+class _ApproxEncoding:
+    """Word/punctuation pieces as stand-in tokens, for hosts that cannot fetch the tiktoken files."""
+
+    _PIECE_RE = re.compile(r"\s*(?:\w+|[^\w\s])")
+
+    def encode_ordinary(self, text: str) -> list[str]:
+        return self._PIECE_RE.findall(text)
+
+    def decode(self, pieces: list[str]) -> str:
+        return "".join(pieces)
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception as e:
+        # tiktoken downloads its encoding files on first use
+        print(f"[WARN] tiktoken encoding '{ENCODING_NAME}' unavailable ({type(e).__name__}); approximating token counts")
+        return _ApproxEncoding()
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode_ordinary(text))
+
+
+@dataclass
+class PackedContext:
+    """Prompt context plus the passages it cites, numbered as in the text."""
+    text: str
+    docs: list[Document]
+    tokens: int
+    tokens_before: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens
+
+
+def citation(doc: Document) -> str:
+    """Compact citation: source file and 1-based page."""
+    meta = doc.metadata
+    source = meta.get("source", "unknown")
+    page = meta.get("page")
+    return f"{source}, p. {page + 1}" if isinstance(page, int) else source
+
+
+def _legacy_format(docs: list[Document]) -> str:
+    """The previous context format (full text + full metadata), as the baseline for savings."""
+    return "\n\n".join(f"[{i+1}] {d.page_content}\nMETA: {d.metadata}" for i, d in enumerate(docs))
+
+
+# --------- merging and deduplication ---------
+
+def _merge_neighbours(docs: list[Document]) -> list[Document]:
+    """
+    Join chunks of the same page whose character spans overlap or touch
+    (the recursive splitter repeats chunk_overlap characters between
+    neighbours; section chunks are only apart by the whitespace trimmed off
+    their ends). A merged passage takes the rank of its best-ranked part.
+    """
+    spans: dict[tuple, list] = {}
+    loose = []
+    for rank, doc in enumerate(docs):
+        start = doc.metadata.get("start_index")
+        if not isinstance(start, int) or start < 0:
+            loose.append((rank, doc))
+            continue
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        spans.setdefault(key, []).append((start, rank, doc))
+
+    merged = list(loose)
+    for parts in spans.values():
+        parts.sort(key=lambda part: part[0])
+        start, rank, doc = parts[0]
+        text, end = doc.page_content, start + len(doc.page_content)
+        for next_start, next_rank, next_doc in parts[1:]:
+            if next_start <= end + _MAX_GAP:
+                text += " " * (next_start > end) + next_doc.page_content[max(end - next_start, 0):]
+                end = max(end, next_start + len(next_doc.page_content))
+                rank = min(rank, next_rank)
+                continue
+            merged.append((rank, Document(page_content=text, metadata={**doc.metadata, "start_index": start})))
+            start, rank, doc = next_start, next_rank, next_doc
+            text, end = doc.page_content, start + len(doc.page_content)
+        merged.append((rank, Document(page_content=text, metadata={**doc.metadata, "start_index": start})))
+
+    merged.sort(key=lambda item: item[0])
+    return [doc for _, doc in merged]
+
+
+def _shingles(text: str, n: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+
+def _drop_near_duplicates(docs: list[Document]) -> list[Document]:
+    """Keep the first (best-ranked) of passages with near-identical text."""
+    kept, kept_shingles = [], []
+    for doc in docs:
+        sh = _shingles(doc.page_content)
+        if any(len(sh & other) / len(sh | other) >= NEAR_DUPLICATE_JACCARD for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(sh)
+    return kept
+
+
+# --------- packing ---------
+
+def pack_context(docs: list[Document], max_tokens: int) -> PackedContext:
+    """
+    Merge overlapping neighbours, drop near-duplicates and add passages in
+    retrieval order until max_tokens is reached; the last one may be cut short.
+    """
+    enc = _encoding()
+    passages = _drop_near_duplicates(_merge_neighbours(docs))
+
+    parts, packed_docs, used = [], [], 0
+    for doc in passages:
+        header = f"[{len(packed_docs) + 1}] ({citation(doc)})\n"
+        cost = len(enc.encode_ordinary(header)) + 2   # + the blank separator line
+        tokens = enc.encode_ordinary(doc.page_content)
+        room = max_tokens - used - cost
+        if len(tokens) > room:
+            if room < MIN_PASSAGE_TOKENS:
+                break
+            doc = Document(page_content=enc.decode(tokens[:room]) + " …", metadata=doc.metadata)
+            tokens = tokens[:room]
+        parts.append(header + doc.page_content)
+        packed_docs.append(doc)
+        used += cost + len(tokens)
+
+    text = "\n\n".join(parts)
+    return PackedContext(
+        text=text,
+        docs=packed_docs,
+        tokens=count_tokens(text),
+        tokens_before=count_tokens(_legacy_format(docs)),
+    )
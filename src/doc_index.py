@@ -0,0 +1,259 @@
+# built-in libs
+from dataclasses import dataclass
+from pathlib import Path
+import json
+import re
+import sqlite3
+import threading
+
+
+DOCS_FILENAME = "documents.sqlite3"
+BIB_FIELDS = ("title", "authors", "year", "doi")
+
+_DOI_RE = re.compile(r"\b(10\.\d{4,9}/[^\s\"<>]+)", re.IGNORECASE)
+_YEAR_RE = re.compile(r"\b(19[5-9]\d|20[0-4]\d)\b")
+_COPYRIGHT_YEAR_RE = re.compile(r"(?:©|\(c\)|copyright)\s*(19[5-9]\d|20[0-4]\d)", re.IGNORECASE)
+_AUTHOR_SPLIT_RE = re.compile(r"\s*(?:;|\band\b|&|,(?=\s*[A-Z][^,]*\s[A-Z]))\s*")
+
+
+# --------- extraction (runs in the ingest workers) ---------
+
+def pdf_info(pdf) -> dict:
+    """Raw title / authors / date / doi strings of an open pikepdf.Pdf (XMP first, then the Info dict)."""
+    info = {}
+    try:
+        meta = pdf.open_metadata(set_pikepdf_as_editor=False, update_docinfo=False)
+        creators = meta.get("dc:creator")
+        info = {
+            "title": meta.get("dc:title"),
+            "authors": "; ".join(creators) if isinstance(creators, list) else creators,
+            "doi": meta.get("prism:doi"),
+            "date": meta.get("prism:coverDate") or meta.get("prism:publicationDate"),
+        }
+    except Exception:
+        pass  # broken XMP is common; the Info dict may still be fine
+
+    docinfo = pdf.docinfo
+    for key, name in (("title", "/Title"), ("authors", "/Author"), ("doi", "/doi"), ("date", "/CreationDate")):
+        if not info.get(key) and name in docinfo:
+            info[key] = str(docinfo[name])
+    return {k: str(v).strip() for k, v in info.items() if v}
+
+
+def _plausible_title(title: str | None) -> str | None:
+    if not title:
+        return None
+    title = re.sub(r"^Microsoft Word - ", "", title).strip()
+    if len(title) < 8 or title.lower().endswith((".pdf", ".doc", ".docx")) or title.lower() == "untitled":
+        return None
+    return title
+
+
+def _first_page_title(text: str) -> str | None:
+    """First line of the first page that reads like a title."""
+    for line in text.splitlines()[:15]:
+        line = line.strip()
+        if 4 <= len(line.split()) <= 40 and not _DOI_RE.search(line) and not line.lower().startswith(("http", "www.")):
+            return line
+    return None
+
+
+def _split_authors(authors: str | None) -> list[str]:
+    if not authors:
+        return []
+    return [a.strip(" .") for a in _AUTHOR_SPLIT_RE.split(authors) if a.strip(" .")]
+
+
+def _year(info: dict, text: str) -> int | None:
+    date = info.get("date", "")
+    if date and not date.startswith("D:"):
+        # publication date from the XMP
+        match = _YEAR_RE.search(date)
+        if match:
+            return int(match.group(1))
+    match = _COPYRIGHT_YEAR_RE.search(text)
+    if match:
+        return int(match.group(1))
+    # received / accepted / published dates are at most the publication year,
+    # works cited on the first page are older
+    years = _YEAR_RE.findall(text)
+    if years:
+        return max(int(y) for y in years)
+    # PDF creation date (D:YYYYMMDD...) as the last resort
+    match = re.match(r"D:(\d{4})", date)
+    return int(match.group(1)) if match else None
+
+
+def bibliography(info: dict, first_page_text: str, fallback_title: str) -> dict:
+    """
+    Normalised title / authors / year / doi for one PDF.
+    Empty fields are left out (Chroma metadata values cannot be None).
+    """
+    doi = info.get("doi")
+    if not doi:
+        match = _DOI_RE.search(first_page_text)
+        doi = match.group(1) if match else None
+
+    bib = {
+        "title": _plausible_title(info.get("title")) or _first_page_title(first_page_text) or fallback_title,
+        "authors": "; ".join(_split_authors(info.get("authors"))),
+        "year": _year(info, first_page_text),
+        "doi": doi.rstrip(".,;)").lower() if doi else None,
+    }
+    return {k: v for k, v in bib.items() if v}
+
+
+# --------- document table ---------
+
+def documents_path(chroma_dir: Path) -> Path:
+    return chroma_dir / DOCS_FILENAME
+
+
+class DocumentTable:
+    """One row per ingested PDF with its bibliographic fields, stored next to the Chroma files."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " source TEXT PRIMARY KEY, title TEXT, authors TEXT, year INTEGER, doi TEXT)"
+            )
+
+    def upsert(self, source: str, bib: dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO documents (source, title, authors, year, doi) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(source) DO UPDATE SET"
+                " title = excluded.title, authors = excluded.authors, year = excluded.year, doi = excluded.doi",
+                (source, bib.get("title"), bib.get("authors"), bib.get("year"), bib.get("doi")),
+            )
+
+    def delete(self, sources) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM documents WHERE source = ?", [(s,) for s in sources])
+
+    def sources(self) -> set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT source FROM documents")}
+
+    def rows(self) -> list[dict]:
+        with self._lock:
+            cur = self._conn.execute("SELECT source, title, authors, year, doi FROM documents ORDER BY source")
+            return [dict(zip(("source", "title", "authors", "year", "doi"), row)) for row in cur]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def list_documents(chroma_dir: Path) -> list[dict]:
+    """All rows of the document table (empty if nothing was ingested with it yet)."""
+    path = documents_path(chroma_dir)
+    if not path.exists():
+        return []
+    table = DocumentTable(path)
+    try:
+        return table.rows()
+    finally:
+        table.close()
+
+
+def all_authors(rows: list[dict]) -> list[str]:
+    return sorted({a for row in rows for a in (row["authors"] or "").split("; ") if a})
+
+
+def year_range(rows: list[dict]) -> tuple[int, int] | None:
+    years = [row["year"] for row in rows if row["year"]]
+    return (min(years), max(years)) if years else None
+
+
+# --------- filtered search ---------
+
+def source_of(chunk_id: str) -> str:
+    """Source file of a chunk, read back from its id (source:page:offset:hash, see preprocess._chunk_id)."""
+    return chunk_id.rsplit(":", 3)[0]
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """
+    Chroma `where` clauses plus the papers they admit as (collection, source)
+    pairs (for the lexical and compact indexes): the same file name can be a
+    different paper in another collection.
+    """
+    clauses: tuple   # year bounds, the same in every collection
+    papers: frozenset
+    by_source: bool = False   # picked by author: Chroma is narrowed to the matching files by name
+
+    @property
+    def key(self) -> str:
+        """Stable description, e.g. to keep answers for different filters apart."""
+        return json.dumps([list(self.clauses), sorted(self.papers) if self.by_source else None], sort_keys=True)
+
+    def sources(self, collection: str | None = None) -> frozenset:
+        """Source files the filter admits in `collection` (None: in any)."""
+        return frozenset(source for c, source in self.papers if collection is None or c == collection)
+
+    def where(self, collection: str | None = None) -> dict:
+        """Chroma `where` clause for `collection` (None: for any)."""
+        clauses = list(self.clauses)
+        if self.by_source:
+            clauses.append({"source": {"$in": sorted(self.sources(collection))}})
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def build_search_filter(
+    rows: list[dict],
+    years: tuple[int, int] | None = None,
+    authors: list[str] | None = None,
+) -> SearchFilter | None:
+    """
+    Filter for papers published within `years` (inclusive) and written by any of
+    `authors`; None when neither narrows anything. Rows of several collections
+    name theirs in row["collection"].
+    """
+    clauses, matched = [], rows
+    if years is not None:
+        lo, hi = years
+        clauses += [{"year": {"$gte": lo}}, {"year": {"$lte": hi}}]
+        matched = [r for r in matched if r["year"] and lo <= r["year"] <= hi]
+    if authors:
+        wanted = set(authors)
+        matched = [r for r in matched if wanted & set((r["authors"] or "").split("; "))]
+    if not (clauses or authors):
+        return None
+    papers = frozenset((r.get("collection"), r["source"]) for r in matched)
+    return SearchFilter(clauses=tuple(clauses), papers=papers, by_source=bool(authors))
+
+
+def filter_retriever(retriever, search_filter: SearchFilter | None, collection: str | None = None):
+    """Copy of the retriever (of `collection`) whose searches only consider chunks matching the filter."""
+    if search_filter is None:
+        return retriever
+    # imported here so the app can list documents without loading langchain
+    from langchain_core.vectorstores import VectorStoreRetriever
+    from lexical_index import HybridRetriever
+    from rerank import RerankRetriever
+    from router import CollectionRouter
+
+    if isinstance(retriever, CollectionRouter):
+        # collections without a matching paper are not searched at all
+        retrievers = {
+            name: filter_retriever(r, search_filter, name)
+            for name, r in retriever.retrievers.items()
+            if search_filter.sources(name)
+        }
+        return retriever.model_copy(update={"retrievers": retrievers})
+    if isinstance(retriever, RerankRetriever):
+        return retriever.model_copy(update={"base": filter_retriever(retriever.base, search_filter, collection)})
+    if isinstance(retriever, HybridRetriever):
+        return retriever.model_copy(
+            update={"where": search_filter.where(collection), "sources": search_filter.sources(collection)}
+        )
+    if isinstance(retriever, VectorStoreRetriever):
+        search_kwargs = {**retriever.search_kwargs, "filter": search_filter.where(collection)}
+        return retriever.model_copy(update={"search_kwargs": search_kwargs})
+    raise TypeError(f"Cannot filter a {type(retriever).__name__}")
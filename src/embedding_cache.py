@@ -0,0 +1,196 @@
+# built-in libs
+from array import array
+from pathlib import Path
+import hashlib
+import sqlite3
+import threading
+import time
+
+# langchain libs
+from langchain_core.embeddings import Embeddings
+
+# project libs
+import telemetry
+
+
+# rough per-row cost on top of the float32 vector (key, model, index entries)
+_ROW_OVERHEAD = 96
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed, persistent cache in front of an embeddings model.
+    Vectors are stored in SQLite keyed by (model, sha256(text)); identical
+    chunks are only ever embedded once per model. Least recently used rows
+    are evicted once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, inner: Embeddings, cache_path: Path, max_bytes: int = 1024 * 1024 * 1024):
+        self.inner = inner
+        self.model = _model_key(inner)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(cache_path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                key BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (model, key)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        # running totals kept by triggers, so size checks never scan the table
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cache_size (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                rows INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_size VALUES (0, 0, 0);
+            CREATE TRIGGER IF NOT EXISTS embeddings_ins AFTER INSERT ON embeddings BEGIN
+                UPDATE cache_size SET rows = rows + 1, bytes = bytes + LENGTH(NEW.vector) WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS embeddings_del AFTER DELETE ON embeddings BEGIN
+                UPDATE cache_size SET rows = rows - 1, bytes = bytes - LENGTH(OLD.vector) WHERE id = 0;
+            END;
+            """
+        )
+        self._conn.commit()
+
+    # --------- Embeddings interface ---------
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [hashlib.sha256(t.encode("utf-8")).digest() for t in texts]
+        found = self._lookup(set(keys))
+
+        # embed each distinct missing text once
+        missing: dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        n_hits = sum(1 for k in keys if k in found)
+        self.hits += n_hits
+        self.misses += len(keys) - n_hits
+
+        telemetry.count("embeddings.cache_hits", n_hits)
+        if missing:
+            with telemetry.span("embeddings.embed_documents", texts=len(missing), model=self.model):
+                vectors = self.inner.embed_documents(list(missing.values()))
+            new_rows = dict(zip(missing.keys(), vectors))
+            self._store(new_rows)
+            found.update(new_rows)
+
+        return [list(found[k]) for k in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        key = hashlib.sha256(text.encode("utf-8")).digest()
+        found = self._lookup({key})
+        if key in found:
+            self.hits += 1
+            return list(found[key])
+        self.misses += 1
+        with telemetry.span("embeddings.embed_query", model=self.model):
+            vector = self.inner.embed_query(text)
+        self._store({key: vector})
+        return vector
+
+    def store(self, texts: list[str], vectors: list[list[float]]) -> None:
+        """Cache vectors computed outside embed_documents (e.g. batches of a call that later failed)."""
+        self._store({hashlib.sha256(t.encode("utf-8")).digest(): v for t, v in zip(texts, vectors)})
+
+    # --------- stats ---------
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows, size = self._size()
+        total = self.hits + self.misses
+        return {
+            "model": self.model,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": rows,
+            "bytes": size + rows * _ROW_OVERHEAD,
+        }
+
+    # --------- storage ---------
+
+    def _lookup(self, keys: set[bytes]) -> dict[bytes, array]:
+        if not keys:
+            return {}
+        found: dict[bytes, array] = {}
+        key_list = list(keys)
+        now = int(time.time())
+        with self._lock:
+            # stay below SQLite's host-parameter limit
+            for i in range(0, len(key_list), 500):
+                part = key_list[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({marks})",
+                    [self.model, *part],
+                ).fetchall()
+                for key, blob in rows:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[key] = vec
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND key IN ({marks})",
+                        [now, self.model, *part],
+                    )
+            self._conn.commit()
+        return found
+
+    def _store(self, rows: dict[bytes, list[float]]) -> None:
+        now = int(time.time())
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)
+                ON CONFLICT (model, key) DO UPDATE SET last_used = excluded.last_used
+                """,
+                [(self.model, k, array("f", v).tobytes(), now) for k, v in rows.items()],
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _size(self) -> tuple[int, int]:
+        return self._conn.execute("SELECT rows, bytes FROM cache_size WHERE id = 0").fetchone()
+
+    def _evict(self) -> None:
+        """Drop least recently used rows until the cache is below 90% of max_bytes."""
+        rows, size = self._size()
+        total = size + rows * _ROW_OVERHEAD
+        if total <= self.max_bytes or rows == 0:
+            return
+        per_row = total / rows
+        n_drop = int((total - 0.9 * self.max_bytes) / per_row) + 1
+        self._conn.execute(
+            """
+            DELETE FROM embeddings WHERE (model, key) IN (
+                SELECT model, key FROM embeddings ORDER BY last_used LIMIT ?
+            )
+            """,
+            (n_drop,),
+        )
+        self._conn.commit()
+
+
+def _model_key(inner: Embeddings) -> str:
+    """Cache namespace: model name plus output dimensions when they are truncated."""
+    model = getattr(inner, "model", None) or type(inner).__name__
+    dims = getattr(inner, "dimensions", None)
+    return f"{model}@{dims}" if dims else model
@@ -0,0 +1,348 @@
+# built-in libs
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+import random
+import re
+import threading
+import time
+
+# extra libs
+import openai
+import tiktoken
+
+# langchain libs
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+# project libs
+from context_builder import count_tokens
+import telemetry
+
+
+# OpenAI limits per embeddings request
+MAX_INPUTS = 2048
+MAX_INPUT_TOKENS = 8191
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+# --------- token-packed batches ---------
+
+@lru_cache(maxsize=4)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception as e:
+        # unknown model, or tiktoken cannot download its files
+        print(f"[WARN] tiktoken encoding for '{model}' unavailable ({type(e).__name__}); approximating token counts")
+        return None
+
+
+def _counter(model: str):
+    enc = _encoding(model)
+    return (lambda text: len(enc.encode_ordinary(text))) if enc is not None else count_tokens
+
+
+def pack_batches(
+    tokens: list[int], max_tokens: int, max_inputs: int = MAX_INPUTS
+) -> list[list[int]]:
+    """Consecutive text positions grouped so each batch stays within max_tokens and max_inputs."""
+    batches, current, current_tokens = [], [], 0
+    for i, n in enumerate(tokens):
+        if current and (current_tokens + n > max_tokens or len(current) >= max_inputs):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n
+    if current:
+        batches.append(current)
+    return batches
+
+
+# --------- rate-limit signals ---------
+
+def _duration(value: str | None) -> float | None:
+    """OpenAI reset durations ("20ms", "1s", "6m0s") in seconds."""
+    if not value:
+        return None
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(n) * _UNIT_SECONDS[unit] for n, unit in parts)
+
+
+def _int_header(headers, name: str) -> int | None:
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after(headers) -> float | None:
+    if headers is None:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass  # HTTP-date form, fall back to the reset headers
+    return _duration(headers.get("x-ratelimit-reset-tokens")) or _duration(headers.get("x-ratelimit-reset-requests"))
+
+
+def _token_wait(headers, tokens: int, remaining: int) -> float:
+    """Seconds until `tokens` are available again, assuming the budget refills at a steady rate."""
+    reset = _duration(headers.get("x-ratelimit-reset-tokens"))
+    if reset is None:
+        return 1.0
+    limit = _int_header(headers, "x-ratelimit-limit-tokens")
+    if limit is None or limit <= remaining:
+        return reset
+    # reset is the time to refill the whole budget, only part of it is needed
+    return reset * (tokens - remaining) / (limit - remaining)
+
+
+def _error_status(e: Exception) -> int | None:
+    status = getattr(e, "status_code", None)
+    if status is None and getattr(e, "response", None) is not None:
+        status = getattr(e.response, "status_code", None)
+    return status
+
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    status = _error_status(e)
+    return status is not None and (status == 429 or status == 408 or status >= 500)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on requests in flight. Grows by about one slot per window of
+    successful requests while latency per token stays near the best seen so
+    far; shrinks by a quarter when it climbs, halves on a 429 and then holds
+    every sender until the server's retry-after / reset time has passed.
+    """
+
+    def __init__(self, start: int = 4, maximum: int = 16, minimum: int = 1, slowdown: float = 2.0):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(start, minimum), self.maximum))
+        self.slowdown = slowdown
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._baseline = None
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    self._cond.wait(self.paused_until - now)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    self.in_flight += 1
+                    return
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, seconds: float, tokens: int, headers=None) -> None:
+        per_token = seconds / max(tokens, 1)
+        with self._cond:
+            if self._baseline is None or per_token < self._baseline:
+                self._baseline = per_token
+            else:
+                # drift up slowly so a permanently slower server is not read as congestion forever
+                self._baseline += 0.01 * (per_token - self._baseline)
+
+            remaining_tokens = _int_header(headers, "x-ratelimit-remaining-tokens") if headers else None
+            remaining_requests = _int_header(headers, "x-ratelimit-remaining-requests") if headers else None
+            if remaining_tokens is not None and remaining_tokens < tokens:
+                # the next request of this size would be refused: wait for the window to reset
+                wait_s = _token_wait(headers, tokens, remaining_tokens)
+                self.paused_until = max(self.paused_until, time.monotonic() + wait_s)
+            elif per_token > self.slowdown * self._baseline:
+                self.limit = max(self.minimum, self.limit * 0.75)
+            elif (
+                (remaining_tokens is None or remaining_tokens >= tokens * self.limit)
+                and (remaining_requests is None or remaining_requests > self.limit)
+            ):
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def on_rate_limited(self, retry_after: float | None) -> None:
+        with self._cond:
+            self.limit = max(self.minimum, self.limit / 2)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            self._cond.notify_all()
+
+
+# --------- transports ---------
+
+class _OpenAITransport:
+    """Raw embeddings calls with the settings of an OpenAIEmbeddings, exposing the response headers."""
+
+    def __init__(self, inner: OpenAIEmbeddings):
+        key = inner.openai_api_key
+        # retries are the scheduler's job: the client must not back off on its own
+        self.client = openai.OpenAI(
+            api_key=key.get_secret_value() if key is not None else None,
+            organization=inner.openai_organization,
+            base_url=inner.openai_api_base,
+            timeout=inner.request_timeout,
+            default_headers=inner.default_headers,
+            http_client=inner.http_client,
+            max_retries=0,
+        )
+        self.extra = {"dimensions": inner.dimensions} if inner.dimensions else {}
+        self.model = inner.model
+
+    def send(self, texts: list[str]):
+        raw = self.client.embeddings.with_raw_response.create(input=texts, model=self.model, **self.extra)
+        data = sorted(raw.parse().data, key=lambda d: d.index)
+        return [d.embedding for d in data], raw.headers
+
+
+class _EmbeddingsTransport:
+    """Any other Embeddings model: no headers, only latency and errors to adapt to."""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+
+    def send(self, texts: list[str]):
+        return self.inner.embed_documents(texts), None
+
+
+# --------- scheduler ---------
+
+class ScheduledEmbeddings(Embeddings):
+    """
+    Embeds large document lists as token-packed batches sent concurrently.
+    Concurrency follows AdaptiveConcurrency; a batch that fails with a 429,
+    a 5xx or a timeout is retried on its own, with jittered exponential
+    backoff, so batches that already succeeded are never sent again.
+    on_batch(texts, vectors), if set, is called as each batch completes (e.g.
+    to cache the vectors before a later batch fails for good).
+    """
+
+    def __init__(
+        self,
+        inner: Embeddings,
+        max_batch_tokens: int = 8000,
+        concurrency: int = 4,
+        max_concurrency: int = 16,
+        max_retries: int = 6,
+        backoff_s: float = 0.5,
+        max_backoff_s: float = 30.0,
+    ):
+        self.inner = inner
+        self.model = getattr(inner, "model", None) or type(inner).__name__
+        self.dimensions = getattr(inner, "dimensions", None)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.limiter = AdaptiveConcurrency(concurrency, max_concurrency)
+        self.transport = _OpenAITransport(inner) if isinstance(inner, OpenAIEmbeddings) else _EmbeddingsTransport(inner)
+        self.on_batch = None
+        self.count_tokens = _counter(self.model)
+        self._pool = ThreadPoolExecutor(max_workers=self.limiter.maximum, thread_name_prefix="embed")
+        self._stats_lock = threading.Lock()
+        self.requests = self.retries = self.rate_limited = self.tokens = 0
+
+    # --------- Embeddings interface ---------
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        tokens = [self.count_tokens(t) for t in texts]
+        batches = pack_batches(tokens, self.max_batch_tokens)
+        results: list = [None] * len(texts)
+
+        futures = [self._pool.submit(self._run_batch, texts, tokens, batch, results) for batch in batches]
+        done, _ = wait(futures, return_when="FIRST_EXCEPTION")
+        failed = next((f for f in done if f.exception() is not None), None)
+        if failed is not None:
+            # stop sending new batches; the ones in flight finish (and reach on_batch)
+            for f in futures:
+                f.cancel()
+            wait(futures)
+            raise failed.exception()
+        return results
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.inner.embed_query(text)
+
+    # --------- stats ---------
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "tokens": self.tokens,
+                "concurrency": int(self.limiter.limit),
+            }
+
+    # --------- batches ---------
+
+    def _send(self, texts: list[str], n_tokens: int):
+        if len(texts) == 1 and n_tokens > MAX_INPUT_TOKENS:
+            # too long for one input: the wrapped model splits and averages it
+            return self.inner.embed_documents(texts), None
+        return self.transport.send(texts)
+
+    def _run_batch(self, texts, tokens, batch: list[int], results: list) -> None:
+        batch_texts = [texts[i] for i in batch]
+        n_tokens = sum(tokens[i] for i in batch)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                with telemetry.span("embeddings.request", texts=len(batch), tokens=n_tokens, attempt=attempt):
+                    vectors, headers = self._send(batch_texts, n_tokens)
+            except Exception as e:
+                self.limiter.release()
+                if not _retryable(e) or attempt == self.max_retries:
+                    raise
+                delay = self._on_error(e, attempt)
+                time.sleep(delay)
+                continue
+            seconds = time.perf_counter() - start
+            self.limiter.release()
+            self.limiter.on_success(seconds, n_tokens, headers)
+            with self._stats_lock:
+                self.requests += 1
+                self.tokens += n_tokens
+            for i, vector in zip(batch, vectors):
+                results[i] = vector
+            if self.on_batch is not None:
+                self.on_batch(batch_texts, vectors)
+            return
+
+    def _on_error(self, e: Exception, attempt: int) -> float:
+        """Adapt to a retryable failure and return the jittered delay before the next attempt."""
+        response = getattr(e, "response", None)
+        retry_after = _retry_after(getattr(response, "headers", None))
+        backoff = random.uniform(0, min(self.max_backoff_s, self.backoff_s * 2 ** attempt))
+        with self._stats_lock:
+            self.requests += 1
+            self.retries += 1
+        telemetry.count("embeddings.retries")
+        if _error_status(e) == 429:
+            with self._stats_lock:
+                self.rate_limited += 1
+            telemetry.count("embeddings.rate_limited")
+            self.limiter.on_rate_limited(retry_after)
+            # senders released together would collide again: spread them out
+            return (retry_after or 0.0) * random.uniform(1.0, 1.2) + backoff
+        return max(retry_after or 0.0, backoff)
@@ -1,10 +1,26 @@
+from dataclasses import dataclass
 from pathlib import Path
+import json
 import os
 from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parents[1]  # project root
 
-def load_paths():
+DEFAULT_COLLECTION = "default"
+DEFAULT_TOPIC = "Gene expression activation via microRNA"
+
+
+@dataclass(frozen=True)
+class Collection:
+    """A separately indexed corpus: its own dataset folder, index, metadata and prompt topic."""
+    name: str
+    topic: str
+    datasets_dir: Path
+    chroma_dir: Path
+    metadata_path: Path
+
+
+def _base_paths():
     """Load dataset/chroma/metadata paths from .env, with sensible defaults."""
     # Ensure .env is loaded (if present)
     env_path = BASE_DIR / ".env"
@@ -22,9 +38,97 @@ def load_paths():
     datasets_dir = Path(os.getenv("DATASETS_DIR") or default_datasets).expanduser()
     chroma_dir = Path(os.getenv("CHROMA_DB_DIR") or default_chroma).expanduser()
     metadata_path = Path(os.getenv("KB_METADATA_PATH") or default_metadata).expanduser()
+    return datasets_dir, chroma_dir, metadata_path
+
+
+def _config_path(value, default: Path) -> Path:
+    if not value:
+        return default
+    path = Path(value).expanduser()
+    return path if path.is_absolute() else BASE_DIR / path
+
+
+def load_collections() -> list[Collection]:
+    """
+    Collections listed in KB_COLLECTIONS_FILE (default collections.json), e.g.
+
+        {"mirna": {"topic": "Gene expression activation via microRNA"},
+         "rbp": {"topic": "RNA-binding proteins", "datasets_dir": "/data/rbp"}}
 
+    By default a collection lives in DATASETS_DIR/<name>, CHROMA_DB_DIR/<name> and
+    KB_METADATA_PATH with <name> added to the file name. Without the file there is
+    a single collection at the plain DATASETS_DIR / CHROMA_DB_DIR / KB_METADATA_PATH.
+    """
+    datasets_dir, chroma_dir, metadata_path = _base_paths()
+    config_file = _config_path(os.getenv("KB_COLLECTIONS_FILE"), BASE_DIR / "collections.json")
+    if not config_file.exists():
+        return [Collection(DEFAULT_COLLECTION, DEFAULT_TOPIC, datasets_dir, chroma_dir, metadata_path)]
+
+    with config_file.open("r", encoding="utf-8") as f:
+        config = json.load(f)
+    if not config:
+        raise ValueError(f"No collections defined in {config_file}")
+    collections = []
+    for name, entry in config.items():
+        collections.append(Collection(
+            name=name,
+            topic=entry.get("topic") or name,
+            datasets_dir=_config_path(entry.get("datasets_dir"), datasets_dir / name),
+            chroma_dir=_config_path(entry.get("chroma_dir"), chroma_dir / name),
+            metadata_path=_config_path(
+                entry.get("metadata_path"), metadata_path.with_name(f"{metadata_path.stem}.{name}{metadata_path.suffix}")
+            ),
+        ))
+    return collections
+
+
+def get_collection(name: str | None = None) -> Collection:
+    """Collection `name`, or the first one configured."""
+    collections = load_collections()
+    if name is None:
+        return collections[0]
+    for collection in collections:
+        if collection.name == name:
+            return collection
+    raise KeyError(f"Unknown collection '{name}' (configured: {', '.join(c.name for c in collections)})")
+
+
+def load_paths(collection: str | None = None):
+    """Dataset/chroma/metadata paths of a collection (default: the first one)."""
+    c = get_collection(collection)
     # Ensure datasets folder exists; do NOT touch Chroma folder yet
-    datasets_dir.mkdir(parents=True, exist_ok=True)
+    c.datasets_dir.mkdir(parents=True, exist_ok=True)
+    return c.datasets_dir, c.chroma_dir, c.metadata_path
 
-    return datasets_dir, chroma_dir, metadata_path
 
+def load_cache_dir() -> Path:
+    """Folder for content-addressed caches (embeddings, parsed pages, ...)."""
+    cache_dir = Path(os.getenv("KB_CACHE_DIR") or BASE_DIR / ".kb_cache").expanduser()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """Read a boolean switch from the environment ("1", "true", "yes", "on")."""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment, falling back to default."""
+    value = os.getenv(name)
+    try:
+        return int(value) if value not in (None, "") else default
+    except ValueError:
+        print(f"[WARN] Ignoring invalid integer {name}={value!r}")
+        return default
+
+def env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment, falling back to default."""
+    value = os.getenv(name)
+    try:
+        return float(value) if value not in (None, "") else default
+    except ValueError:
+        print(f"[WARN] Ignoring invalid number {name}={value!r}")
+        return default
@@ -1,65 +1,253 @@
-from langchain_chroma import Chroma
+# built-in libs
+from dataclasses import dataclass, field
+import time
+
+# langchain libs
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.documents import Document
 
+# project libs
+from context_builder import PackedContext, pack_context
+from doc_index import SearchFilter, filter_retriever
+from env_handler import DEFAULT_TOPIC, env_int
+import telemetry
 
-def generate_answer_chain(retriever, question):
-    # LLM
-    llm = ChatOpenAI(model="gpt-5-mini", temperature=0.2)
-
-    # Prompt (concise + citations)
-    prompt = ChatPromptTemplate.from_template(
-        """
-        You are a concise scientific research assistant with expertise in {topic}.
-        Your goal is to provide **a concise, factual, and well-structured scientific summary** formatted for Markdown display.
-
-        **Question:** {question}
-
-        **Context from peer-reviewed sources:**
-        {context}
-
-        ---
-
-        Write your answer as a structured scientific summary following these rules:
-
-        - Begin with **Short Answer:** — a short bullet list containing only the names of the main proteins, molecules, or entities that directly answer the question.
-        - Continue with **Overview:** (on a new line) — 1–3 sentences summarizing the mechanism or concept.
-        - Then include **Relevant processes and protein components:** — bullet points describing key mechanisms, molecules, or interactions.
-        - Then include **Limitations:** — 1–2 sentences describing study limitations or missing information.
-        - Finish with  **References:** — each reference should appear as a bullet, formatted in *italic Harvard style* (e.g., *Vasudevan et al. 2007, Science, 318:1931–1934*).
-        - Use Markdown formatting:
-        - Bold headers followed by a colon (**Header:**)
-        - Bullet lists using “- ”
-        - Italic text for references
-        - Maintain an academic, factual tone — no speculation or general knowledge outside the context.
-        - If evidence is insufficient, explicitly state that data in the provided context is limited.
-        - Do NOT fabricate or infer references beyond the context.
-
-        Now produce the answer:
-        """
-    )
 
-    topic = "Gene expression activation via microRNA"
+TOPIC = DEFAULT_TOPIC
 
-    docs = retriever.invoke(question)
+# Prompt (concise + citations)
+PROMPT_TEMPLATE = """
+You are a concise scientific research assistant with expertise in {topic}.
+Your goal is to provide **a concise, factual, and well-structured scientific summary** formatted for Markdown display.
+
+**Question:** {question}
+
+**Context from peer-reviewed sources:**
+{context}
+
+---
+
+Write your answer as a structured scientific summary following these rules:
+
+- Begin with **Short Answer:** — a short bullet list containing only the names of the main proteins, molecules, or entities that directly answer the question.
+- Continue with **Overview:** (on a new line) — 1–3 sentences summarizing the mechanism or concept.
+- Then include **Relevant processes and protein components:** — bullet points describing key mechanisms, molecules, or interactions.
+- Then include **Limitations:** — 1–2 sentences describing study limitations or missing information.
+- Finish with  **References:** — each reference should appear as a bullet, formatted in *italic Harvard style* (e.g., *Vasudevan et al. 2007, Science, 318:1931–1934*).
+- Use Markdown formatting:
+- Bold headers followed by a colon (**Header:**)
+- Bullet lists using “- ”
+- Italic text for references
+- Maintain an academic, factual tone — no speculation or general knowledge outside the context.
+- If evidence is insufficient, explicitly state that data in the provided context is limited.
+- Do NOT fabricate or infer references beyond the context.
+
+Now produce the answer:
+"""
+
+
+def _context_budget() -> int:
+    return env_int("CONTEXT_MAX_TOKENS", 2500)
 
-    def format_docs(docs):
-        return "\n\n".join(
-            f"[{i+1}] {d.page_content}\nMETA: {d.metadata}"
-            for i, d in enumerate(docs)
-        )
 
-    inputs = {
-        "context": retriever | format_docs,       # Retrieves and formats source docs
-        "question": RunnablePassthrough(),        # Passes user query directly
-        "topic": RunnablePassthrough(lambda _: topic),  # Optional thematic context
+def format_docs(docs: list[Document]) -> str:
+    return pack_context(docs, _context_budget()).text
+
+
+def _record_llm(message, seconds: float, ttft: float | None = None) -> None:
+    """Telemetry for one LLM call: duration, ttft and token usage when the provider reports it."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens")
+    completion_tokens = usage.get("output_tokens")
+    telemetry.record_span(
+        "answer.llm", seconds, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, ttft=ttft
+    )
+    if ttft is not None:
+        telemetry.record_span("answer.ttft", ttft)
+    if prompt_tokens is not None:
+        telemetry.count("llm.prompt_tokens", prompt_tokens)
+        telemetry.count("llm.completion_tokens", completion_tokens or 0)
+
+
+def _stage_timings(t0: float, t1: float, t2: float, t3: float) -> dict[str, float]:
+    """Timings from the retrieve / format / llm stage boundaries."""
+    timings = {
+        "retrieve": t1 - t0,
+        "format": t2 - t1,
+        "llm": t3 - t2,
+        "total": t3 - t0,
     }
+    # everything that is neither retrieval nor the model call itself
+    timings["overhead"] = timings["total"] - timings["retrieve"] - timings["llm"]
+    return timings
+
+
+@dataclass
+class AnswerResult:
+    """Answer text, the cited passages (numbered as in the prompt) and per-stage timings (seconds)."""
+    answer: str
+    docs: list[Document]
+    timings: dict[str, float] = field(default_factory=dict)
+    context_tokens: int = 0
+
+
+def build_llm(**kwargs) -> ChatOpenAI:
+    """The answering chat model; kwargs override the client defaults (e.g. max_retries)."""
+    # stream_usage: token counts also arrive with streamed answers
+    return ChatOpenAI(model="gpt-5-mini", temperature=0.2, stream_usage=True, **kwargs)
+
+
+class AnswerEngine:
+    """
+    Long-lived question answering pipeline.
+    Holds the LLM client, the prompt and the retriever; each question is
+    retrieved exactly once and the same docs feed the context and the sources.
+    """
+
+    def __init__(self, retriever, llm=None, topic: str = TOPIC, max_context_tokens: int | None = None):
+        self.retriever = retriever
+        self.llm = llm if llm is not None else build_llm()
+        self.prompt = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+        self.parser = StrOutputParser()
+        self.topic = topic
+        self.max_context_tokens = max_context_tokens or _context_budget()
+
+    def retrieve(self, question: str, search_filter: SearchFilter | None = None) -> list[Document]:
+        """Chunks for the question, only from documents matching search_filter if given."""
+        with telemetry.span("answer.retrieve", filtered=search_filter is not None) as sp:
+            docs = filter_retriever(self.retriever, search_filter).invoke(question)
+            sp.set(chunks=len(docs))
+        return docs
+
+    @property
+    def embed_query(self):
+        """Query embedding function of the underlying vector store, if there is one."""
+        vectorstore = getattr(self.retriever, "vectorstore", None)
+        # a collection router has no single store, only the shared query embeddings
+        embeddings = getattr(vectorstore, "embeddings", None) or getattr(self.retriever, "embeddings", None)
+        return embeddings.embed_query if embeddings is not None else None
+
+    def pack(self, docs: list[Document]) -> PackedContext:
+        """Token-budgeted context for the retrieved chunks."""
+        packed = pack_context(docs, self.max_context_tokens)
+        print(
+            f"[INFO] Context: {packed.tokens} tokens in {len(packed.docs)} passages "
+            f"from {len(docs)} chunks ({packed.tokens_saved} tokens saved)"
+        )
+        telemetry.count("answer.context_tokens", packed.tokens)
+        telemetry.count("answer.context_tokens_saved", packed.tokens_saved)
+        return packed
+
+    def build_messages(self, question: str, packed: PackedContext):
+        # routed answers name the topics of the collections the passages came from
+        topic_of = getattr(self.retriever, "topic_of", None)
+        topic = (topic_of(packed.docs) if topic_of is not None else None) or self.topic
+        return self.prompt.format_messages(
+            topic=topic,
+            question=question,
+            context=packed.text,
+        )
 
-    chain = inputs | prompt | llm | StrOutputParser()
+    def answer(self, question: str, search_filter: SearchFilter | None = None) -> AnswerResult:
+        t0 = time.perf_counter()
+        docs = self.retrieve(question, search_filter)
+        t1 = time.perf_counter()
+        packed = self.pack(docs)
+        messages = self.build_messages(question, packed)
+        t2 = time.perf_counter()
+        message = self.llm.invoke(messages)
+        answer = self.parser.invoke(message)
+        t3 = time.perf_counter()
+        _record_llm(message, t3 - t2)
+
+        return AnswerResult(
+            answer=answer, docs=packed.docs, timings=_stage_timings(t0, t1, t2, t3), context_tokens=packed.tokens
+        )
 
-    answer = chain.invoke(input=question)
+    async def aanswer(self, question: str, search_filter: SearchFilter | None = None) -> AnswerResult:
+        """Async variant of answer(), for running many questions concurrently."""
+        t0 = time.perf_counter()
+        with telemetry.span("answer.retrieve", filtered=search_filter is not None) as sp:
+            docs = await filter_retriever(self.retriever, search_filter).ainvoke(question)
+            sp.set(chunks=len(docs))
+        t1 = time.perf_counter()
+        packed = self.pack(docs)
+        messages = self.build_messages(question, packed)
+        t2 = time.perf_counter()
+        message = await self.llm.ainvoke(messages)
+        answer = self.parser.invoke(message)
+        t3 = time.perf_counter()
+        _record_llm(message, t3 - t2)
+
+        return AnswerResult(
+            answer=answer, docs=packed.docs, timings=_stage_timings(t0, t1, t2, t3), context_tokens=packed.tokens
+        )
+
+    def stream(self, question: str, search_filter: SearchFilter | None = None) -> "AnswerStream":
+        """Retrieve now, then stream the answer tokens (see AnswerStream)."""
+        return AnswerStream(self, question, search_filter)
+
+
+class AnswerStream:
+    """
+    Iterate to receive answer tokens as the LLM produces them.
+    `result.docs` (the cited passages) is available right away; `result.answer` and `result.timings`
+    (including ttft, the time from question to first token) once iteration ends.
+    """
+
+    def __init__(self, engine: "AnswerEngine", question: str, search_filter: SearchFilter | None = None):
+        self.engine = engine
+        self._t0 = time.perf_counter()
+        docs = engine.retrieve(question, search_filter)
+        t1 = time.perf_counter()
+        packed = engine.pack(docs)
+        self._messages = engine.build_messages(question, packed)
+        self._t2 = time.perf_counter()
+        self.result = AnswerResult(
+            answer="",
+            docs=packed.docs,
+            timings={"retrieve": t1 - self._t0, "format": self._t2 - t1},
+            context_tokens=packed.tokens,
+        )
 
-    return answer
+    def __iter__(self):
+        parts = []
+        ttft = None
+        last = None
+        for chunk in self.engine.llm.stream(self._messages):
+            # the usage totals come with the final chunk
+            if getattr(chunk, "usage_metadata", None):
+                last = chunk
+            token = chunk.text
+            if not token:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - self._t0
+            parts.append(token)
+            yield token
+        t3 = time.perf_counter()
+        _record_llm(last, t3 - self._t2, ttft)
+
+        timings = self.result.timings
+        timings["ttft"] = ttft if ttft is not None else t3 - self._t0
+        timings["llm"] = t3 - self._t2
+        timings["total"] = t3 - self._t0
+        timings["overhead"] = timings["total"] - timings["retrieve"] - timings["llm"]
+        self.result.answer = "".join(parts)
+
+
+# one engine per retriever, so repeated calls reuse the LLM client and prompt
+_engine: AnswerEngine | None = None
+
+def get_answer_engine(retriever) -> AnswerEngine:
+    """Return the shared engine for this retriever, building it on first use."""
+    global _engine
+    if _engine is None or _engine.retriever is not retriever:
+        _engine = AnswerEngine(retriever)
+    return _engine
 
+
+def generate_answer_chain(retriever, question):
+    return get_answer_engine(retriever).answer(question).answer
@@ -0,0 +1,165 @@
+# built-in libs
+from dataclasses import dataclass, field
+from pathlib import Path
+import itertools
+import os
+import threading
+import time
+import traceback
+
+
+class IngestBusyError(RuntimeError):
+    """Another ingest (in this or another process) is already writing the index."""
+
+
+class InterProcessLock:
+    """
+    Non-blocking exclusive lock on a file, released by the OS if the holder dies.
+    Uses flock on POSIX and msvcrt.locking on Windows.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.name == "nt":
+                import msvcrt
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        # leave a hint for whoever finds the lock taken
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        if os.name == "nt":
+            import msvcrt
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def holder(self) -> str:
+        """Pid written by the current holder (best effort)."""
+        try:
+            return self.path.read_text().strip() or "unknown"
+        except OSError:
+            return "unknown"
+
+
+@dataclass
+class IngestProgress:
+    kind: str
+    total_files: int = 0
+    done_files: int = 0
+    chunks: int = 0
+    current_file: str | None = None
+    started_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    error: str | None = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def fraction(self) -> float:
+        return self.done_files / self.total_files if self.total_files else 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.done_files / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        """Seconds left at the current rate, None until the first file is done."""
+        rate = self.files_per_second
+        if not rate:
+            return None
+        return (self.total_files - self.done_files) / rate
+
+
+class IngestJob:
+    """
+    Runs an ingest function in a background thread while holding the
+    inter-process lock. `target(progress=callback)` must return the new retriever,
+    which is handed to `on_done`.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, kind: str, target, lock: InterProcessLock, on_done=None):
+        self.id = next(self._ids)
+        self.progress = IngestProgress(kind=kind)
+        self._target = target
+        self._lock = lock
+        self._on_done = on_done
+        self._thread = threading.Thread(target=self._run, name=f"ingest-{kind}-{self.id}", daemon=True)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _report(self, done: int, total: int, name: str, n_chunks: int) -> None:
+        p = self.progress
+        p.done_files, p.total_files, p.current_file = done, total, name
+        p.chunks += n_chunks
+
+    def _run(self) -> None:
+        try:
+            retriever = self._target(progress=self._report)
+            if self._on_done is not None:
+                self._on_done(retriever)
+        except Exception as e:
+            traceback.print_exc()
+            self.progress.error = f"{type(e).__name__}: {e}"
+        finally:
+            self.progress.finished_at = time.time()
+            self._lock.release()
+
+
+class IngestJobs:
+    """Registry of the latest ingest job per index, shared by all sessions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: dict[str, IngestJob] = {}
+
+    def current(self, key: str) -> IngestJob | None:
+        with self._lock:
+            return self._jobs.get(key)
+
+    def start(self, key: str, kind: str, target, lock_path: Path, on_done=None) -> IngestJob:
+        """Start a background ingest; raises IngestBusyError if one is already running."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.running:
+                raise IngestBusyError("An ingest is already running in this app.")
+
+            lock = InterProcessLock(lock_path)
+            if not lock.acquire():
+                raise IngestBusyError(f"An ingest is already running in another process (pid {lock.holder()}).")
+
+            job = IngestJob(kind, target, lock, on_done)
+            self._jobs[key] = job
+            job.start()
+            return job
@@ -0,0 +1,321 @@
+# built-in libs
+from array import array
+from pathlib import Path
+import math
+import os
+import pickle
+import re
+
+# extra libs
+import numpy as np
+
+# langchain libs
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# project libs
+from doc_index import source_of
+import telemetry
+
+
+INDEX_FILENAME = "lexical_index.pkl"
+# search filters whose allowed doc numbers are kept
+_FILTER_CACHE_SIZE = 64
+
+# identifiers such as miR-369-3p, AGO2, let-7a or 3'UTR stay whole
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased tokens; hyphenated identifiers also yield their parts."""
+    tokens = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        tokens.append(tok)
+        if "-" in tok or "." in tok:
+            tokens.extend(p for p in re.split(r"[-.]", tok) if len(p) > 1)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    Persistent BM25 inverted index over chunk texts.
+    Postings are two parallel arrays per term (doc numbers as uint32, term
+    frequencies as uint16), so they stay close to 6 bytes per posting and are
+    scored with numpy without copying. Only the postings are compact: the
+    chunk id list and dict are plain Python objects, and save()/load() pickle
+    the whole index at once. Deleted chunks are tombstoned and squeezed out by
+    compact().
+    """
+
+    def __init__(self, path: Path | None = None, k1: float = 1.2, b: float = 0.75, max_df: float = 0.25):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        # terms in more than this share of chunks carry ~no BM25 weight and are
+        # skipped at query time; it keeps lookups proportional to rare terms
+        self.max_df = max_df
+        self.terms: dict[str, int] = {}
+        self.post_docs: list[array] = []
+        self.post_tfs: list[array] = []
+        self.chunk_ids: list[str | None] = []   # doc number -> chunk id (None = deleted)
+        self.doc_lens = array("I")
+        self.doc_numbers: dict[str, int] = {}   # chunk id -> doc number
+        self.total_len = 0
+        self.n_deleted = 0
+        # arrays derived for search(): length norms, live mask, source codes; reset by every update
+        self._derived: dict = {}
+        # set of source files -> their doc numbers, one entry per search filter in use
+        self._docs_of: dict[frozenset, np.ndarray] = {}
+
+    # --------- updates ---------
+
+    def __len__(self) -> int:
+        return len(self.doc_numbers)
+
+    def add(self, chunk_ids: list[str], texts: list[str]) -> None:
+        self._derived, self._docs_of = {}, {}
+        for chunk_id, text in zip(chunk_ids, texts):
+            if chunk_id in self.doc_numbers:
+                self.delete([chunk_id])
+            doc = len(self.chunk_ids)
+            tokens = tokenize(text)
+            counts: dict[str, int] = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                term = self.terms.get(tok)
+                if term is None:
+                    term = self.terms[tok] = len(self.post_docs)
+                    self.post_docs.append(array("I"))
+                    self.post_tfs.append(array("H"))
+                self.post_docs[term].append(doc)
+                self.post_tfs[term].append(min(tf, 65535))
+            self.chunk_ids.append(chunk_id)
+            self.doc_lens.append(len(tokens))
+            self.doc_numbers[chunk_id] = doc
+            self.total_len += len(tokens)
+
+    def delete(self, chunk_ids) -> None:
+        self._derived, self._docs_of = {}, {}
+        for chunk_id in chunk_ids:
+            doc = self.doc_numbers.pop(chunk_id, None)
+            if doc is None:
+                continue
+            self.chunk_ids[doc] = None
+            self.total_len -= self.doc_lens[doc]
+            self.n_deleted += 1
+        # postings of deleted chunks are dead weight for every query
+        if self.n_deleted > 0.2 * max(1, len(self.chunk_ids)):
+            self.compact()
+
+    def compact(self) -> None:
+        """Renumber live chunks and drop tombstoned postings."""
+        remap = array("i", [-1]) * len(self.chunk_ids)
+        new_ids, new_lens = [], array("I")
+        for doc, chunk_id in enumerate(self.chunk_ids):
+            if chunk_id is not None:
+                remap[doc] = len(new_ids)
+                new_ids.append(chunk_id)
+                new_lens.append(self.doc_lens[doc])
+
+        terms, post_docs, post_tfs = {}, [], []
+        for tok, term in self.terms.items():
+            docs, tfs = array("I"), array("H")
+            for doc, tf in zip(self.post_docs[term], self.post_tfs[term]):
+                if remap[doc] >= 0:
+                    docs.append(remap[doc])
+                    tfs.append(tf)
+            if docs:
+                terms[tok] = len(post_docs)
+                post_docs.append(docs)
+                post_tfs.append(tfs)
+
+        self.terms, self.post_docs, self.post_tfs = terms, post_docs, post_tfs
+        self.chunk_ids, self.doc_lens = new_ids, new_lens
+        self.doc_numbers = {chunk_id: doc for doc, chunk_id in enumerate(new_ids)}
+        self.n_deleted = 0
+        self._derived, self._docs_of = {}, {}
+
+    # --------- queries ---------
+
+    def _arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """BM25 length normalisation k1 * (1 - b + b * len / avg_len) and the live mask, per doc number."""
+        arrays = self._derived.get("norm")
+        if arrays is None:
+            lens = np.array(self.doc_lens, dtype=np.float32)
+            avg_len = self.total_len / max(1, len(self.doc_numbers))
+            norm = self.k1 * (1 - self.b + self.b * lens / avg_len)
+            live = np.fromiter((c is not None for c in self.chunk_ids), dtype=bool, count=len(self.chunk_ids))
+            arrays = self._derived["norm"] = (norm, live)
+        return arrays
+
+    def docs_of(self, sources: frozenset) -> np.ndarray:
+        """Live doc numbers of the chunks of the given source files, cached per set of sources."""
+        docs = self._docs_of.get(sources)
+        if docs is None:
+            if "source_codes" not in self._derived:
+                names: dict[str, int] = {}
+                codes = [-1 if c is None else names.setdefault(source_of(c), len(names)) for c in self.chunk_ids]
+                self._derived["source_codes"] = (np.array(codes, dtype=np.int32), names)
+            codes, names = self._derived["source_codes"]
+            docs = np.flatnonzero(np.isin(codes, [names[s] for s in sources if s in names]))
+            if len(self._docs_of) >= _FILTER_CACHE_SIZE:
+                self._docs_of.clear()
+            self._docs_of[sources] = docs
+        return docs
+
+    def search(self, query: str, k: int = 10, allowed: np.ndarray | None = None) -> list[tuple[str, float]]:
+        """Top-k (chunk id, BM25 score) for the query, among the `allowed` doc numbers (see docs_of) if given."""
+        n_docs = len(self.doc_numbers)
+        if not n_docs:
+            return []
+        norm, live = self._arrays()
+        if allowed is not None:
+            if not len(allowed):
+                return []
+            mask = np.zeros(len(live), dtype=bool)
+            mask[allowed] = True
+            live = live & mask
+
+        scores = np.zeros(len(live), dtype=np.float32)
+        matched = []
+        for tok in set(tokenize(query)):
+            term = self.terms.get(tok)
+            if term is None:
+                continue
+            df = len(self.post_docs[term])
+            if df > self.max_df * n_docs and n_docs > 100:
+                continue
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            # zero-copy views of the posting arrays
+            docs = np.frombuffer(self.post_docs[term], dtype=np.uint32)
+            tfs = np.frombuffer(self.post_tfs[term], dtype=np.uint16).astype(np.float32)
+            # a term lists each doc once, so a plain scatter-add is exact
+            scores[docs] += idf * (self.k1 + 1) * tfs / (tfs + norm[docs])
+            matched.append(docs)
+        if not matched:
+            return []
+
+        # one term: its postings; more: every doc with a positive score
+        candidates = matched[0] if len(matched) == 1 else np.flatnonzero(scores)
+        candidates = candidates[live[candidates]]
+        if not len(candidates):
+            return []
+        cand_scores = scores[candidates]
+        if len(candidates) > k:
+            top = np.argpartition(-cand_scores, k - 1)[:k]
+            candidates, cand_scores = candidates[top], cand_scores[top]
+        # best first; ties in doc number (insertion) order
+        order = np.lexsort((candidates, -cand_scores))
+        return [(self.chunk_ids[doc], float(score)) for doc, score in zip(candidates[order].tolist(), cand_scores[order].tolist())]
+
+    # --------- persistence ---------
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        state = {k: v for k, v in self.__dict__.items() if k not in ("path", "_derived", "_docs_of")}
+        with tmp_path.open("wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, path: Path) -> "LexicalIndex":
+        index = cls(path)
+        with path.open("rb") as f:
+            index.__dict__.update(pickle.load(f))
+        return index
+
+
+def open_lexical_index(chroma_dir: Path, vectordb, rebuild: bool = False) -> LexicalIndex:
+    """
+    Load the lexical index stored next to the Chroma files. It is rebuilt from
+    the chunks in Chroma when it is missing, unreadable, or rebuild=True.
+    """
+    path = chroma_dir / INDEX_FILENAME
+    if path.exists() and not rebuild:
+        try:
+            return LexicalIndex.load(path)
+        except Exception as e:
+            print(f"[WARN] Rebuilding unreadable lexical index '{path}': {e}")
+
+    index = LexicalIndex(path)
+    offset, page = 0, 5000
+    while True:
+        batch = vectordb.get(include=["documents"], limit=page, offset=offset)
+        if not batch["ids"]:
+            break
+        index.add(batch["ids"], batch["documents"])
+        offset += len(batch["ids"])
+        if len(batch["ids"]) < page:
+            break
+    if len(index):
+        index.save()
+    return index
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense (Chroma) + lexical (BM25) retrieval fused with reciprocal rank fusion.
+    Exact identifiers that embeddings blur (miR-369-3p, FXR1) are found by the
+    lexical side; paraphrases by the dense side. `dense` replaces Chroma for the
+    vector search (e.g. a CompactIndex); without `lexical` it is dense-only.
+    """
+
+    vectorstore: object
+    lexical: object = None
+    dense: object = None
+    k: int = 10
+    fetch_k: int = 30
+    rrf_k: int = 60
+    where: dict | None = None   # Chroma metadata filter for the dense side
+    sources: frozenset | None = None   # the source files `where` admits, for the lexical and compact sides
+    query_vector: list[float] | None = None   # the question's embedding, if computed already (by the router)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        sources = self.sources
+        if sources is None and self.where is not None:
+            # not resolved by filter_retriever: ask Chroma which chunks match
+            sources = frozenset(source_of(c) for c in self.vectorstore.get(where=self.where, include=[])["ids"])
+        lexical = []
+        if self.lexical is not None:
+            allowed = None
+            if sources is not None:
+                # BM25 only scores chunks of the matching documents
+                allowed = self.lexical.docs_of(sources)
+                if not len(allowed):
+                    return []
+            with telemetry.span("retrieval.lexical", k=self.fetch_k, filtered=allowed is not None):
+                lexical = self.lexical.search(query, k=self.fetch_k, allowed=allowed)
+        dense_store = self.dense if self.dense is not None else self.vectorstore
+        dense_kwargs = {"filter": self.where}
+        if self.dense is not None:
+            dense_kwargs["sources"] = sources
+        with telemetry.span("retrieval.dense", k=self.fetch_k, backend=type(dense_store).__name__):
+            if self.query_vector is not None:
+                dense = dense_store.similarity_search_by_vector(self.query_vector, k=self.fetch_k, **dense_kwargs)
+            else:
+                dense = dense_store.similarity_search(query, k=self.fetch_k, **dense_kwargs)
+
+        scores: dict[str, float] = {}
+        docs: dict[str, Document] = {}
+        for rank, doc in enumerate(dense):
+            scores[doc.id] = scores.get(doc.id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            docs[doc.id] = doc
+        for rank, (chunk_id, _) in enumerate(lexical):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        top = sorted(scores, key=scores.get, reverse=True)[:self.k]
+
+        # lexical-only hits still need their text and metadata
+        missing = [chunk_id for chunk_id in top if chunk_id not in docs]
+        if missing:
+            got = self.vectorstore.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, text, meta in zip(got["ids"], got["documents"], got["metadatas"]):
+                docs[chunk_id] = Document(id=chunk_id, page_content=text, metadata=meta or {})
+
+        return [docs[chunk_id] for chunk_id in top if chunk_id in docs]
@@ -1,20 +1,20 @@
 # project libs
 from env_handler import load_paths
-from state_machine import KBState, detect_kb_state
+from state_machine import KBState, built_collections, detect_kb_state
 from streamlit_app import *
 
 
 def main():
+    # setup common GUI elements (incl. the collection selector)
+    init_user_interface()
+
     # initialize environment and data
-    datasets_dir, chroma_dir, metadata_path = load_paths()
+    datasets_dir, chroma_dir, metadata_path = load_paths(selected_collection().name)
 
     # define KB state
     kb_state, kb_info = detect_kb_state(datasets_dir, metadata_path)
     print(f"Knowledge Base State: {kb_state.name}")
 
-    # setup common GUI elements
-    init_user_interface()
-
     # act according to state
     if kb_info["total_pdfs"] > 0:
         processed = kb_info["processed"]
@@ -23,10 +23,11 @@ def main():
         # display global KB status indicator
         kb_status_indicator(processed, total)
 
-    if kb_state in (KBState.NO_DATA, KBState.EMPTY):
+    # questions can still go to the other collections while this one is empty
+    if kb_state in (KBState.NO_DATA, KBState.EMPTY) and not built_collections():
         show_quick_start(datasets_dir)
 
-    elif kb_state in (KBState.UP_TO_DATE, KBState.OUTDATED):
+    else:
         show_main_tabs(datasets_dir, kb_info)    
 
 if __name__ == '__main__':
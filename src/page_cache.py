@@ -0,0 +1,111 @@
+# built-in libs
+from pathlib import Path
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+# langchain libs
+from langchain_core.documents import Document
+
+
+# bump when the cleaning/extraction/metadata steps change what a page looks like
+PAGE_FORMAT = 1
+
+
+class PageCache:
+    """
+    Extracted page texts per PDF, keyed by file hash, zlib-compressed in SQLite.
+    Rebuilding or re-chunking a file whose bytes did not change skips the
+    pikepdf re-save and the pypdf text extraction. Least recently used files
+    are evicted once the cache grows beyond max_bytes. Safe to use from the
+    ingest worker processes (WAL, busy timeout).
+    """
+
+    def __init__(self, cache_path: Path, max_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(cache_path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                last_used INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_pages_last_used ON pages(last_used);
+            CREATE TABLE IF NOT EXISTS cache_size (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                rows INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_size VALUES (0, 0, 0);
+            CREATE TRIGGER IF NOT EXISTS pages_ins AFTER INSERT ON pages BEGIN
+                UPDATE cache_size SET rows = rows + 1, bytes = bytes + LENGTH(NEW.payload) WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS pages_del AFTER DELETE ON pages BEGIN
+                UPDATE cache_size SET rows = rows - 1, bytes = bytes - LENGTH(OLD.payload) WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS pages_upd AFTER UPDATE OF payload ON pages BEGIN
+                UPDATE cache_size SET bytes = bytes - LENGTH(OLD.payload) + LENGTH(NEW.payload) WHERE id = 0;
+            END;
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(file_hash: str) -> str:
+        return f"{PAGE_FORMAT}:{file_hash}"
+
+    def get(self, file_hash: str) -> list[Document] | None:
+        key = self.key(file_hash)
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM pages WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE pages SET last_used = ? WHERE key = ?", (int(time.time()), key))
+            self._conn.commit()
+        pages = json.loads(zlib.decompress(row[0]))
+        return [Document(page_content=text, metadata=meta) for text, meta in pages]
+
+    def put(self, file_hash: str, pages: list[Document]) -> None:
+        payload = zlib.compress(
+            json.dumps([[p.page_content, p.metadata] for p in pages], ensure_ascii=False).encode("utf-8"), 6
+        )
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO pages (key, payload, last_used) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET payload = excluded.payload, last_used = excluded.last_used
+                """,
+                (self.key(file_hash), payload, int(time.time())),
+            )
+            self._conn.commit()
+            self._evict()
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows, size = self._size()
+        return {"files": rows, "bytes": size}
+
+    def _size(self) -> tuple[int, int]:
+        return self._conn.execute("SELECT rows, bytes FROM cache_size WHERE id = 0").fetchone()
+
+    def _evict(self) -> None:
+        """Drop least recently used files until the cache is below 90% of max_bytes."""
+        rows, size = self._size()
+        if size <= self.max_bytes or rows == 0:
+            return
+        n_drop = int((size - 0.9 * self.max_bytes) / (size / rows)) + 1
+        self._conn.execute(
+            "DELETE FROM pages WHERE key IN (SELECT key FROM pages ORDER BY last_used LIMIT ?)",
+            (n_drop,),
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
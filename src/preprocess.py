@@ -1,176 +1,713 @@
 # built-in libs
 from pathlib import Path
+from collections import deque
+from contextlib import contextmanager
+import hashlib
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
 import tempfile
-
-# extra libs
-from pikepdf import Pdf, PdfError
-from pypdf.errors import PdfReadError
+import threading
+import time
 
 # langchain libs
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
 
 # project libs
-from env_handler import load_paths
+from env_handler import load_paths, load_cache_dir, env_flag, env_int, env_float
+from chroma_store import close_chroma, update_metadatas
+from chunker import SectionChunker
+from compact_index import open_compact_index
+from doc_index import BIB_FIELDS, DocumentTable, bibliography, documents_path, pdf_info
+from embedding_cache import CachedEmbeddings
+from embedding_scheduler import ScheduledEmbeddings
+from lexical_index import HybridRetriever, open_lexical_index
+from page_cache import PageCache
+from rerank import build_rerank_retriever, rerank_enabled
+from router import CentroidDelta, save_centroid
+from snapshots import (
+    begin_snapshot, discard_snapshot, index_dir, pending_snapshot, publish_snapshot, snapshot_metadata_path,
+)
 from state_machine import *
+import telemetry
 
 
 # --------- common helpers ---------
-
-def _build_splitter() -> RecursiveCharacterTextSplitter:
-    """Shared text splitter config."""
-    return RecursiveCharacterTextSplitter(
-        chunk_size=1200,     # ~350 tokens
-        chunk_overlap=200,   # ~50–60 tokens
+# The PDF and splitter libraries are imported by the functions that use them:
+# opening an index to answer questions does not need them, only an ingest does.
+
+def _build_splitter():
+    """Shared chunker config (CHUNKER / CHUNK_SIZE / CHUNK_OVERLAP / CHUNK_REFERENCES to experiment)."""
+    if os.getenv("CHUNKER", "section").strip().lower() == "recursive":
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        return RecursiveCharacterTextSplitter(
+            chunk_size=env_int("CHUNK_SIZE", 1200),       # ~350 tokens
+            chunk_overlap=env_int("CHUNK_OVERLAP", 200),  # ~50–60 tokens
+            add_start_index=True,  # char offset in the page, part of the chunk id
+        )
+    # section-bounded chunks without overlap; reference lists dropped
+    return SectionChunker(
+        chunk_size=env_int("CHUNK_SIZE", 1200),
+        drop_references=os.getenv("CHUNK_REFERENCES", "drop").strip().lower() != "keep",
     )
 
-def _clean_pdf_to_temp(original_path: Path, tmp_dir: Path) -> Path:
+def _clean_pdf_to_temp(original_path: Path, tmp_dir: Path) -> tuple[Path, dict]:
     """
     Create a cleaned temporary copy of the given PDF using pikepdf.
     The original file (with highlights) is left untouched.
-    Returns the path to the cleaned temp file.
+    Returns the path to the cleaned temp file and the PDF's own metadata (see doc_index.pdf_info).
     """
+    from pikepdf import Pdf, PdfError
     clean_path = tmp_dir / original_path.name
     try:
         with Pdf.open(original_path) as pdf:
+            info = pdf_info(pdf)
             pdf.save(clean_path)
     except PdfError as e:
         # If cleaning fails, re-raise so caller can decide what to do
         raise PdfError(f"Failed to clean PDF '{original_path}': {e}") from e
-    return clean_path
+    return clean_path, info
+
+
+@contextmanager
+def _file_deadline(seconds: float | None):
+    """Raise TimeoutError inside the block after `seconds` (POSIX main thread only)."""
+    if (
+        not seconds
+        or not hasattr(signal, "SIGALRM")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+
+    def _on_alarm(signum, frame):
+        raise TimeoutError
+
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
 
+_page_cache_instance: PageCache | None = None
 
-def _load_pdfs(pdf_paths: list[Path]):
-    """Load all PDFs into a flat list of Documents, skipping unreadable files.
-    Each original PDF is first cleaned into a temporary copy.
+def _page_cache() -> PageCache | None:
+    """Per-process cache of extracted pages (PAGE_CACHE_*); None when disabled."""
+    global _page_cache_instance
+    if env_flag("PAGE_CACHE_DISABLED"):
+        return None
+    if _page_cache_instance is None:
+        _page_cache_instance = PageCache(
+            load_cache_dir() / "pages.sqlite3",
+            max_bytes=env_int("PAGE_CACHE_MAX_MB", 1024) * 1024 * 1024,
+        )
+    return _page_cache_instance
+
+
+def _process_pdf(path: Path, file_timeout: float | None = None, file_hash: str | None = None):
     """
-    docs = []
+    Clean -> load -> split a single PDF (runs inside a pool worker).
+    With a file_hash, the extracted pages are also stored in the page cache.
+    Returns (chunks, warning); chunks is None when the file has to be skipped.
+    """
+    from langchain_community.document_loaders import PyPDFLoader
+    from pikepdf import PdfError
+    from pypdf.errors import PdfReadError
+    try:
+        with _file_deadline(file_timeout), tempfile.TemporaryDirectory() as tmpdir_str:
+            # 1) make cleaned temp copy
+            clean_path, info = _clean_pdf_to_temp(path, Path(tmpdir_str))
+
+            # 2) load from cleaned copy; cite the original file, not the temp copy.
+            # Every chunk carries the paper's title/authors/year/doi for filtering
+            pages = PyPDFLoader(str(clean_path)).load()
+            bib = bibliography(info, pages[0].page_content if pages else "", path.stem)
+            for page in pages:
+                page.metadata["source"] = path.name
+                page.metadata.update(bib)
+
+            cache = _page_cache() if file_hash is not None else None
+            if cache is not None:
+                cache.put(file_hash, pages)
+
+            # 3) split
+            chunks = _build_splitter().split_documents(pages)
+
+    except (PdfError, PdfReadError) as e:
+        return None, f"Skipping problematic PDF '{path.name}': {e}"
+    except TimeoutError:
+        return None, f"Skipping PDF '{path.name}': timed out after {file_timeout:.0f}s"
+    except Exception as e:
+        return None, f"Unexpected error for '{path.name}': {e}"
+
+    return chunks, None
+
+
+def _report(path: Path, outcome, started: float) -> list | None:
+    """Print the worker warning (if any) and return the chunks to keep."""
+    if isinstance(outcome, BaseException):
+        print(f"[WARN] Unexpected error for '{path.name}': {outcome}")
+        chunks = None
+    else:
+        chunks, warning = outcome
+        if warning:
+            print(f"[WARN] {warning}")
+    telemetry.record_span(
+        "ingest.parse_file",
+        time.monotonic() - started,
+        file=path.name,
+        chunks=len(chunks) if chunks is not None else 0,
+        skipped=chunks is None,
+    )
+    return chunks
+
 
-    # temp directory is automatically deleted when context exits
-    with tempfile.TemporaryDirectory() as tmpdir_str:
-        tmpdir = Path(tmpdir_str)
+# extra seconds the parent waits before killing a worker stuck in C code
+_KILL_GRACE = 10.0
 
+def _iter_pdf_chunks(
+    pdf_paths: list[Path],
+    workers: int | None = None,
+    file_timeout: float | None = None,
+    hashes: dict[str, str] | None = None,
+    parse=_process_pdf,
+):
+    """
+    Yield (path, chunks) for every PDF; chunks is None for skipped (unreadable) files.
+    Files are cleaned, loaded and split in a process pool (INGEST_WORKERS,
+    default: CPU count) and yielded as soon as each one finishes. A file that
+    takes longer than INGEST_FILE_TIMEOUT seconds is skipped with a warning.
+    This holds for a single file too: the pool worker is killed from here, which
+    works from any thread (a SIGALRM deadline only fires on the main thread,
+    and Streamlit and background ingests never run there).
+    With the file hashes given, files found in the page cache are only split
+    again, and the pages of parsed files are added to it.
+    """
+    cache = _page_cache() if hashes else None
+    if cache is not None:
+        to_parse = []
         for path in pdf_paths:
+            with telemetry.span("ingest.split_cached", file=path.name) as sp:
+                pages = cache.get(hashes[path.name])
+                if pages is not None:
+                    for page in pages:
+                        page.metadata["source"] = path.name  # same bytes, maybe a new name
+                    chunks = _build_splitter().split_documents(pages)
+                    sp.set(chunks=len(chunks))
+            if pages is None:
+                to_parse.append(path)
+                continue
+            yield path, chunks
+        if len(to_parse) < len(pdf_paths):
+            print(f"[INFO] Page cache: {len(pdf_paths) - len(to_parse)} of {len(pdf_paths)} PDFs not re-parsed")
+        pdf_paths = to_parse
+        if not pdf_paths:
+            return
+    file_hashes = hashes if cache is not None else {}
+
+    if workers is None:
+        workers = env_int("INGEST_WORKERS", os.cpu_count() or 1)
+    if file_timeout is None:
+        file_timeout = env_float("INGEST_FILE_TIMEOUT", 300.0)
+    workers = max(1, min(workers, len(pdf_paths)))
+
+    if not file_timeout:
+        # INGEST_FILE_TIMEOUT=0: no deadline to enforce, parse in this process
+        for path in pdf_paths:
+            started = time.monotonic()
+            yield path, _report(path, parse(path, None, file_hashes.get(path.name)), started)
+        return
+
+    # spawn, not fork: the Streamlit/Chroma parent process is multi-threaded
+    ctx = multiprocessing.get_context("spawn")
+    todo = deque(pdf_paths)
+    results = queue.Queue()
+    running: dict[int, tuple[Path, float, float]] = {}  # task id -> (path, kill deadline, start)
+    task_ids = itertools.count()
+    pool = ctx.Pool(workers)
+
+    def submit(path: Path):
+        tid = next(task_ids)
+        now = time.monotonic()
+        running[tid] = (path, now + file_timeout + _KILL_GRACE, now)
+        pool.apply_async(
+            parse,
+            (path, file_timeout, file_hashes.get(path.name)),
+            callback=lambda outcome, tid=tid: results.put((tid, outcome)),
+            error_callback=lambda exc, tid=tid: results.put((tid, exc)),
+        )
+
+    try:
+        while todo or running:
+            # at most one file per worker in flight: bounded memory, honest deadlines
+            while todo and len(running) < workers:
+                submit(todo.popleft())
+
             try:
-                # 1) make cleaned temp copy
-                clean_path = _clean_pdf_to_temp(path, tmpdir)
+                tid, outcome = results.get(timeout=1.0)
+            except queue.Empty:
+                tid = None
+
+            # results of a killed pool can still arrive late; ignore them
+            if tid in running:
+                path, _, started = running.pop(tid)
+                yield path, _report(path, outcome, started)
+
+            # backstop for workers that never reach their own alarm
+            now = time.monotonic()
+            expired = [tid for tid, (_, deadline, _) in running.items() if now > deadline]
+            if expired:
+                for tid in expired:
+                    path, _, _ = running.pop(tid)
+                    print(f"[WARN] Skipping PDF '{path.name}': timed out after {file_timeout:.0f}s")
+                    yield path, None
+
+                # Pool can only be killed as a whole; requeue the innocent files
+                todo.extendleft(reversed([path for path, _, _ in running.values()]))
+                running.clear()
+                pool.terminate()
+                pool.join()
+                pool = ctx.Pool(workers)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+_embeddings_instances: dict[tuple, object] = {}
+_embeddings_lock = threading.Lock()
+
+def _build_embeddings():
+    """
+    Per-process embeddings client (one per configuration): every store opened by
+    this process shares its scheduler threads, AIMD concurrency state and cache
+    connection, instead of leaking a set of them per restore, snapshot or ingest.
+    """
+    scheduler = None if env_flag("EMBED_SCHEDULER_DISABLED") else (
+        env_int("EMBED_BATCH_TOKENS", 8000),
+        env_int("EMBED_CONCURRENCY", 4),
+        env_int("EMBED_MAX_CONCURRENCY", 16),
+        env_int("EMBED_MAX_RETRIES", 6),
+    )
+    cache = None if env_flag("EMBED_CACHE_DISABLED") else (
+        load_cache_dir() / "embeddings.sqlite3",
+        env_int("EMBED_CACHE_MAX_MB", 2048) * 1024 * 1024,
+    )
+    # the client class is part of the key: the benchmark swaps it for a local model
+    key = (OpenAIEmbeddings, scheduler, cache)
+    with _embeddings_lock:
+        emb = _embeddings_instances.get(key)
+        if emb is None:
+            emb = _embeddings_instances[key] = _new_embeddings(scheduler, cache)
+        return emb
+
+
+def _embedding_stats(emb) -> dict:
+    """Running counters of the embeddings cache and scheduler (whichever are in use)."""
+    stats = {}
+    if isinstance(emb, CachedEmbeddings):
+        st = emb.stats()
+        stats.update(hits=st["hits"], misses=st["misses"])
+        emb = emb.inner
+    if isinstance(emb, ScheduledEmbeddings):
+        stats.update(emb.stats())
+    return stats
+
+
+def _new_embeddings(scheduler: tuple | None, cache: tuple | None):
+    emb = OpenAIEmbeddings(model="text-embedding-3-small")
+    if scheduler is not None:
+        # token-packed batches sent concurrently, adapting to latency and 429s
+        max_batch_tokens, concurrency, max_concurrency, max_retries = scheduler
+        emb = ScheduledEmbeddings(
+            emb,
+            max_batch_tokens=max_batch_tokens,
+            concurrency=concurrency,
+            max_concurrency=max_concurrency,
+            max_retries=max_retries,
+        )
+    if cache is None:
+        return emb
+    # chunks embedded before (by any build) are served from the local cache
+    cache_path, max_bytes = cache
+    cached = CachedEmbeddings(emb, cache_path, max_bytes=max_bytes)
+    if isinstance(emb, ScheduledEmbeddings):
+        # keep finished batches even if a later one fails, so a retry does not pay for them again
+        emb.on_batch = cached.store
+    return cached
+
+
+def _open_chroma(chroma_dir: Path) -> Chroma:
+    """Open (or create) the persisted Chroma collection."""
+    return Chroma(
+        persist_directory=str(chroma_dir),
+        embedding_function=_build_embeddings(),
+    )
 
-                # 2) load from cleaned copy
-                loader = PyPDFLoader(str(clean_path))
-                docs.extend(loader.load())
 
-            except (PdfError, PdfReadError) as e:
-                print(f"[WARN] Skipping problematic PDF '{path.name}': {e}")
-            except Exception as e:
-                print(f"[WARN] Unexpected error for '{path.name}': {e}")
+def _hybrid_enabled() -> bool:
+    """RETRIEVAL_MODE=dense switches the BM25 side of retrieval off."""
+    return os.getenv("RETRIEVAL_MODE", "hybrid").strip().lower() != "dense"
 
-    return docs
 
+def _open_lexical(chroma_dir: Path, vectordb: Chroma, rebuild: bool = False):
+    return open_lexical_index(chroma_dir, vectordb, rebuild) if _hybrid_enabled() else None
 
-def _build_embeddings():
-    return OpenAIEmbeddings(model="text-embedding-3-small")
 
+def _compact_enabled() -> bool:
+    """VECTOR_BACKEND=compact searches a quantized, memory-mapped copy of the vectors."""
+    return os.getenv("VECTOR_BACKEND", "chroma").strip().lower() == "compact"
 
-def _build_retriever_from_chroma(chroma_dir: Path):
-    emb = _build_embeddings()
-    vectordb = Chroma(
-        persist_directory=str(chroma_dir),
-        embedding_function=emb,
+
+def _open_compact(chroma_dir: Path, vectordb: Chroma, sync: bool = False):
+    if not _compact_enabled():
+        return None
+    index = open_compact_index(
+        chroma_dir,
+        vectordb,
+        dims=env_int("COMPACT_DIMS", 256),
+        quantization=os.getenv("COMPACT_QUANTIZATION", "int8").strip().lower(),
+        oversample=env_int("COMPACT_OVERSAMPLE", 0) or None,
     )
-    return vectordb.as_retriever(search_kwargs={"k": 10})
+    if sync:
+        index.sync()
+    return index
+
+
+def _build_retriever(vectordb: Chroma, lexical=None, compact=None):
+    # with reranking, over-fetch candidates and let the reranker keep the best few
+    k = env_int("RERANK_FETCH_K", 50) if rerank_enabled() else 10
+    if lexical is None and compact is None:
+        retriever = vectordb.as_retriever(search_kwargs={"k": k})
+    else:
+        retriever = HybridRetriever(vectorstore=vectordb, lexical=lexical, dense=compact, k=k, fetch_k=max(30, k))
+    if rerank_enabled():
+        retriever = build_rerank_retriever(retriever, vectordb)
+    return retriever
+
+
+def _build_retriever_from_chroma(chroma_dir: Path):
+    vectordb = _open_chroma(chroma_dir)
+    return _build_retriever(vectordb, _open_lexical(chroma_dir, vectordb), _open_compact(chroma_dir, vectordb))
+
+
+# --------- streaming ingest ---------
+
+def _chunk_id(doc) -> str:
+    """Deterministic id: source file + page + char offset + content hash (doc_index.source_of reads the source back)."""
+    meta = doc.metadata
+    digest = hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()[:16]
+    return f"{meta['source']}:{meta.get('page', 0)}:{meta.get('start_index', 0)}:{digest}"
+
+
+def _existing_ids(vectordb: Chroma, name: str) -> set[str]:
+    """Ids of all chunks currently stored for one source file."""
+    return set(vectordb.get(where={"source": name}, include=[])["ids"])
+
+
+def _existing_metadata(vectordb: Chroma, name: str) -> dict[str, dict]:
+    """Chunk id -> stored metadata, for all chunks of one source file."""
+    got = vectordb.get(where={"source": name}, include=["metadatas"])
+    return dict(zip(got["ids"], got["metadatas"]))
+
+
+def _stream_ingest(
+    vectordb: Chroma,
+    pdf_paths: list[Path],
+    metadata_path: Path,
+    progress=None,
+    lexical=None,
+    documents: DocumentTable | None = None,
+    centroid: CentroidDelta | None = None,
+) -> None:
+    """
+    Stream PDFs into the vector store: files -> chunks -> fixed-size batches -> upserts.
+    Only chunks whose id is not stored yet are embedded and written; stored chunks
+    of the file that no longer exist are deleted once the new ones are in.
+    At most one file per worker plus one batch (EMBED_BATCH_SIZE chunks) is held in
+    memory. A file is checkpointed as soon as all of its chunks are written, so an
+    interrupted ingest resumes after the last completed file.
+    progress(done_files, total_files, name, n_chunks) is called after every file.
+    The lexical index and the document table, if given, are updated from the same chunks,
+    and the centroid delta from the chunks written and deleted.
+    """
+    batch_size = max(1, env_int("EMBED_BATCH_SIZE", 256))
+    hashes, stats = fingerprint_files(pdf_paths, metadata_path)
+    # the embeddings client lives for the whole process: report this run's share
+    embed_before = _embedding_stats(vectordb.embeddings)
+
+    batch_docs, batch_ids = [], []
+    # files whose chunks are (partly) still in the batch:
+    # (name, chunk count once complete, stale ids to delete afterwards)
+    waiting: deque[tuple[str, int, set[str]]] = deque()
+    queued = 0
+    written = 0
+    n_added = n_kept = n_deleted = 0
+
+    def write_batch():
+        nonlocal written
+        if batch_docs:
+            with telemetry.span("ingest.write_batch", chunks=len(batch_docs)):
+                vectordb.add_documents(batch_docs, ids=batch_ids)
+            if centroid is not None:
+                centroid.added(vectordb, batch_ids)
+            telemetry.count("ingest.chunks_written", len(batch_docs))
+            if lexical is not None:
+                lexical.add(batch_ids, [d.page_content for d in batch_docs])
+            written += len(batch_docs)
+            batch_docs.clear()
+            batch_ids.clear()
+
+    def checkpoint_done():
+        nonlocal n_deleted
+        while waiting and waiting[0][1] <= written:
+            name, _, stale = waiting.popleft()
+            if stale:
+                if centroid is not None:
+                    centroid.removed(vectordb, stale)
+                vectordb.delete(ids=list(stale))
+                if lexical is not None:
+                    lexical.delete(stale)
+                n_deleted += len(stale)
+            append_checkpoint(metadata_path, name, hashes[name], stats[name])
+
+    for done, (path, chunks) in enumerate(_iter_pdf_chunks(pdf_paths, hashes=hashes), start=1):
+        if chunks is None:
+            # skipped: recorded in the metadata at the end, like before
+            if progress is not None:
+                progress(done, len(pdf_paths), path.name, 0)
+            continue
+
+        existing_meta = _existing_metadata(vectordb, path.name)
+        existing = set(existing_meta)
+        fresh = set()
+        retag_ids, retag_meta = [], []
+        for doc in chunks:
+            chunk_id = _chunk_id(doc)
+            if chunk_id in fresh:
+                continue  # identical chunk twice at the same spot
+            fresh.add(chunk_id)
+            if chunk_id in existing:
+                n_kept += 1
+                # written by a run that crashed before saving the lexical index
+                if lexical is not None and chunk_id not in lexical.doc_numbers:
+                    lexical.add([chunk_id], [doc.page_content])
+                # same text, new bibliographic fields: update metadata, no re-embedding
+                if existing_meta[chunk_id] != doc.metadata:
+                    retag_ids.append(chunk_id)
+                    retag_meta.append(doc.metadata)
+                continue
+            batch_docs.append(doc)
+            batch_ids.append(chunk_id)
+            queued += 1
+            n_added += 1
+            if len(batch_docs) >= batch_size:
+                write_batch()
+                checkpoint_done()
+        if retag_ids:
+            update_metadatas(vectordb, retag_ids, retag_meta)
+        if documents is not None and chunks:
+            documents.upsert(path.name, {k: chunks[0].metadata[k] for k in BIB_FIELDS if k in chunks[0].metadata})
+        waiting.append((path.name, queued, existing - fresh))
+        checkpoint_done()
+        if progress is not None:
+            progress(done, len(pdf_paths), path.name, len(chunks))
+
+    write_batch()
+    checkpoint_done()
+    if lexical is not None:
+        lexical.save()
+    print(f"[INFO] Chunks: {n_added} added, {n_kept} unchanged, {n_deleted} removed")
+
+    embed_after = _embedding_stats(vectordb.embeddings)
+    run = {k: v - embed_before.get(k, 0) for k, v in embed_after.items()}
+    if "hits" in run:
+        looked_up = run["hits"] + run["misses"]
+        rate = run["hits"] / looked_up if looked_up else 0.0
+        print(f"[INFO] Embedding cache: {run['hits']} hits, {run['misses']} misses ({rate:.0%})")
+    if "requests" in run:
+        print(
+            f"[INFO] Embedding requests: {run['requests']} ({run['retries']} retried, {run['rate_limited']} rate limited), "
+            f"concurrency now {embed_after['concurrency']}"
+        )
+
+    # the run finished: fold the journal into the metadata. Skipped files are
+    # recorded too, as before, so they are not retried on every update.
+    recover_checkpoint(metadata_path)
+    meta_map = load_metadata(metadata_path)
+    stats_map = load_metadata_stats(metadata_path)
+    meta_map.update(hashes)
+    stats_map.update(stats)
+    save_metadata(metadata_path, meta_map, stats_map)
+
+
+def _remove_deleted(
+    vectordb: Chroma,
+    names: list[str],
+    metadata_path: Path,
+    lexical=None,
+    documents: DocumentTable | None = None,
+    centroid: CentroidDelta | None = None,
+) -> None:
+    """Drop the chunks and metadata of PDFs that were removed from datasets_dir."""
+    for name in names:
+        stale = _existing_ids(vectordb, name)
+        if stale:
+            if centroid is not None:
+                centroid.removed(vectordb, stale)
+            vectordb.delete(ids=list(stale))
+            if lexical is not None:
+                lexical.delete(stale)
+        print(f"[INFO] Removed '{name}' ({len(stale)} chunks)")
+    if lexical is not None:
+        lexical.save()
+    if documents is not None:
+        documents.delete(names)
+    forget_files(metadata_path, names)
+
+
+def _publish(
+    chroma_dir: Path, metadata_path: Path, snapshot: Path, vectordb: Chroma, centroid: CentroidDelta | None = None
+) -> None:
+    # the router compares questions with it to pick collections
+    save_centroid(snapshot, vectordb, centroid)
+    keep = max(1, env_int("KB_SNAPSHOTS_KEEP", 3))
+    publish_snapshot(chroma_dir, metadata_path, snapshot, keep=keep, release=close_chroma)
 
 
 # --------- for state EMPTY ---------
-def init_ingest() -> Chroma:
+def init_ingest(progress=None, collection: str | None = None) -> Chroma:
     """
-    Initial ingest:
-    - Read ALL PDFs from datasets_dir
-    - Build a fresh Chroma DB (overwrite existing)
-    - Write metadata hashes
+    Initial ingest (or full rebuild) of a collection (default: the first one):
+    - Read ALL PDFs from its datasets_dir
+    - Stream their chunks into a new snapshot of the index in fixed-size batches
+    - Write its metadata hashes (checkpointed per file, resumed after a crash)
+    - Publish the snapshot; the live index is left alone until then
+    - Report per-file progress to `progress` (see _stream_ingest)
     - Return retriever
     """
     
-    datasets_dir, chroma_dir, metadata_path = load_paths()
+    datasets_dir, chroma_dir, metadata_path = load_paths(collection)
 
     # find all PDFs
     pdf_paths = sorted(datasets_dir.glob("*.pdf"))
     if not pdf_paths:
         raise RuntimeError(f"No PDF files found in {datasets_dir}")
 
-    # load + split
-    docs = _load_pdfs(pdf_paths)
-    splitter = _build_splitter()
-    chunks = splitter.split_documents(docs)
-
-    # embeddings + Chroma (fresh index)
-    emb = _build_embeddings()
-    vectordb = Chroma.from_documents(
-        documents=chunks,
-        embedding=emb,
-        persist_directory=str(chroma_dir),
-    )
+    snapshot, resumed = begin_snapshot(chroma_dir, metadata_path, "build")
+    snapshot_meta = snapshot_metadata_path(snapshot)
+    if resumed:
+        # files completed by the interrupted run are already in the snapshot
+        recover_checkpoint(snapshot_meta)
+        done = load_metadata(snapshot_meta)
+        hashes, _ = fingerprint_files(pdf_paths, snapshot_meta)
+        pdf_paths = [p for p in pdf_paths if done.get(p.name) != hashes[p.name]]
+        print(f"[INFO] Resuming build of snapshot {snapshot.name}, {len(pdf_paths)} PDFs left")
+
+    # clean + load + split (in parallel) -> batched upserts
+    vectordb = _open_chroma(snapshot)
+    # after a crash the saved lexical index lags behind Chroma -> rebuild it
+    lexical = _open_lexical(snapshot, vectordb, rebuild=resumed)
+    documents = DocumentTable(documents_path(snapshot))
+    try:
+        with telemetry.span("ingest.init", files=len(pdf_paths), resumed=resumed):
+            _stream_ingest(vectordb, pdf_paths, snapshot_meta, progress, lexical, documents)
+    finally:
+        documents.close()
 
-    # metadata: filename -> hash
-    files_map = {p.name: compute_file_hash(p) for p in pdf_paths}
-    save_metadata(metadata_path, files_map)
+    compact = _open_compact(snapshot, vectordb, sync=True)
+    _publish(chroma_dir, metadata_path, snapshot, vectordb)
 
     # retriever
-    retriever = vectordb.as_retriever(search_kwargs={"k": 10})
+    retriever = _build_retriever(vectordb, lexical, compact)
     return retriever
 
 
 # --------- for state UP_TO_DATE or OUTDATED ---------
-def restore_from_cache() -> Chroma:
+def restore_from_cache(chroma_dir: Path | None = None, metadata_path: Path | None = None) -> Chroma:
     """
-    Open existing Chroma DB from disk and return a retriever.
+    Open the published snapshot of the Chroma DB from disk and return a retriever.
     Assumes embeddings/model are the same as during ingest.
     """
-    _, chroma_dir, _ = load_paths()
-    retriever = _build_retriever_from_chroma(chroma_dir)
+    _, default_chroma_dir, default_metadata_path = load_paths()
+    chroma_dir = chroma_dir or default_chroma_dir
+    metadata_path = metadata_path or default_metadata_path
+    with telemetry.span("kb.restore"):
+        retriever = _build_retriever_from_chroma(index_dir(chroma_dir, metadata_path))
     return retriever
 
 # --------- for state OUTDATED, only on demand ---------
-def ingest_new_data() -> Chroma:
+def ingest_new_data(progress=None, collection: str | None = None) -> Chroma:
     """
-    Incremental ingest:
-    - Detect new/changed PDFs via state_machine.detect_kb_state
-    - Add their chunks to existing Chroma DB
-    - Update metadata hashes
+    Incremental ingest of a collection (default: the first one):
+    - Detect new/changed/deleted PDFs via state_machine.detect_kb_state
+    - Copy the live index into a new snapshot
+    - Upsert chunks that changed, delete stale and removed ones there
+    - Update its metadata hashes (checkpointed per file, resumed after a crash)
+    - Publish the snapshot; sessions keep searching the old one until then
+    - Report per-file progress to `progress` (see _stream_ingest)
     - Return an up-to-date retriever
     """
-    datasets_dir, chroma_dir, metadata_path = load_paths()
+    datasets_dir, chroma_dir, metadata_path = load_paths(collection)
+
+    # journal of an interrupted in-place ingest (index built before snapshots)
+    recover_checkpoint(metadata_path)
+    _, kb_info = detect_kb_state(datasets_dir, metadata_path)
+    has_documents = documents_path(index_dir(chroma_dir, metadata_path)).exists()
+    if (
+        not (kb_info.get("new_files") or kb_info.get("changed_files") or kb_info.get("deleted_files"))
+        and has_documents
+        and pending_snapshot(chroma_dir, metadata_path, "update") is None
+    ):
+        # Nothing to do; just restore current retriever
+        return restore_from_cache(chroma_dir, metadata_path)
 
-    kb_state, kb_info = detect_kb_state(datasets_dir, metadata_path)
+    snapshot, resumed = begin_snapshot(chroma_dir, metadata_path, "update")
+    snapshot_meta = snapshot_metadata_path(snapshot)
+    # files completed by an interrupted run count as processed
+    recovered = recover_checkpoint(snapshot_meta)
+    kb_state, kb_info = detect_kb_state(datasets_dir, snapshot_meta)
 
     to_process_names = kb_info.get("new_files", []) + kb_info.get("changed_files", [])
-    if not to_process_names:
-        # Nothing to do; just restore current retriever
-        return _build_retriever_from_chroma(chroma_dir)
+    deleted_names = kb_info.get("deleted_files", [])
+    if not documents_path(snapshot).exists():
+        # KB built before the document table existed: re-read the processed PDFs
+        # once to fill it (unchanged chunks only get their metadata updated)
+        present = {p.name for p in datasets_dir.glob("*.pdf")}
+        to_process_names += sorted(n for n in load_metadata(snapshot_meta) if n in present and n not in to_process_names)
+    vectordb = _open_chroma(snapshot)
+    lexical = _open_lexical(snapshot, vectordb, rebuild=bool(recovered))
+
+    if not (to_process_names or deleted_names or resumed):
+        # changed back in the meantime
+        close_chroma(snapshot)
+        discard_snapshot(snapshot)
+        return restore_from_cache(chroma_dir, metadata_path)
 
     pdf_paths = [datasets_dir / name for name in to_process_names]
-
-    # 1) load + split only new/changed docs
-    docs = _load_pdfs(pdf_paths)
-    splitter = _build_splitter()
-    chunks = splitter.split_documents(docs)
-
-    # 2) open existing Chroma and append
-    emb = _build_embeddings()
-    vectordb = Chroma(
-        persist_directory=str(chroma_dir),
-        embedding_function=emb,
-    )
-    vectordb.add_documents(chunks)
-
-    # 3) update metadata
-    meta_map = load_metadata(metadata_path)
-    for p in pdf_paths:
-        meta_map[p.name] = compute_file_hash(p)
-    save_metadata(metadata_path, meta_map)
-
-    # 4) updated retriever
-    retriever = vectordb.as_retriever(search_kwargs={"k": 10})
+    documents = DocumentTable(documents_path(snapshot))
+    # what an interrupted run changed is unknown: its centroid is computed in full
+    centroid = None if resumed else CentroidDelta()
+    try:
+        with telemetry.span("ingest.update", files=len(pdf_paths), deleted=len(deleted_names)):
+            # 1) clean + load + split only new/changed docs -> diffed upserts + metadata
+            if pdf_paths:
+                _stream_ingest(vectordb, pdf_paths, snapshot_meta, progress, lexical, documents, centroid)
+
+            # 2) files gone from the folder lose their vectors too
+            if deleted_names:
+                _remove_deleted(vectordb, deleted_names, snapshot_meta, lexical, documents, centroid)
+    finally:
+        documents.close()
+
+    compact = _open_compact(snapshot, vectordb, sync=True)
+    _publish(chroma_dir, metadata_path, snapshot, vectordb, centroid)
+
+    # 3) updated retriever
+    retriever = _build_retriever(vectordb, lexical, compact)
     return retriever
-
@@ -0,0 +1,173 @@
+# built-in libs
+import math
+import os
+import threading
+import time
+
+# langchain libs
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# project libs
+from env_handler import env_int, env_float
+from lexical_index import tokenize
+import telemetry
+
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+# --------- scorers ---------
+
+class CrossEncoderScorer:
+    """
+    Small cross-encoder pinned to the CPU (sentence-transformers, optional).
+    The model is loaded once, when the scorer is built, so the first question
+    does not pay for it inside the latency budget.
+    """
+
+    name = "cross-encoder"
+    # pair scores do not depend on the other candidates: safe to score in batches
+    batched = True
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER, max_length: int = 512):
+        from sentence_transformers import CrossEncoder
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, device="cpu", max_length=max_length)
+
+    def score(self, query: str, texts: list[str]) -> list[float]:
+        pairs = [(query, text) for text in texts]
+        return [float(s) for s in self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)]
+
+
+class LexicalScorer:
+    """
+    Cheap local scorer: BM25 of the query against the candidate set itself.
+    No model, no download; only used when asked for (RERANK_MODEL=lexical).
+    idf and the average length come from all candidates passed in one call,
+    so the whole candidate set must be scored at once.
+    """
+
+    name = "lexical"
+    batched = False
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+    def score(self, query: str, texts: list[str]) -> list[float]:
+        docs = [tokenize(text) for text in texts]
+        if not docs:
+            return []
+        avg_len = sum(len(d) for d in docs) / len(docs) or 1.0
+        counts = []
+        df: dict[str, int] = {}
+        for tokens in docs:
+            c: dict[str, int] = {}
+            for tok in tokens:
+                c[tok] = c.get(tok, 0) + 1
+            counts.append(c)
+            for tok in c:
+                df[tok] = df.get(tok, 0) + 1
+
+        n = len(docs)
+        query_tokens = set(tokenize(query))
+        scores = []
+        for tokens, c in zip(docs, counts):
+            s = 0.0
+            for tok in query_tokens:
+                tf = c.get(tok, 0)
+                if not tf:
+                    continue
+                idf = math.log(1 + (n - df[tok] + 0.5) / (df[tok] + 0.5))
+                s += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * len(tokens) / avg_len))
+            scores.append(s)
+        return scores
+
+
+_scorer = None
+_scorer_loaded = False
+_scorer_lock = threading.Lock()
+
+def get_scorer():
+    """
+    Process-wide scorer configured from RERANK_MODEL: a sentence-transformers
+    cross-encoder name (default), or `lexical` for the model-free scorer.
+    None if the cross-encoder cannot be loaded: BM25 alone would drop the
+    dense-only (paraphrase) hits, so the retrieval order is kept instead.
+    """
+    global _scorer, _scorer_loaded
+    with _scorer_lock:
+        if not _scorer_loaded:
+            model_name = os.getenv("RERANK_MODEL", DEFAULT_CROSS_ENCODER).strip()
+            if model_name.lower() == "lexical":
+                _scorer = LexicalScorer()
+            else:
+                try:
+                    _scorer = CrossEncoderScorer(model_name)
+                except Exception as e:
+                    print(f"[WARN] Cross-encoder '{model_name}' unavailable ({type(e).__name__}: {e}); reranking is off (pip install -r requirements-rerank.txt)")
+            _scorer_loaded = True
+        return _scorer
+
+
+def rerank_enabled() -> bool:
+    """RERANK=off, or no cross-encoder to load, keeps the plain retrieval order."""
+    if os.getenv("RERANK", "on").strip().lower() in ("0", "off", "false", "no"):
+        return False
+    return get_scorer() is not None
+
+
+# --------- retriever ---------
+
+class RerankRetriever(BaseRetriever):
+    """
+    Retrieve many -> rerank -> keep few.
+    The base retriever over-fetches candidates, the scorer rescores them in
+    batches, and only the top_n best go to the LLM. If scoring runs past the
+    latency budget, the base retriever's order is kept instead.
+    """
+
+    base: BaseRetriever
+    vectorstore: object = None
+    scorer: object
+    top_n: int = 5
+    batch_size: int = 16
+    budget_s: float = 0.5
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        candidates = self.base.invoke(query)
+        if len(candidates) <= 1:
+            return candidates[:self.top_n]
+
+        deadline = time.perf_counter() + self.budget_s
+        # scores of a non-batched scorer are only comparable within one call
+        batch_size = self.batch_size if getattr(self.scorer, "batched", True) else len(candidates)
+        scores: list[float] = []
+        with telemetry.span("retrieval.rerank", candidates=len(candidates), scorer=self.scorer.name) as sp:
+            for start in range(0, len(candidates), batch_size):
+                if time.perf_counter() > deadline:
+                    print(f"[WARN] Rerank over budget ({self.budget_s * 1000:.0f} ms) after {len(scores)}/{len(candidates)} candidates; keeping retrieval order")
+                    sp.set(over_budget=True)
+                    telemetry.count("retrieval.rerank_over_budget")
+                    return candidates[:self.top_n]
+                batch = candidates[start:start + batch_size]
+                scores.extend(self.scorer.score(query, [doc.page_content for doc in batch]))
+
+        # stable sort: ties keep the retrieval order
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order[:self.top_n]]
+
+
+def build_rerank_retriever(base: BaseRetriever, vectorstore=None) -> RerankRetriever:
+    return RerankRetriever(
+        base=base,
+        vectorstore=vectorstore,
+        scorer=get_scorer(),
+        top_n=env_int("RERANK_TOP_N", 5),
+        batch_size=env_int("RERANK_BATCH_SIZE", 16),
+        budget_s=env_float("RERANK_BUDGET_MS", 500) / 1000,
+    )
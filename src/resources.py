@@ -0,0 +1,150 @@
+# built-in libs
+from pathlib import Path
+import threading
+
+import streamlit as st
+
+# project libs
+from chroma_store import store_dir
+from env_handler import DEFAULT_TOPIC, Collection, load_paths
+from ingest_jobs import IngestJobs
+from snapshots import current_snapshot
+
+
+class VectorStoreManager:
+    """
+    Process-wide owner of the vector stores, shared by every Streamlit session.
+    Holds one retriever (and answer engine) per chroma_dir, i.e. per collection,
+    and the routed engine over several collections. Readers never block:
+    they get whatever retriever is published; a background ingest publishes a new
+    one when it is done and all sessions pick it up on their next rerun.
+    A snapshot published by another process (CLI ingest or rollback) is noticed
+    through the published metadata and swapped in the same way.
+    Each ingest builds a new index snapshot, so the store of the retriever before
+    last is closed on a swap (sessions may still be finishing an answer on the last one).
+    Chroma, LangChain and the OpenAI clients are only imported once the first
+    retriever is opened, so the app renders without them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._retrievers: dict[str, object] = {}
+        self._engines: dict[str, object] = {}
+        self._generations: dict[str, int] = {}
+        self._previous: dict[str, object] = {}
+        self._routed: dict[tuple, tuple[list, object]] = {}
+        # metadata path -> (file signature, published snapshot name)
+        self._published: dict[str, tuple[tuple, str | None]] = {}
+
+    def get_retriever(self, chroma_dir: Path, metadata_path: Path | None = None):
+        """Retriever over the published snapshot; reopened when the published snapshot changed."""
+        if metadata_path is None:
+            _, _, metadata_path = load_paths()
+        key = str(chroma_dir)
+        published = self._published_snapshot(metadata_path)
+        with self._lock:
+            retriever = self._retrievers.get(key)
+        if retriever is not None and _snapshot_of(retriever, chroma_dir) == published:
+            return retriever
+
+        from preprocess import restore_from_cache
+        # open outside the lock; if two sessions race, the first one wins
+        opened = restore_from_cache(chroma_dir, metadata_path)
+        with self._lock:
+            current = self._retrievers.get(key)
+            if current is None:
+                self._retrievers[key] = opened
+                return opened
+            if current is not retriever and _snapshot_of(current, chroma_dir) == _snapshot_of(opened, chroma_dir):
+                return current
+        print(f"[INFO] Published snapshot of {chroma_dir} changed to {published}; reopening")
+        self.publish(chroma_dir, opened)
+        return opened
+
+    def _published_snapshot(self, metadata_path: Path) -> str | None:
+        """current_snapshot(), re-read only when the metadata file was replaced."""
+        try:
+            stat = metadata_path.stat()
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+        key = str(metadata_path)
+        with self._lock:
+            cached = self._published.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        name = current_snapshot(metadata_path)
+        with self._lock:
+            self._published[key] = (signature, name)
+        return name
+
+    def get_engine(self, chroma_dir: Path, metadata_path: Path | None = None, topic: str = DEFAULT_TOPIC):
+        """Answer engine bound to the currently published retriever."""
+        from generate_answer import AnswerEngine
+        retriever = self.get_retriever(chroma_dir, metadata_path)
+        key = str(chroma_dir)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is None or engine.retriever is not retriever or engine.topic != topic:
+                engine = AnswerEngine(retriever, topic=topic)
+                self._engines[key] = engine
+            return engine
+
+    def get_routed_engine(self, collections: list[Collection]):
+        """Answer engine that routes each question to the relevant ones of `collections`."""
+        if len(collections) == 1:
+            c = collections[0]
+            return self.get_engine(c.chroma_dir, c.metadata_path, c.topic)
+        retrievers = {c.name: self.get_retriever(c.chroma_dir, c.metadata_path) for c in collections}
+        key = tuple(c.name for c in collections)
+        with self._lock:
+            cached = self._routed.get(key)
+        if cached is not None and all(a is b for a, b in zip(cached[0], retrievers.values())):
+            return cached[1]
+
+        from generate_answer import AnswerEngine
+        from router import build_router
+        # rebuilt whenever one of the collections published a new index
+        engine = AnswerEngine(build_router(collections, retrievers), topic="; ".join(c.topic for c in collections))
+        with self._lock:
+            self._routed[key] = (list(retrievers.values()), engine)
+        return engine
+
+    def publish(self, chroma_dir: Path, retriever) -> None:
+        """Hot-swap the retriever served to all sessions."""
+        key = str(chroma_dir)
+        with self._lock:
+            before_last = self._previous.get(key)
+            previous = self._previous[key] = self._retrievers.get(key)
+            self._retrievers[key] = retriever
+            self._generations[key] = self._generations.get(key, 0) + 1
+        if before_last is not None:
+            path = _store_dir(before_last)
+            if path not in (_store_dir(retriever), _store_dir(previous)):
+                from chroma_store import close_chroma
+                close_chroma(path)
+
+    def generation(self, chroma_dir: Path) -> int:
+        """Number of swaps so far; lets callers notice that the index changed."""
+        with self._lock:
+            return self._generations.get(str(chroma_dir), 0)
+
+
+def _store_dir(retriever) -> str | None:
+    return None if retriever is None else store_dir(retriever.vectorstore)
+
+
+def _snapshot_of(retriever, chroma_dir: Path) -> str | None:
+    """Name of the snapshot the retriever was opened on (None: the pre-snapshot index in chroma_dir)."""
+    path = Path(_store_dir(retriever))
+    return None if path == Path(chroma_dir) else path.name
+
+
+@st.cache_resource
+def get_vector_store_manager() -> VectorStoreManager:
+    return VectorStoreManager()
+
+
+@st.cache_resource
+def get_ingest_jobs() -> IngestJobs:
+    return IngestJobs()
@@ -0,0 +1,239 @@
+"""
+Routing questions across topic collections.
+
+Every collection keeps the mean of its chunk embeddings (its centroid) next to
+its index. A question is embedded once and compared with the centroids; only
+the closest collection, plus any other within ROUTER_MARGIN of it (at most
+ROUTER_MAX_COLLECTIONS), is searched, in parallel, with that same embedding
+(all collections use one embedding model). Per-question cost grows with the
+number of collections searched, not with the number configured.
+"""
+
+# built-in libs
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import json
+
+# extra libs
+import numpy as np
+
+# langchain libs
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# project libs
+from env_handler import Collection, env_float, env_int
+from snapshots import index_dir
+from state_machine import write_json_atomic
+import telemetry
+
+
+CENTROID_FILENAME = "centroid.json"
+
+
+# --------- centroids ---------
+
+def compute_centroid(vectordb, page_size: int = 5000) -> tuple[list[float] | None, int]:
+    """Mean of all chunk embeddings in the store, and the number of chunks."""
+    total, count = None, 0
+    while True:
+        page = vectordb.get(include=["embeddings"], limit=page_size, offset=count)
+        vectors = page["embeddings"]
+        if vectors is None or len(vectors) == 0:
+            break
+        page_sum = np.asarray(vectors, dtype=np.float64).sum(axis=0)
+        total = page_sum if total is None else total + page_sum
+        count += len(vectors)
+    if total is None:
+        return None, 0
+    return (total / count).tolist(), count
+
+
+class CentroidDelta:
+    """Sum and number of the embeddings written to / deleted from a store during an update."""
+
+    def __init__(self):
+        self.total = None
+        self.count = 0
+
+    def _update(self, vectordb, ids, sign: int) -> None:
+        if not ids:
+            return
+        vectors = vectordb.get(ids=list(ids), include=["embeddings"])["embeddings"]
+        if vectors is None or len(vectors) == 0:
+            return
+        page_sum = sign * np.asarray(vectors, dtype=np.float64).sum(axis=0)
+        self.total = page_sum if self.total is None else self.total + page_sum
+        self.count += sign * len(vectors)
+
+    def added(self, vectordb, ids) -> None:
+        """Count chunks just written to the store."""
+        self._update(vectordb, ids, 1)
+
+    def removed(self, vectordb, ids) -> None:
+        """Count chunks about to be deleted from the store."""
+        self._update(vectordb, ids, -1)
+
+
+def save_centroid(index_dir: Path, vectordb, delta: CentroidDelta | None = None) -> None:
+    """
+    Write the centroid of the store next to its index (done for every snapshot).
+    With the delta of an update it is derived from the centroid the snapshot was
+    copied with; otherwise every embedding is read again.
+    """
+    path = index_dir / CENTROID_FILENAME
+    saved = None
+    if delta is not None and path.exists():
+        with path.open("r", encoding="utf-8") as f:
+            saved = json.load(f)
+    with telemetry.span("ingest.centroid", incremental=saved is not None) as sp:
+        if saved is not None:
+            count = saved["count"] + delta.count
+            total = np.asarray(saved["vector"], dtype=np.float64) * saved["count"]
+            if delta.total is not None:
+                total = total + delta.total
+            vector = (total / count).tolist() if count > 0 else None
+        else:
+            vector, count = compute_centroid(vectordb)
+        sp.set(chunks=count)
+    if vector is None:
+        path.unlink(missing_ok=True)
+        return
+    write_json_atomic(path, {"count": count, "vector": vector})
+
+
+def load_centroid(index_dir: Path, vectordb=None) -> list[float] | None:
+    """Centroid saved with the index; computed (and saved) if the index predates it."""
+    path = index_dir / CENTROID_FILENAME
+    if path.exists():
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)["vector"]
+    if vectordb is None:
+        return None
+    print(f"[INFO] Computing the centroid of {index_dir}")
+    save_centroid(index_dir, vectordb)
+    return load_centroid(index_dir)
+
+
+def _cosine(a, b) -> float:
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    norm = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / norm) if norm else 0.0
+
+
+# --------- router ---------
+
+class CollectionRouter(BaseRetriever):
+    """
+    Retriever over several collections that only searches the ones whose
+    centroid is close to the question. Results of the searched collections are
+    interleaved, closest collection first, and tagged with metadata["collection"].
+    """
+
+    retrievers: dict[str, BaseRetriever]
+    centroids: dict[str, list[float]]
+    topics: dict[str, str]
+    embeddings: object
+    max_collections: int = 2
+    margin: float = 0.05
+    top_n: int = 5
+
+    def route(self, query: str, vector: list[float] | None = None) -> list[tuple[str, float]]:
+        """
+        Collections to search for the query with their centroid similarity, closest first.
+        `vector` is the query's embedding, if computed already.
+        """
+        if len(self.retrievers) == 1:
+            return [(next(iter(self.retrievers)), 1.0)]
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+        scored = sorted(
+            ((name, _cosine(vector, self.centroids[name])) for name in self.retrievers if name in self.centroids),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        if not scored:
+            return [(name, 0.0) for name in list(self.retrievers)[:self.max_collections]]
+        best = scored[0][1]
+        return [(name, score) for name, score in scored[:self.max_collections] if score >= best - self.margin]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        if not self.retrievers:
+            return []  # e.g. filtered to papers none of the collections has
+        with telemetry.span("retrieval.route", collections=len(self.retrievers)) as sp:
+            # one collection needs no routing: its retriever embeds the query itself
+            vector = self.embeddings.embed_query(query) if len(self.retrievers) > 1 else None
+            routed = self.route(query, vector)
+            sp.set(routed=[name for name, _ in routed])
+        print("[INFO] Routed to " + ", ".join(f"{name} ({score:.3f})" for name, score in routed))
+
+        def search(name: str) -> list[Document]:
+            retriever = self.retrievers[name]
+            if vector is not None:
+                retriever = _with_query_vector(retriever, vector)
+            return retriever.invoke(query)
+
+        if len(routed) == 1:
+            results = [search(routed[0][0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(routed), thread_name_prefix="route") as pool:
+                results = list(pool.map(lambda item: search(item[0]), routed))
+
+        for (name, _), docs in zip(routed, results):
+            for doc in docs:
+                doc.metadata["collection"] = name
+        return _interleave(results)[:self.top_n]
+
+    def topic_of(self, docs: list[Document]) -> str | None:
+        """Prompt topic for an answer drawn from these docs."""
+        names = list(dict.fromkeys(d.metadata.get("collection") for d in docs if d.metadata.get("collection")))
+        return "; ".join(self.topics[n] for n in names if n in self.topics) or None
+
+
+def _with_query_vector(retriever, vector: list[float]):
+    """Copy of a collection's retriever whose vector search uses the routing embedding of the query."""
+    from lexical_index import HybridRetriever
+    from rerank import RerankRetriever
+
+    if isinstance(retriever, RerankRetriever):
+        return retriever.model_copy(update={"base": _with_query_vector(retriever.base, vector)})
+    if isinstance(retriever, HybridRetriever):
+        return retriever.model_copy(update={"query_vector": vector})
+    # e.g. a plain VectorStoreRetriever: embeds the query again
+    return retriever
+
+
+def _interleave(results: list[list[Document]]) -> list[Document]:
+    """Round-robin over the ranked lists, first list first, dropping repeated chunks."""
+    merged, seen = [], set()
+    for rank in range(max((len(r) for r in results), default=0)):
+        for docs in results:
+            if rank < len(docs):
+                doc = docs[rank]
+                key = (doc.metadata.get("collection"), doc.metadata.get("source"), doc.page_content)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(doc)
+    return merged
+
+
+def build_router(collections: list[Collection], retrievers: dict) -> CollectionRouter:
+    """Router over the published retrievers {name: retriever} of the collections, sharing the query embeddings of the first."""
+    centroids = {}
+    for c in collections:
+        centroid = load_centroid(index_dir(c.chroma_dir, c.metadata_path), retrievers[c.name].vectorstore)
+        if centroid is not None:
+            centroids[c.name] = centroid
+    first = retrievers[collections[0].name]
+    return CollectionRouter(
+        retrievers={c.name: retrievers[c.name] for c in collections},
+        centroids=centroids,
+        topics={c.name: c.topic for c in collections},
+        embeddings=first.vectorstore.embeddings,
+        max_collections=max(1, env_int("ROUTER_MAX_COLLECTIONS", 2)),
+        margin=env_float("ROUTER_MARGIN", 0.05),
+        top_n=env_int("RERANK_TOP_N", 5) if hasattr(first, "top_n") else 10,
+    )
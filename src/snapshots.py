@@ -0,0 +1,306 @@
+"""
+Versioned index builds.
+
+Every build or update writes a new snapshot folder under CHROMA_DB_DIR/snapshots/
+(Chroma files, lexical/compact indexes, document table and its own
+kb_metadata.json). A published snapshot is never written to again. Publishing
+atomically replaces KB_METADATA_PATH with the snapshot's metadata plus its name,
+so the published metadata is the pointer to the live index: readers either see
+the old index with the old metadata or the new one with the new, never a mix.
+Rolling back re-points it to an older snapshot; the last KB_SNAPSHOTS_KEEP
+snapshots are kept.
+"""
+
+# built-in libs
+from pathlib import Path
+import json
+import shutil
+import time
+import uuid
+
+# project libs
+from state_machine import fingerprint_cache_path, write_json_atomic
+import telemetry
+
+
+SNAPSHOTS_DIRNAME = "snapshots"
+METADATA_FILENAME = "kb_metadata.json"
+# present while the snapshot is being built: {"kind": "build" | "update", "base": snapshot or None}
+BUILDING_MARKER = "BUILDING"
+
+# index files of the layout before snapshots, directly in CHROMA_DB_DIR
+_LEGACY_FILES = ("chroma.sqlite3", "chroma.sqlite3-wal", "chroma.sqlite3-shm",
+                 "lexical_index.pkl", "documents.sqlite3", "compact_index")
+# only ever replaced as a whole (temp file/folder + rename), never written in
+# place: an update shares them with the snapshot it starts from (hard links)
+_REPLACED_FILES = ("lexical_index.pkl", "compact_index", "centroid.json", METADATA_FILENAME)
+
+# linux/fs.h: clone a file's extents (copy-on-write) on btrfs, XFS, ...
+_FICLONE = 0x40049409
+
+
+def snapshots_dir(chroma_dir: Path) -> Path:
+    return chroma_dir / SNAPSHOTS_DIRNAME
+
+
+def snapshot_metadata_path(snapshot: Path) -> Path:
+    return snapshot / METADATA_FILENAME
+
+
+def current_snapshot(metadata_path: Path) -> str | None:
+    """Name of the published snapshot, None for an index built before snapshots (or none yet)."""
+    if not metadata_path.exists():
+        return None
+    try:
+        with metadata_path.open("r", encoding="utf-8") as f:
+            return json.load(f).get("snapshot")
+    except Exception:
+        return None
+
+
+def index_dir(chroma_dir: Path, metadata_path: Path) -> Path:
+    """Folder of the live index."""
+    name = current_snapshot(metadata_path)
+    return snapshots_dir(chroma_dir) / name if name else chroma_dir
+
+
+def _building(snapshot: Path) -> dict | None:
+    marker = snapshot / BUILDING_MARKER
+    if not marker.exists():
+        return None
+    try:
+        return json.loads(marker.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def list_snapshots(chroma_dir: Path, metadata_path: Path) -> list[dict]:
+    """Published snapshots, newest first: {name, path, current, files}."""
+    root = snapshots_dir(chroma_dir)
+    if not root.exists():
+        return []
+    current = current_snapshot(metadata_path)
+    rows = []
+    for path in sorted(root.iterdir(), key=lambda p: p.name, reverse=True):
+        if not path.is_dir() or _building(path) is not None:
+            continue
+        try:
+            with snapshot_metadata_path(path).open("r", encoding="utf-8") as f:
+                n_files = len(json.load(f).get("files", {}))
+        except Exception:
+            continue  # never completed
+        rows.append({"name": path.name, "path": path, "current": path.name == current, "files": n_files})
+    return rows
+
+
+# --------- building ---------
+
+def _clone_file(src: Path, dst: Path) -> bool:
+    """Copy-on-write clone where the filesystem supports it, else a plain copy. True if cloned."""
+    try:
+        import fcntl
+        with src.open("rb") as s, dst.open("wb") as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except (ImportError, OSError):
+        shutil.copy2(src, dst)
+        return False
+
+
+def _copy_index(src: Path, dst: Path, shared: bool = False) -> dict:
+    """
+    Start a snapshot as a copy of the index in src. Files in _REPLACED_FILES are
+    hard-linked; Chroma's files and the document table are modified in place, so
+    they are cloned (no extra space until written) or, on filesystems without
+    clones (ext4, NTFS), copied in full: an update costs one index of disk I/O.
+    Returns the bytes {"copied", "cloned", "linked"}.
+    """
+    sizes = {"copied": 0, "cloned": 0, "linked": 0}
+    for entry in src.iterdir():
+        if entry.name in (SNAPSHOTS_DIRNAME, BUILDING_MARKER) or entry.name.endswith((".tmp", ".checkpoint.jsonl")):
+            continue
+        link = shared or entry.name in _REPLACED_FILES
+        if entry.is_dir():
+            (dst / entry.name).mkdir()
+            for key, n in _copy_index(entry, dst / entry.name, link).items():
+                sizes[key] += n
+            continue
+        size = entry.stat().st_size
+        if link:
+            try:
+                (dst / entry.name).hardlink_to(entry)
+                sizes["linked"] += size
+                continue
+            except OSError:
+                pass  # e.g. no hard links on this filesystem
+        sizes["cloned" if _clone_file(entry, dst / entry.name) else "copied"] += size
+    return sizes
+
+
+def pending_snapshot(chroma_dir: Path, metadata_path: Path, kind: str) -> Path | None:
+    """Unpublished snapshot of an interrupted run of `kind` that can be resumed."""
+    root = snapshots_dir(chroma_dir)
+    if not root.exists():
+        return None
+    base = current_snapshot(metadata_path)
+    for path in sorted(root.iterdir()):
+        marker = _building(path)
+        if marker is not None and marker.get("kind") == kind and (kind == "build" or marker.get("base") == base):
+            return path
+    return None
+
+
+def begin_snapshot(chroma_dir: Path, metadata_path: Path, kind: str) -> tuple[Path, bool]:
+    """
+    Folder to build the next snapshot in, and whether it resumes an interrupted run.
+    kind="build" starts empty; kind="update" starts as a copy of the live index.
+    Callers must hold the ingest lock.
+    """
+    pending = pending_snapshot(chroma_dir, metadata_path, kind)
+    if pending is not None:
+        return pending, True
+    root = snapshots_dir(chroma_dir)
+    if root.exists():
+        for path in root.iterdir():
+            if _building(path) is not None:
+                # interrupted run of the other kind, or based on an index that is no longer live
+                shutil.rmtree(path, ignore_errors=True)
+
+    base = current_snapshot(metadata_path)
+    # names sort chronologically (builds run one at a time under the ingest lock)
+    now = time.time()
+    snapshot = root / f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1e6) % 1_000_000:06d}"
+    snapshot.mkdir(parents=True)
+    (snapshot / BUILDING_MARKER).write_text(json.dumps({"kind": kind, "base": base}), encoding="utf-8")
+    if kind == "update":
+        src = index_dir(chroma_dir, metadata_path)
+        if src.exists():
+            with telemetry.span("ingest.snapshot_copy") as sp:
+                sizes = _copy_index(src, snapshot)
+                sp.set(**sizes)
+            print(
+                f"[INFO] Snapshot {snapshot.name}: {sizes['copied'] / 2**20:.1f} MB copied, "
+                f"{sizes['cloned'] / 2**20:.1f} MB cloned, {sizes['linked'] / 2**20:.1f} MB shared"
+            )
+        if base is None and metadata_path.exists():
+            # index from before snapshots: its metadata is the published file itself
+            shutil.copy2(metadata_path, snapshot_metadata_path(snapshot))
+    # the stat fingerprints of the dataset files save re-hashing them
+    fingerprints = fingerprint_cache_path(metadata_path)
+    if fingerprints.exists():
+        shutil.copy2(fingerprints, fingerprint_cache_path(snapshot_metadata_path(snapshot)))
+    return snapshot, False
+
+
+def discard_snapshot(snapshot: Path) -> None:
+    """Drop a snapshot that turned out not to be needed (e.g. an update with nothing to do)."""
+    if _building(snapshot) is not None:
+        shutil.rmtree(snapshot, ignore_errors=True)
+
+
+# --------- publishing ---------
+
+def _point_to(metadata_path: Path, snapshot: Path) -> None:
+    with snapshot_metadata_path(snapshot).open("r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    metadata["snapshot"] = snapshot.name
+    # the one step that makes the snapshot live
+    write_json_atomic(metadata_path, metadata, indent=2)
+
+
+def publish_snapshot(chroma_dir: Path, metadata_path: Path, snapshot: Path, keep: int = 3, release=None) -> None:
+    """Make a finished snapshot the live index, then prune old ones."""
+    marker = snapshot / BUILDING_MARKER
+    if marker.exists():
+        marker.unlink()
+    _point_to(metadata_path, snapshot)
+    print(f"[INFO] Published snapshot {snapshot.name}")
+    prune_snapshots(chroma_dir, metadata_path, keep, release)
+
+
+def rollback_snapshot(chroma_dir: Path, metadata_path: Path, name: str | None = None) -> str:
+    """Re-point the live index to snapshot `name` (default: the one published before the current)."""
+    snapshots = list_snapshots(chroma_dir, metadata_path)
+    if name is None:
+        names = [s["name"] for s in snapshots]
+        current = current_snapshot(metadata_path)
+        older = [n for n in names if current is None or n < current]
+        if not older:
+            raise ValueError("No earlier snapshot to roll back to.")
+        name = older[0]
+    elif name not in {s["name"] for s in snapshots}:
+        raise ValueError(f"Unknown snapshot '{name}'")
+    _point_to(metadata_path, snapshots_dir(chroma_dir) / name)
+    print(f"[INFO] Rolled back to snapshot {name}")
+    return name
+
+
+def prune_snapshots(chroma_dir: Path, metadata_path: Path, keep: int = 3, release=None) -> None:
+    """
+    Keep the live snapshot and the newest others up to `keep` in total; delete the rest
+    and the index files of the layout before snapshots. release(path) is called
+    before a folder is deleted (to close the store opened on it).
+    """
+    current = current_snapshot(metadata_path)
+    if current is None:
+        return
+    others = [s["path"] for s in list_snapshots(chroma_dir, metadata_path) if not s["current"]]
+    doomed = others[max(keep - 1, 0):]
+
+    legacy = [chroma_dir / name for name in _LEGACY_FILES if (chroma_dir / name).exists()]
+    # Chroma's per-collection HNSW folders are named by uuid
+    legacy += [p for p in chroma_dir.iterdir() if p.is_dir() and _is_uuid(p.name)]
+    if legacy:
+        doomed.append(chroma_dir)
+
+    for path in doomed:
+        if release is not None:
+            release(path)
+        if path == chroma_dir:
+            for entry in legacy:
+                if entry.is_dir():
+                    shutil.rmtree(entry, ignore_errors=True)
+                else:
+                    entry.unlink(missing_ok=True)
+            print("[INFO] Removed the index files from before snapshots")
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+            print(f"[INFO] Removed snapshot {path.name}")
+
+
+def _is_uuid(name: str) -> bool:
+    try:
+        uuid.UUID(name)
+        return True
+    except ValueError:
+        return False
+
+
+
+if __name__ == "__main__":
+    import argparse
+    from env_handler import load_paths
+    from ingest_jobs import InterProcessLock
+    from state_machine import ingest_lock_path
+
+    parser = argparse.ArgumentParser(description="List the index snapshots, or roll back to an earlier one.")
+    parser.add_argument("--rollback", nargs="?", const="", metavar="NAME", help="snapshot to re-publish (default: the previous one)")
+    parser.add_argument("--collection", help="collection to act on (default: the first one)")
+    args = parser.parse_args()
+
+    _, chroma_dir, metadata_path = load_paths(args.collection)
+    if args.rollback is not None:
+        # the lock the app's rollback and ingests take: never race an ingest that is about to publish
+        lock = InterProcessLock(ingest_lock_path(metadata_path))
+        if not lock.acquire():
+            raise SystemExit(f"[ERROR] An ingest is running (pid {lock.holder()}); roll back once it is done.")
+        # a running app switches to the rolled-back index on its next question
+        try:
+            rollback_snapshot(chroma_dir, metadata_path, args.rollback or None)
+        except ValueError as e:
+            raise SystemExit(f"[ERROR] {e}")
+        finally:
+            lock.release()
+    for s in list_snapshots(chroma_dir, metadata_path):
+        print(f"{'*' if s['current'] else ' '} {s['name']}  {s['files']} files")
@@ -1,15 +1,21 @@
 from pathlib import Path
+import os
 import json
 import hashlib
+import tempfile
 from enum import Enum
 
+# project libs
+from env_handler import Collection, env_flag, load_collections
+import telemetry
+
 class KBState(str, Enum):
     NO_DATA = "no_data"       # no PDFs at all
     EMPTY = "empty"           # PDFs exist, none processed
     UP_TO_DATE = "up_to_date" # all PDFs processed
-    OUTDATED = "outdated"     # some PDFs new/changed
+    OUTDATED = "outdated"     # some PDFs new/changed/deleted
 
-def compute_file_hash(path: Path, chunk_size: int = 8192) -> str:
+def compute_file_hash(path: Path, chunk_size: int = 1024 * 1024) -> str:
     """Return hex SHA256 hash of file contents."""
     h = hashlib.sha256()
     with path.open("rb") as f:
@@ -17,6 +23,11 @@ def compute_file_hash(path: Path, chunk_size: int = 8192) -> str:
             h.update(chunk)
     return h.hexdigest()
 
+def file_stat(path: Path) -> dict[str, int]:
+    """Return the cheap stat fingerprint {size, mtime_ns, inode} of a file."""
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
 def load_metadata(metadata_path: Path) -> dict[str, str]:
     """Return mapping {relative_filename: hash}."""
     if not metadata_path.exists():
@@ -29,16 +40,183 @@ def load_metadata(metadata_path: Path) -> dict[str, str]:
         # Corrupt/empty file → treat as no metadata
         return {}
 
-def save_metadata(metadata_path: Path, files_map: dict[str, str]) -> None:
+def built_collections(collections: list[Collection] | None = None) -> list[Collection]:
+    """Collections whose knowledge base has processed files."""
+    collections = load_collections() if collections is None else collections
+    return [c for c in collections if load_metadata(c.metadata_path)]
+
+def load_metadata_stats(metadata_path: Path) -> dict[str, dict[str, int]]:
+    """Return mapping {relative_filename: file_stat} stored next to the hashes."""
+    if not metadata_path.exists():
+        return {}
+    try:
+        with metadata_path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data.get("stats", {})
+    except Exception:
+        return {}
+
+def save_metadata(
+    metadata_path: Path,
+    files_map: dict[str, str],
+    stats_map: dict[str, dict[str, int]] | None = None,
+) -> None:
     metadata = {"files": files_map}
-    with metadata_path.open("w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2)
+    if stats_map is not None:
+        # only keep stats for files that are actually recorded
+        metadata["stats"] = {name: stats_map[name] for name in files_map if name in stats_map}
+    write_json_atomic(metadata_path, metadata, indent=2)
+
+def write_json_atomic(path: Path, data, indent: int | None = None) -> None:
+    """Write to a temp file, fsync and rename, so readers see the old or the new file, never half of one."""
+    # a name of its own: concurrent writers (e.g. a rollback and an ingest) never share a temp file
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=path.parent, prefix=path.name + ".", suffix=".tmp", delete=False
+    ) as f:
+        tmp_path = Path(f.name)
+        try:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+    os.replace(tmp_path, path)
+
+def forget_files(metadata_path: Path, names: list[str]) -> None:
+    """Remove files (e.g. deleted from datasets_dir) from the metadata."""
+    meta_map = load_metadata(metadata_path)
+    stats_map = load_metadata_stats(metadata_path)
+    for name in names:
+        meta_map.pop(name, None)
+        stats_map.pop(name, None)
+    save_metadata(metadata_path, meta_map, stats_map)
+
+
+# --------- fingerprint cache ---------
+
+def fingerprint_cache_path(metadata_path: Path) -> Path:
+    """Persistent {filename: {stat, hash}} cache lives next to the metadata file."""
+    return metadata_path.with_name(metadata_path.stem + ".fingerprints.json")
+
+def _load_fingerprints(cache_path: Path) -> dict[str, dict]:
+    if not cache_path.exists():
+        return {}
+    try:
+        with cache_path.open("r", encoding="utf-8") as f:
+            return json.load(f).get("files", {})
+    except Exception:
+        # Corrupt cache → it only costs a rehash
+        return {}
+
+def _save_fingerprints(cache_path: Path, fingerprints: dict[str, dict]) -> None:
+    # a concurrent rerun never reads half a cache
+    write_json_atomic(cache_path, {"files": fingerprints})
+
+def fingerprint_files(
+    pdf_paths: list[Path],
+    metadata_path: Path,
+    verify_hashes: bool = False,
+    prune: bool = False,
+) -> tuple[dict[str, str], dict[str, dict[str, int]]]:
+    """
+    Return ({filename: hash}, {filename: file_stat}) for the given PDFs.
+    A file is only re-hashed when its (size, mtime_ns, inode) differs from the
+    fingerprint cache or the metadata; verify_hashes=True re-hashes everything.
+    prune=True means pdf_paths is the whole folder, so other cache entries are dropped.
+    """
+    cache_path = fingerprint_cache_path(metadata_path)
+    cached = _load_fingerprints(cache_path)
+
+    # seed with what was recorded at the last ingest
+    known_hashes = load_metadata(metadata_path)
+    for name, stat in load_metadata_stats(metadata_path).items():
+        if name not in cached and name in known_hashes:
+            cached[name] = {"stat": stat, "hash": known_hashes[name]}
+
+    hashes: dict[str, str] = {}
+    stats: dict[str, dict[str, int]] = {}
+    fresh: dict[str, dict] = {} if prune else dict(cached)
+    dirty = False
+
+    for pdf in pdf_paths:
+        name = pdf.name
+        stat = file_stat(pdf)
+        entry = cached.get(name)
+        if verify_hashes or entry is None or entry.get("stat") != stat:
+            file_hash = compute_file_hash(pdf)
+            entry = {"stat": stat, "hash": file_hash}
+            dirty = True
+        hashes[name] = entry["hash"]
+        stats[name] = stat
+        fresh[name] = entry
+
+    # on prune, entries of files that disappeared from the folder are dropped
+    if dirty or set(fresh) != set(cached):
+        try:
+            _save_fingerprints(cache_path, fresh)
+        except OSError as e:
+            print(f"[WARN] Could not write fingerprint cache '{cache_path}': {e}")
+
+    return hashes, stats
+
+
+# --------- ingest checkpoint journal ---------
+
+def checkpoint_path(metadata_path: Path) -> Path:
+    """Append-only journal of files fully written by an ingest still in progress."""
+    return metadata_path.with_name(metadata_path.stem + ".checkpoint.jsonl")
+
+def ingest_lock_path(metadata_path: Path) -> Path:
+    """Lock file held by whichever process is currently writing the index."""
+    return metadata_path.with_name(metadata_path.stem + ".ingest.lock")
 
-def detect_kb_state(datasets_dir: Path, metadata_path: Path):
+def append_checkpoint(metadata_path: Path, name: str, file_hash: str, stat: dict[str, int]) -> None:
+    """Record that all chunks of `name` are in the vector store."""
+    with checkpoint_path(metadata_path).open("a", encoding="utf-8") as f:
+        f.write(json.dumps({"name": name, "hash": file_hash, "stat": stat}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def recover_checkpoint(metadata_path: Path) -> int:
+    """
+    Merge the journal of an interrupted ingest into the metadata file and drop it.
+    Returns the number of recovered files.
+    """
+    journal = checkpoint_path(metadata_path)
+    if not journal.exists():
+        return 0
+
+    meta_map = load_metadata(metadata_path)
+    stats_map = load_metadata_stats(metadata_path)
+    recovered = 0
+    with journal.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # torn last line of a crashed write
+                continue
+            meta_map[entry["name"]] = entry["hash"]
+            stats_map[entry["name"]] = entry["stat"]
+            recovered += 1
+
+    save_metadata(metadata_path, meta_map, stats_map)
+    journal.unlink()
+    return recovered
+
+
+def detect_kb_state(datasets_dir: Path, metadata_path: Path, verify_hashes: bool | None = None):
     """
     Inspect PDFs in datasets_dir and metadata file.
     Return (state, info_dict) where info_dict contains counts and file lists.
+    Set verify_hashes (or KB_VERIFY_HASHES=1) to re-hash every file instead of
+    trusting unchanged stat fingerprints.
     """
+    if verify_hashes is None:
+        verify_hashes = env_flag("KB_VERIFY_HASHES")
+
     # 1) Filesystem: find all PDFs
     pdf_paths = sorted(datasets_dir.glob("*.pdf"))
     total_pdfs = len(pdf_paths)
@@ -52,13 +230,14 @@ def detect_kb_state(datasets_dir: Path, metadata_path: Path):
             "processed": 0,
             "new_files": [],
             "changed_files": [],
+            "deleted_files": [],
         }
 
-    # Build current hashes
-    current_map: dict[str, str] = {}
-    for pdf in pdf_paths:
-        rel_name = pdf.name  # simple: just filename
-        current_map[rel_name] = compute_file_hash(pdf)
+    # Build current hashes (only files whose stat changed are read)
+    with telemetry.span("kb.fingerprint", files=total_pdfs, verify_hashes=verify_hashes):
+        current_map, _ = fingerprint_files(
+            pdf_paths, metadata_path, verify_hashes=verify_hashes, prune=True
+        )
 
     # Determine categories
     processed = []
@@ -74,13 +253,16 @@ def detect_kb_state(datasets_dir: Path, metadata_path: Path):
         else:
             processed.append(name)
 
+    # known to the index but gone from the folder
+    deleted_files = [name for name in meta_map if name not in current_map]
+
     if total_pdfs == 0:
         # Has metadata but no files → weird, treat as empty
         state = KBState.EMPTY
     elif not processed and (new_files or changed_files):
         # PDFs exist, none processed
         state = KBState.EMPTY
-    elif not (new_files or changed_files):
+    elif not (new_files or changed_files or deleted_files):
         state = KBState.UP_TO_DATE
     else:
         state = KBState.OUTDATED
@@ -91,6 +273,6 @@ def detect_kb_state(datasets_dir: Path, metadata_path: Path):
         "processed_files": processed,
         "new_files": new_files,
         "changed_files": changed_files,
+        "deleted_files": deleted_files,
     }
     return state, info
-
@@ -5,29 +5,28 @@ from urllib.parse import quote
 import streamlit as st
 
 # project libs
-from generate_answer import generate_answer_chain
-from preprocess import init_ingest, ingest_new_data, restore_from_cache
-
-def add_reference_links(answer: str) -> str:
-    """Convert italic references in the References section into Scholar links."""
-
-    # Split into main body and references section
-    marker = "**References:**"
-    if marker not in answer:
-        # No references section -> return unchanged
-        return answer
-
-    body, refs_block = answer.split(marker, maxsplit=1)
-
+from env_handler import Collection, load_collections, load_paths
+from state_machine import built_collections, load_metadata, ingest_lock_path
+from ingest_jobs import IngestBusyError, InterProcessLock
+from answer_cache import get_answer_cache, kb_version
+from doc_index import all_authors, build_search_filter, documents_path, list_documents, year_range
+from resources import get_vector_store_manager, get_ingest_jobs
+from snapshots import current_snapshot, index_dir, list_snapshots, rollback_snapshot
+import telemetry
+
+REFERENCES_MARKER = "**References:**"
+
+# Pattern: italic text with a year, but only within a single line
+_REFERENCE_PATTERN = re.compile(r"\*([^*\n]+?\d{4}[^*\n]*)\*")
+
+def _link_reference_lines(refs_block: str) -> str:
+    """Turn italic references (one per line) into Google Scholar links."""
     # Process references block line by line
-    lines = refs_block.splitlines()
+    lines = refs_block.split("\n")
     new_lines = []
 
-    # Pattern: italic text with a year, but only within a single line
-    pattern = re.compile(r"\*([^*\n]+?\d{4}[^*\n]*)\*")
-
     for line in lines:
-        match = pattern.search(line)
+        match = _REFERENCE_PATTERN.search(line)
         if not match:
             new_lines.append(line)
             continue
@@ -40,10 +39,53 @@ def add_reference_links(answer: str) -> str:
         new = f"*[{ref_text}]({url})*"
         new_lines.append(line.replace(old, new, 1))
 
-    refs_block_new = "\n".join(new_lines)
+    return "\n".join(new_lines)
+
+def add_reference_links(answer: str) -> str:
+    """Convert italic references in the References section into Scholar links."""
+
+    # Split into main body and references section
+    marker = REFERENCES_MARKER
+    if marker not in answer:
+        # No references section -> return unchanged
+        return answer
+
+    body, refs_block = answer.split(marker, maxsplit=1)
 
     # Reassemble full answer
-    return body + marker + refs_block_new
+    return body + marker + _link_reference_lines(refs_block)
+
+def stream_reference_links(tokens):
+    """
+    Streaming counterpart of add_reference_links: tokens pass straight through
+    until the References section starts, then whole lines are emitted with links.
+    """
+    marker = REFERENCES_MARKER
+    buffer = ""
+    in_refs = False
+
+    for token in tokens:
+        buffer += token
+        if not in_refs:
+            idx = buffer.find(marker)
+            if idx == -1:
+                # hold back just enough text to recognise a marker split across tokens
+                safe = len(buffer) - (len(marker) - 1)
+                if safe > 0:
+                    yield buffer[:safe]
+                    buffer = buffer[safe:]
+                continue
+            yield buffer[:idx + len(marker)]
+            buffer = buffer[idx + len(marker):]
+            in_refs = True
+
+        # a reference line is complete once its newline arrived
+        if "\n" in buffer:
+            done, buffer = buffer.rsplit("\n", 1)
+            yield _link_reference_lines(done + "\n")
+
+    if buffer:
+        yield _link_reference_lines(buffer) if in_refs else buffer
 
 def init_user_interface():
     # page config
@@ -67,7 +109,27 @@ Author: [Faniia Prazdnikova](https://www.linkedin.com/in/faniia-prazdnikova-607a
     )
     # subtitle / smaller text in UI
     st.title("🧬 Biology topic study assistant")
-    st.subheader("Gene expression activation via microRNA")
+    show_collection_selector()
+    st.subheader(selected_collection().topic)
+
+def selected_collection() -> Collection:
+    """Collection picked in the sidebar (the first one if there is only one)."""
+    collections = load_collections()
+    name = st.session_state.get("kb_collection")
+    return next((c for c in collections if c.name == name), collections[0])
+
+def show_collection_selector():
+    collections = load_collections()
+    if len(collections) < 2:
+        return
+    topics = {c.name: c.topic for c in collections}
+    st.sidebar.selectbox(
+        "Collection",
+        list(topics),
+        key="kb_collection",
+        format_func=lambda name: f"{name} — {topics[name]}",
+        help="Knowledge base shown in the Knowledge Base tab. Questions are routed to the relevant collections.",
+    )
 
 def kb_status_indicator(processed, total):
     if total <= 0:
@@ -86,7 +148,7 @@ def show_quick_start(datasets_dir):
 
     st.write(
         "Before you can ask biology questions, the assistant needs to read your PDF materials "
-        "about gene expression activation via microRNA."
+        f"about *{selected_collection().topic}*."
     )
 
     st.markdown("**Current dataset folder:**")
@@ -94,37 +156,194 @@ def show_quick_start(datasets_dir):
 
     st.write("Add one or more PDF files to this folder, then click the button below.")
 
-    if st.button("Scan and build knowledge base"):
-        with st.spinner("Initializing ingestion..."):
-            retriever = init_ingest()
-        st.success("Knowledge base built successfully! You can now ask questions in the Assistant tab.")
-        show_qa_tab(retriever)
+    job = get_ingest_jobs().current(_index_key())
+    running = job is not None and job.running
+    if st.button("Scan and build knowledge base", disabled=running):
+        start_ingest("build")
+
+    show_ingest_status()
+
+def _index_key() -> str:
+    return str(selected_collection().chroma_dir)
+
+def _run_ingest(kind: str, collection: str, progress):
+    # the ingest, PDF and vector store libraries load here, in the background job, not at app start
+    from preprocess import init_ingest, ingest_new_data
+    ingest_fn = init_ingest if kind == "build" else ingest_new_data
+    return ingest_fn(progress=progress, collection=collection)
+
+def start_ingest(kind: str):
+    """Run a "build" (init_ingest) or "update" (ingest_new_data) of the selected collection in the background; the index is published when done."""
+    collection = selected_collection().name
+    _, chroma_dir, metadata_path = load_paths(collection)
+    manager = get_vector_store_manager()
+    try:
+        job = get_ingest_jobs().start(
+            str(chroma_dir),
+            kind,
+            # builds a new snapshot; sessions keep answering from the published one
+            target=lambda progress: _run_ingest(kind, collection, progress),
+            lock_path=ingest_lock_path(metadata_path),
+            # every session gets the new index from now on
+            on_done=lambda retriever: manager.publish(chroma_dir, retriever),
+        )
+    except IngestBusyError as e:
+        st.warning(str(e))
+        return
+    st.session_state["ingest_job_watching"] = job.id
+
+def show_ingest_status():
+    """Live progress of the running ingest, or the outcome of the last one."""
+    job = get_ingest_jobs().current(_index_key())
+    if job is None:
+        return
+    if job.running or st.session_state.get("ingest_job_watching") == job.id:
+        show_ingest_progress()
+        return
+
+    p = job.progress
+    # outcome stays visible for a minute after the job ended
+    if p.finished_at and time.time() - p.finished_at < 60:
+        if p.error:
+            st.error(f"Knowledge base {p.kind} failed: {p.error}")
+        else:
+            st.success(
+                f"Knowledge base {p.kind} finished: {p.done_files} files, {p.chunks} chunks "
+                f"in {p.elapsed:.0f} s. You can now ask questions in the Assistant tab."
+            )
+
+@st.fragment(run_every=1.0)
+def show_ingest_progress():
+    job = get_ingest_jobs().current(_index_key())
+    if job is None:
+        return
+    p = job.progress
+
+    if not job.running:
+        # refresh the whole page once, so the new KB state and index are picked up
+        st.session_state.pop("ingest_job_watching", None)
+        st.rerun(scope="app")
+
+    eta = f"ETA {p.eta:.0f} s" if p.eta is not None else "ETA …"
+    st.progress(
+        p.fraction,
+        text=f"Knowledge base {p.kind}: {p.done_files}/{p.total_files or '?'} files · {eta}",
+    )
+    st.caption(
+        f"{p.files_per_second:.2f} files/s · {p.chunks} chunks · "
+        f"{p.elapsed:.0f} s elapsed" + (f" · last: {p.current_file}" if p.current_file else "")
+    )
 
 def show_qa_tab():
     st.caption("Assistant")
 
-    if st.session_state.get("kb_updating", False):
-        st.info("Knowledge base is being updated. Please wait until the update is finished.")
+    job = get_ingest_jobs().current(_index_key())
+    if job is not None and job.running:
+        # non-blocking: questions are answered from the index as published so far
+        st.info("Knowledge base is being updated in the background; answers use the current index.")
+
+    collections = built_collections()
+    if not collections:
+        st.info("Build the knowledge base in the Knowledge Base tab first.")
         return
 
-    retriever = st.session_state.get("retriever")
-    if retriever is None:
-        st.warning("Knowledge base is not ready yet. Go to the Knowledge Base tab to initialize it.")
+    search_filter = show_search_filters(collections)
+    if search_filter is not None and not search_filter.papers:
+        st.warning("No papers match the selected filters.")
         return
+    scope = search_filter.key if search_filter is not None else ""
 
     question = st.text_input("Ask a question:")
     if question:
         start = time.time()
-        with st.spinner("Generating response..."):
-            answer = generate_answer_chain(retriever, question)
-        elapsed = time.time() - start
+
+        # shared by all sessions; swapped by the manager after an ingest.
+        # Opened on the first question, so the page renders without loading Chroma or the models
+        engine = get_vector_store_manager().get_routed_engine(collections)
+
+        # answers are valid for exactly one version of the processed files
+        version = _kb_version(collections)
+        cache = get_answer_cache()
+        # every rerun (any widget change) repeats the lookup while the question stays in the input;
+        # only a new question (or index version / filter) counts towards the hit rate
+        lookup = (question, version, scope)
+        is_new = st.session_state.get("last_cache_lookup") != lookup
+        st.session_state["last_cache_lookup"] = lookup
+        cached = cache.get(question, version, embed=engine.embed_query, scope=scope, count=is_new)
+        if cached is not None:
+            elapsed = time.time() - start
+            st.subheader("Answer to your question:")
+            st.markdown(add_reference_links(cached.answer), unsafe_allow_html=True)
+            show_sources(cached.docs)
+            st.caption(f"⚡ Cached answer served in {elapsed * 1000:.0f} ms")
+            telemetry.record_span("ui.answer", elapsed, cached=True, filtered=search_filter is not None)
+            return
+
+        with st.spinner("Searching the knowledge base..."):
+            stream = engine.stream(question, search_filter)
 
         st.subheader("Answer to your question:")
 
-        answer = add_reference_links(answer)
-        st.markdown(answer, unsafe_allow_html=True)
+        # tokens are rendered as they arrive
+        st.write_stream(stream_reference_links(stream))
+        elapsed = time.time() - start
+        telemetry.record_span("ui.answer", elapsed, cached=False, filtered=search_filter is not None)
+
+        result = stream.result
+        cache.put(question, version, result, embed=engine.embed_query, scope=scope)
+        show_sources(result.docs)
 
-        st.caption(f"✅ Response generated in {elapsed:.2f} seconds")
+        t = result.timings
+        st.caption(
+            f"✅ First token after {t['ttft']:.2f} s · response generated in {elapsed:.2f} seconds "
+            f"(retrieval {t['retrieve']:.2f}s · LLM {t['llm']:.2f}s · overhead {t['overhead'] * 1000:.1f} ms)"
+        )
+
+def _kb_version(collections: list[Collection]) -> str:
+    if len(collections) == 1:
+        c = collections[0]
+        return kb_version(load_metadata(c.metadata_path), current_snapshot(c.metadata_path))
+    return kb_version({c.name: _kb_version([c]) for c in collections})
+
+def show_search_filters(collections):
+    """Year / author controls over the document tables; returns the SearchFilter (None = all papers)."""
+    rows = [
+        {**row, "collection": c.name}
+        for c in collections
+        for row in list_documents(index_dir(c.chroma_dir, c.metadata_path))
+    ]
+    if not rows:
+        return None
+
+    with st.expander("🔎 Filter papers"):
+        years = None
+        span = year_range(rows)
+        if span is not None and span[0] < span[1]:
+            picked = st.slider("Publication year", span[0], span[1], value=span, key="filter_years")
+            if tuple(picked) != span:
+                years = tuple(picked)
+        authors = st.multiselect("Authors", all_authors(rows), key="filter_authors")
+
+        search_filter = build_search_filter(rows, years, authors)
+        if search_filter is not None:
+            st.caption(f"{len(search_filter.papers)} of {len(rows)} papers match.")
+    return search_filter
+
+def show_sources(docs):
+    """List the chunks the answer was generated from."""
+    if not docs:
+        return
+    with st.expander(f"📄 Sources ({len(docs)} passages)"):
+        for i, d in enumerate(docs, start=1):
+            source = d.metadata.get("source", "unknown")
+            page = d.metadata.get("page")
+            where = f"{source}, p. {page + 1}" if isinstance(page, int) else source
+            if d.metadata.get("section") not in (None, "body"):
+                where += f" · {d.metadata['section']}"
+            if d.metadata.get("collection"):
+                where += f" · {d.metadata['collection']}"
+            st.markdown(f"**[{i}]** {where}")
+            st.caption(d.page_content[:300] + ("…" if len(d.page_content) > 300 else ""))
 
 def show_kb_tab(datasets_dir, kb_info):
     st.caption("Knowledge Base control")
@@ -133,13 +352,24 @@ def show_kb_tab(datasets_dir, kb_info):
     processed = kb_info["processed"]
     new_files = kb_info.get("new_files", [])
     changed_files = kb_info.get("changed_files", [])
+    deleted_files = kb_info.get("deleted_files", [])
 
     st.write(f"Dataset folder: `{datasets_dir}`")
     st.write(f"Total PDFs: {total}")
     st.write(f"Processed: {processed}")
 
+    show_answer_cache_stats()
+    show_diagnostics()
+    show_snapshots()
+
+    # --- KB built before the document table existed: one update fills it ---
+    _, chroma_dir, metadata_path = load_paths(selected_collection().name)
+    needs_bibliography = processed > 0 and not documents_path(index_dir(chroma_dir, metadata_path)).exists()
+    if needs_bibliography:
+        st.info("Paper filters (year, authors) need a one-time update of the knowledge base.")
+
     # --- Determine if KB needs update and store in session state ---
-    needs_update = bool(new_files or changed_files)
+    needs_update = bool(new_files or changed_files or deleted_files or needs_bibliography)
     st.session_state["kb_needs_update"] = needs_update
 
     # --- New files list (collapsible if more than 1, hidden if none) ---
@@ -160,36 +390,103 @@ def show_kb_tab(datasets_dir, kb_info):
             st.markdown("**🔁 Changed file:**")
             st.markdown(f"- {changed_files[0]}")
 
-    # --- Init session flags if missing ---
-    if "kb_updating" not in st.session_state:
-        st.session_state["kb_updating"] = False
-    if "retriever" not in st.session_state:
-        st.session_state["retriever"] = None
+    # --- Deleted files list (collapsible if more than 1, hidden if none) ---
+    if deleted_files:
+        if len(deleted_files) > 1:
+            with st.expander("🗑️ Removed files", expanded=True):
+                st.markdown("\n".join(f"- {name}" for name in deleted_files))
+        else:
+            st.markdown("**🗑️ Removed file:**")
+            st.markdown(f"- {deleted_files[0]}")
 
     # --- Update button (disabled if nothing to update) ---
     btn_label = "Update knowledge base"
     if needs_update:
-        btn_help = "Process new/changed PDFs and update the index."
+        btn_help = "Process new/changed PDFs, drop removed ones and update the index."
     else:
         btn_help = "Knowledge base is already up to date."
 
-    if st.button(btn_label, disabled=not needs_update, help=btn_help):
-        st.session_state["kb_updating"] = True
-        with st.spinner("Detecting and processing new items..."):
-            new_retriever = ingest_new_data()
-        st.session_state["retriever"] = new_retriever
-        st.session_state["kb_updating"] = False
-        st.success(
-            "Knowledge base updated successfully! "
-            "You can now ask questions in the Assistant tab."
+    job = get_ingest_jobs().current(_index_key())
+    running = job is not None and job.running
+    if running:
+        btn_help = "An update is already running."
+
+    if st.button(btn_label, disabled=running or not needs_update, help=btn_help):
+        if load_metadata(metadata_path):
+            start_ingest("update")
+        else:
+            # a collection that was never built (the others are)
+            start_ingest("build")
+
+    show_ingest_status()
+
+def show_answer_cache_stats():
+    stats = get_answer_cache().stats()
+    with st.expander("⚡ Answer cache"):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Hit rate", f"{stats['hit_rate']:.0%}")
+        col2.metric("Hits / misses", f"{stats['hits']} / {stats['misses']}")
+        col3.metric("Cached answers", stats["entries"])
+        if stats["semantic_hits"]:
+            st.caption(f"{stats['semantic_hits']} hits matched a similar (not identical) question.")
+
+def show_diagnostics():
+    """Rolling p50/p95 of the instrumented stages in this server process."""
+    with st.expander("🩺 Diagnostics"):
+        if not telemetry.enabled():
+            st.caption("Set TELEMETRY=1 to record timings of ingest, retrieval and generation.")
+            return
+        data = telemetry.summary()
+        if not data["spans"]:
+            st.caption("No measurements yet.")
+            return
+        st.dataframe(
+            [
+                {
+                    "stage": name,
+                    "count": s["count"],
+                    "p50 ms": round(s["p50"] * 1000, 1),
+                    "p95 ms": round(s["p95"] * 1000, 1),
+                    "last ms": round(s["last"] * 1000, 1),
+                }
+                for name, s in data["spans"].items()
+            ],
+            hide_index=True,
         )
-        st.rerun()
+        if data["counters"]:
+            st.caption(" · ".join(f"{name}: {value:,.0f}" for name, value in sorted(data["counters"].items())))
+
+def show_snapshots():
+    """Published index snapshots of the selected collection; rolling back re-points its live index to an older one."""
+    _, chroma_dir, metadata_path = load_paths(selected_collection().name)
+    snapshots = list_snapshots(chroma_dir, metadata_path)
+    if not snapshots:
+        return
+    with st.expander("🗂️ Index snapshots"):
+        st.dataframe(
+            [{"snapshot": s["name"], "files": s["files"], "live": "✅" if s["current"] else ""} for s in snapshots],
+            hide_index=True,
+        )
+        others = [s["name"] for s in snapshots if not s["current"]]
+        if not others:
+            st.caption("Older snapshots appear here after the next build or update.")
+            return
+        target = st.selectbox("Snapshot", others, key="rollback_snapshot")
+        if st.button("Roll back to this snapshot"):
+            # a rollback must not race an ingest that is about to publish
+            lock = InterProcessLock(ingest_lock_path(metadata_path))
+            if not lock.acquire():
+                st.warning("An ingest is running; roll back once it is done.")
+                return
+            try:
+                from preprocess import restore_from_cache
+                rollback_snapshot(chroma_dir, metadata_path, target)
+                get_vector_store_manager().publish(chroma_dir, restore_from_cache(chroma_dir, metadata_path))
+            finally:
+                lock.release()
+            st.rerun()
 
 def show_main_tabs(datasets_dir, kb_info):
-    # restore retriever from cache
-    if "retriever" not in st.session_state:
-        st.session_state["retriever"] = restore_from_cache()
-
     # define tabs
     global tab_qa, tab_kb
     tab_qa, tab_kb = st.tabs(["👩‍🔬 Assistant", "📚 Knowledge Base"])
@@ -0,0 +1,183 @@
+"""
+Lightweight tracing and metrics.
+
+    with telemetry.span("retrieval.dense", k=10) as sp:
+        docs = store.similarity_search(query, k=10)
+        sp.set(hits=len(docs))
+    telemetry.count("ingest.chunks", len(chunks))
+
+Spans and counters are appended as JSON lines to TELEMETRY_FILE (default
+KB_CACHE_DIR/telemetry.jsonl), with OpenTelemetry field names, so the file can
+be replayed into an OTLP collector. Rolling windows per name feed the p50/p95
+diagnostics in the app. With TELEMETRY off (the default) span() hands out a
+shared no-op object and nothing is timed, stored or written.
+"""
+
+# built-in libs
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+import json
+import os
+import statistics
+import threading
+import time
+
+# project libs
+from env_handler import env_flag, env_int, load_cache_dir
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "attrs")
+
+    def __init__(self, name: str, parent: "Span | None", attrs: dict):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start_ns = time.time_ns()
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+
+class Telemetry:
+    """Process-wide sink: JSONL file plus rolling per-name windows."""
+
+    def __init__(self, path: Path | None, window: int = 500):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._durations: dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._counters: dict[str, float] = defaultdict(float)
+
+    def _write(self, record: dict) -> None:
+        if self.path is None:
+            return
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = self.path.open("a", encoding="utf-8", buffering=1)
+            self._file.write(line)
+
+    def end_span(self, span: Span, status: str, end_ns: int | None = None) -> None:
+        end_ns = end_ns or time.time_ns()
+        with self._lock:
+            self._durations[span.name].append((end_ns - span.start_ns) / 1e9)
+        self._write({
+            "type": "span",
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_span_id": span.parent_id,
+            "start_time_unix_nano": span.start_ns,
+            "end_time_unix_nano": end_ns,
+            "status": status,
+            "attributes": span.attrs,
+        })
+
+    def add(self, name: str, value: float, attrs: dict) -> None:
+        with self._lock:
+            self._counters[name] += value
+        self._write({"type": "counter", "name": name, "value": value, "time_unix_nano": time.time_ns(), "attributes": attrs})
+
+    def summary(self) -> dict:
+        """{"spans": {name: {count, p50, p95, last}}, "counters": {name: total}} for this process."""
+        with self._lock:
+            windows = {name: list(d) for name, d in self._durations.items()}
+            counters = dict(self._counters)
+        spans = {}
+        for name, samples in sorted(windows.items()):
+            if len(samples) >= 2:
+                q = statistics.quantiles(samples, n=100, method="inclusive")
+                p50, p95 = q[49], q[94]
+            else:
+                p50 = p95 = samples[0]
+            spans[name] = {"count": len(samples), "p50": p50, "p95": p95, "last": samples[-1]}
+        return {"spans": spans, "counters": counters}
+
+
+_telemetry: Telemetry | None = None
+_configured = False
+_config_lock = threading.Lock()
+_current: ContextVar[Span | None] = ContextVar("telemetry_span", default=None)
+
+
+def configure(enabled: bool | None = None, path: Path | None = None) -> None:
+    """(Re)configure from TELEMETRY / TELEMETRY_FILE, or explicitly."""
+    global _telemetry, _configured
+    with _config_lock:
+        if enabled is None:
+            enabled = env_flag("TELEMETRY")
+        if not enabled:
+            _telemetry = None
+        else:
+            if path is None:
+                path = Path(os.getenv("TELEMETRY_FILE") or load_cache_dir() / "telemetry.jsonl")
+            _telemetry = Telemetry(path, window=env_int("TELEMETRY_WINDOW", 500))
+        _configured = True
+
+
+def _get() -> Telemetry | None:
+    if not _configured:
+        configure()
+    return _telemetry
+
+
+def enabled() -> bool:
+    return _get() is not None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block as a span; nested spans share the trace of the outer one."""
+    tel = _telemetry if _configured else _get()
+    if tel is None:
+        yield _NOOP
+        return
+    sp = Span(name, _current.get(), attrs)
+    token = _current.set(sp)
+    status = "OK"
+    try:
+        yield sp
+    except BaseException:
+        status = "ERROR"
+        raise
+    finally:
+        _current.reset(token)
+        tel.end_span(sp, status)
+
+
+def record_span(name: str, seconds: float, **attrs) -> None:
+    """Record a span measured elsewhere (e.g. work done in a pool worker) that just ended."""
+    tel = _telemetry if _configured else _get()
+    if tel is None:
+        return
+    sp = Span(name, _current.get(), attrs)
+    end_ns = time.time_ns()
+    sp.start_ns = end_ns - int(seconds * 1e9)
+    tel.end_span(sp, "OK", end_ns)
+
+
+def count(name: str, value: float = 1, **attrs) -> None:
+    tel = _telemetry if _configured else _get()
+    if tel is not None:
+        tel.add(name, value, attrs)
+
+
+def summary() -> dict:
+    tel = _get()
+    return tel.summary() if tel is not None else {"spans": {}, "counters": {}}
@@ -0,0 +1,6 @@
+# built-in libs
+from pathlib import Path
+import sys
+
+# the app modules are imported flat, as `streamlit run src/main.py` does
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
@@ -0,0 +1,37 @@
+# langchain libs
+from langchain_core.documents import Document
+
+# project libs
+from chunker import REFERENCES, SectionChunker
+
+
+BODY = "We measured binding in vivo and found strong effects on translation. " * 5
+
+
+def _pages(*texts):
+    return [Document(page_content=t, metadata={"source": "paper.pdf", "page": i}) for i, t in enumerate(texts)]
+
+
+def _sections(chunks):
+    return [(c.metadata["page"], c.metadata["section"]) for c in chunks]
+
+
+def test_inline_references_mention_keeps_the_body():
+    page = "Introduction\n\n" + BODY + "\n\nReferences: see supplementary text for the full protocol.\n\n" + BODY
+    chunks = SectionChunker(chunk_size=400).split_documents(_pages(page, BODY + "\n\n" + BODY))
+
+    assert {section for _, section in _sections(chunks)} == {"introduction"}
+    assert any(c.metadata["page"] == 1 for c in chunks)
+    assert any("References: see supplementary" in c.page_content for c in chunks)
+
+
+def test_reference_list_is_dropped_across_pages_it_continues_on():
+    first = "Discussion\n\n" + BODY + "\n\nReferences\n\n1. Smith JA, Jones B. A paper. Nature 2001.\n2. Lee K, Wu T. Another. Cell 2003.\n"
+    more = "3. Park S, Kim H. Third. Science 2005.\n4. Vasudevan S, Steitz JA. AU-rich elements. Cell 2007.\n"
+    after = "Body text that follows the reference list without a heading of its own. " * 4
+
+    kept = SectionChunker(chunk_size=400, drop_references=False).split_documents(_pages(first, more, after))
+    assert _sections(kept) == [(0, "discussion"), (0, REFERENCES), (1, REFERENCES), (2, "discussion")]
+
+    dropped = SectionChunker(chunk_size=400).split_documents(_pages(first, more, after))
+    assert _sections(dropped) == [(0, "discussion"), (2, "discussion")]
@@ -0,0 +1,27 @@
+# project libs
+from doc_index import build_search_filter
+
+
+ROWS = [
+    {"collection": "mirna", "source": "paper.pdf", "title": "", "authors": "Ann Lee", "year": 2019, "doi": None},
+    {"collection": "plants", "source": "paper.pdf", "title": "", "authors": "Bo Chen", "year": 2021, "doi": None},
+    {"collection": "plants", "source": "other.pdf", "title": "", "authors": "Ann Lee", "year": 2021, "doi": None},
+]
+
+
+def test_same_file_name_in_two_collections_is_two_papers():
+    search_filter = build_search_filter(ROWS, authors=["Ann Lee"])
+
+    assert search_filter.papers == {("mirna", "paper.pdf"), ("plants", "other.pdf")}
+    assert search_filter.sources("mirna") == {"paper.pdf"}
+    # Bo Chen's paper.pdf is not admitted just because it shares the name
+    assert search_filter.sources("plants") == {"other.pdf"}
+    assert search_filter.where("plants") == {"source": {"$in": ["other.pdf"]}}
+
+
+def test_year_filter_counts_papers_per_collection():
+    search_filter = build_search_filter(ROWS, years=(2020, 2022))
+
+    assert search_filter.papers == {("plants", "paper.pdf"), ("plants", "other.pdf")}
+    assert not search_filter.sources("mirna")
+    assert search_filter.where("plants") == {"$and": [{"year": {"$gte": 2020}}, {"year": {"$lte": 2022}}]}
@@ -0,0 +1,32 @@
+# built-in libs
+from pathlib import Path
+import threading
+import time
+
+# project libs
+import preprocess
+
+
+def hanging_parse(path, file_timeout, file_hash):
+    """Stands in for a parse stuck in C code: it never reaches the worker's own alarm."""
+    time.sleep(3600)
+
+
+def test_hanging_parse_of_a_single_file_is_killed_off_the_main_thread(tmp_path, monkeypatch):
+    # one changed file, ingested from a background thread as the app does
+    monkeypatch.setattr(preprocess, "_KILL_GRACE", 0.5)
+    pdf = tmp_path / "stuck.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+    results = []
+
+    def ingest():
+        results.extend(preprocess._iter_pdf_chunks([pdf], workers=1, file_timeout=1.0, parse=hanging_parse))
+
+    started = time.monotonic()
+    worker = threading.Thread(target=ingest)
+    worker.start()
+    worker.join(timeout=60)
+
+    assert not worker.is_alive()
+    assert results == [(pdf, None)]
+    assert time.monotonic() - started < 60
@@ -0,0 +1,41 @@
+# project libs
+from lexical_index import HybridRetriever
+from router import CollectionRouter
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [1.0, 0.0]
+
+
+class EmptyStore:
+    """Vector store without chunks; embeds queries it is given as text."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def similarity_search(self, query, k=4, filter=None):
+        self.embeddings.embed_query(query)
+        return []
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None):
+        return []
+
+
+def test_routed_collections_reuse_the_routing_embedding():
+    embeddings = CountingEmbeddings()
+    router = CollectionRouter(
+        retrievers={name: HybridRetriever(vectorstore=EmptyStore(embeddings)) for name in ("mirna", "plants")},
+        centroids={"mirna": [1.0, 0.0], "plants": [0.9, 0.1]},
+        topics={},
+        embeddings=embeddings,
+        margin=1.0,
+    )
+
+    router.invoke("FXR1 binding sites")
+
+    assert embeddings.calls == 1
@@ -0,0 +1,60 @@
+# built-in libs
+from pathlib import Path
+import json
+import os
+import subprocess
+import sys
+
+# project libs
+from ingest_jobs import InterProcessLock
+from snapshots import current_snapshot, snapshots_dir
+from state_machine import ingest_lock_path, write_json_atomic
+
+
+SNAPSHOTS_CLI = Path(__file__).resolve().parents[1] / "src" / "snapshots.py"
+
+
+def _published(chroma_dir: Path, name: str) -> None:
+    snapshot = snapshots_dir(chroma_dir) / name
+    snapshot.mkdir(parents=True)
+    (snapshot / "kb_metadata.json").write_text(json.dumps({"files": {"a.pdf": "h"}}), encoding="utf-8")
+
+
+def test_rollback_cli_waits_for_the_ingest_lock(tmp_path):
+    chroma_dir, metadata_path = tmp_path / "chroma", tmp_path / "kb_metadata.json"
+    _published(chroma_dir, "20240101-000000-000000")
+    _published(chroma_dir, "20240102-000000-000000")
+    write_json_atomic(metadata_path, {"files": {"a.pdf": "h"}, "snapshot": "20240102-000000-000000"})
+    env = dict(
+        os.environ,
+        DATASETS_DIR=str(tmp_path / "datasets"),
+        CHROMA_DB_DIR=str(chroma_dir),
+        KB_METADATA_PATH=str(metadata_path),
+        KB_COLLECTIONS_FILE=str(tmp_path / "collections.json"),
+    )
+
+    def rollback():
+        return subprocess.run([sys.executable, str(SNAPSHOTS_CLI), "--rollback"], env=env, capture_output=True, text=True)
+
+    # an ingest holds the lock: the live index stays as it is
+    lock = InterProcessLock(ingest_lock_path(metadata_path))
+    assert lock.acquire()
+    try:
+        busy = rollback()
+    finally:
+        lock.release()
+    assert busy.returncode != 0
+    assert "ingest is running" in busy.stderr
+    assert current_snapshot(metadata_path) == "20240102-000000-000000"
+
+    assert rollback().returncode == 0
+    assert current_snapshot(metadata_path) == "20240101-000000-000000"
+
+
+def test_write_json_atomic_leaves_no_temp_files(tmp_path):
+    path = tmp_path / "kb_metadata.json"
+    write_json_atomic(path, {"files": {}})
+    write_json_atomic(path, {"files": {"a.pdf": "h"}})
+
+    assert json.loads(path.read_text(encoding="utf-8")) == {"files": {"a.pdf": "h"}}
+    assert [p.name for p in tmp_path.iterdir()] == ["kb_metadata.json"]